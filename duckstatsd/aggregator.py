@@ -0,0 +1,135 @@
+import random
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .ddsketch import DDSketch
+from .storage import MINUTE_MS, QUANTILE_TYPES, MetricRow
+
+# Metric types whose individual values are sampled (and sketched) rather
+# than kept
+SAMPLED_TYPES = QUANTILE_TYPES
+
+
+class MetricsAggregator:
+    """
+    StatsD-style in-memory aggregation of metric rows.
+
+    Rows are folded into one aggregate per series and minute, with the
+    columns of the rollup tables (count, sums, min, max and last value).
+    Set members are kept as a set, and timer, histogram and distribution
+    values as a uniform sample of at most ``timer_samples`` values, plus a
+    quantile sketch of all of them.
+
+    drain() turns the aggregates into a few representative rows per series
+    (the scaled sum of a counter, the last value of a gauge, the sampled
+    timer values, the distinct set members), so storage grows with the
+    number of series rather than the number of events.
+    """
+
+    def __init__(self, timer_samples: int = 32, seed: Optional[int] = None):
+        self.timer_samples = timer_samples
+        # (metric_name, metric_type, tags, minute) -> rollup aggregate
+        self.aggregates: Dict[tuple, list] = {}
+        self.members: Dict[tuple, Set[str]] = {}
+        self.samples: Dict[tuple, List[float]] = {}
+        self.quantiles: Dict[tuple, DDSketch] = {}
+        self.events = 0
+        self.rng = random.Random(seed)
+
+    def __len__(self) -> int:
+        return len(self.aggregates)
+
+    def add(self, rows: Iterable[MetricRow]):
+        """Fold rows into the current aggregates."""
+        aggregates = self.aggregates
+        for name, metric_type, value, string_value, rate, tags, timestamp in rows:
+            self.events += 1
+            key = (name, metric_type, tags, timestamp - timestamp % MINUTE_MS)
+            aggregate = aggregates.get(key)
+            if value is None:
+                if aggregate is None:
+                    aggregates[key] = [1, None, None, None, None, None, None, timestamp]
+                    self.members[key] = set()
+                else:
+                    aggregate[0] += 1
+                    if timestamp >= aggregate[7]:
+                        aggregate[7] = timestamp
+                if string_value is not None:
+                    self.members[key].add(string_value)
+                continue
+
+            scaled = value / rate if rate else 0.0
+            if aggregate is None:
+                aggregates[key] = [
+                    1,
+                    value,
+                    scaled,
+                    value * value,
+                    value,
+                    value,
+                    value,
+                    timestamp,
+                ]
+                if metric_type in SAMPLED_TYPES:
+                    self.samples[key] = [value]
+                    sketch = self.quantiles[key] = DDSketch()
+                    sketch.add(value)
+                continue
+            aggregate[0] += 1
+            aggregate[1] += value
+            aggregate[2] += scaled
+            aggregate[3] += value * value
+            if value < aggregate[4]:
+                aggregate[4] = value
+            if value > aggregate[5]:
+                aggregate[5] = value
+            if timestamp >= aggregate[7]:
+                aggregate[6] = value
+                aggregate[7] = timestamp
+            if metric_type in SAMPLED_TYPES:
+                self._sample(self.samples[key], aggregate[0], value)
+                self.quantiles[key].add(value)
+
+    def _sample(self, sample: List[float], seen: int, value: float):
+        """Reservoir sampling: every value seen has the same chance to stay."""
+        if len(sample) < self.timer_samples:
+            sample.append(value)
+            return
+        slot = self.rng.randrange(seen)
+        if slot < self.timer_samples:
+            sample[slot] = value
+
+    def drain(self) -> Tuple[List[MetricRow], Dict[tuple, list], Dict[tuple, DDSketch]]:
+        """
+        Return and reset the representative rows, the aggregates and the
+        quantile sketches, as expected by
+        MetricsStorage.store_metrics(rows, aggregates, quantiles).
+
+        Representative rows are timestamped with the last event of their
+        series and minute, so they land in the same rollup bucket.
+        """
+        rows: List[MetricRow] = []
+        for key, aggregate in self.aggregates.items():
+            name, metric_type, tags, _ = key
+            timestamp = aggregate[7]
+            if aggregate[1] is None:
+                for member in sorted(self.members[key]) or [None]:
+                    rows.append((name, metric_type, None, member, 1.0, tags, timestamp))
+            elif metric_type in SAMPLED_TYPES:
+                for value in self.samples[key]:
+                    rows.append((name, metric_type, value, None, 1.0, tags, timestamp))
+            elif metric_type == "c":
+                rows.append(
+                    (name, metric_type, aggregate[2], None, 1.0, tags, timestamp)
+                )
+            else:
+                rows.append(
+                    (name, metric_type, aggregate[6], None, 1.0, tags, timestamp)
+                )
+
+        aggregates, quantiles = self.aggregates, self.quantiles
+        self.aggregates = {}
+        self.members = {}
+        self.samples = {}
+        self.quantiles = {}
+        self.events = 0
+        return rows, aggregates, quantiles
@@ -0,0 +1,197 @@
+import asyncio
+import threading
+from typing import List, Optional, Set
+
+from .server import DuckStatsDServer, KERNEL_DROPS_POLL_INTERVAL, LineFramer
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - optional dependency
+    uvloop = None
+
+
+class StatsDDatagramProtocol(asyncio.DatagramProtocol):
+    """Hands received datagrams to the server's parser."""
+
+    def __init__(self, server: "AsyncDuckStatsDServer"):
+        self.server = server
+
+    def datagram_received(self, data: bytes, addr):
+        self.server.submit(data, datagram=True)
+
+    def error_received(self, exc: Exception):
+        self.server.logger.error(f"Socket error: {exc}")
+
+
+class StatsDStreamProtocol(asyncio.Protocol):
+    """Frames a TCP connection into lines and hands them to the parser."""
+
+    def __init__(self, server: "AsyncDuckStatsDServer"):
+        self.server = server
+        self.framer = LineFramer()
+        self.transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections.add(self)
+        self.server.stats.incr("tcp_connections_accepted")
+        self.server.stats.incr("tcp_connections_open")
+
+    def data_received(self, data: bytes):
+        payload = self.framer.feed(data)
+        if payload:
+            self.server.submit(payload)
+
+    def eof_received(self):
+        payload = self.framer.close()
+        if payload:
+            self.server.submit(payload)
+        return False
+
+    def connection_lost(self, exc):
+        self.server.connections.discard(self)
+        self.server.stats.incr("tcp_connections_open", -1)
+        self.server.stats.incr("tcp_lines_dropped", self.framer.dropped_lines)
+
+
+class AsyncDuckStatsDServer(DuckStatsDServer):
+    """
+    DuckStatsDServer variant running on a single asyncio event loop.
+
+    The loop owns the listeners as well as the periodic jobs (flushing the
+    write queue, polling kernel drops), which run as tasks instead of
+    dedicated threads. uvloop is used when it is installed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._pending: List[bytes] = []
+        # Datagrams among the pending payloads, counted as packets
+        self._pending_datagrams = 0
+        self.connections: Set[StatsDStreamProtocol] = set()
+
+    def submit(self, payload: bytes, datagram: bool = False):
+        """
+        Queue a payload for parsing.
+
+        Payloads arriving in the same event loop iteration, from any
+        listener, are processed together, so a burst costs one timestamp, one
+        write queue put and one update of the received counters.
+        """
+        if not self._pending:
+            self.loop.call_soon(self._process_pending)
+        self._pending.append(payload)
+        if datagram:
+            self._pending_datagrams += 1
+
+    def _process_pending(self):
+        payloads, self._pending = self._pending, []
+        datagrams, self._pending_datagrams = self._pending_datagrams, 0
+        self.stats.incr("packets_received", datagrams)
+        self.stats.incr("bytes_received", sum(len(p) for p in payloads))
+        try:
+            self._process_datagrams(payloads)
+        except Exception as e:
+            self.logger.error(f"Error processing packet: {e}")
+
+    def start(self):
+        """Start the event loop in a background thread."""
+        if self.running:
+            self.logger.warning("Server is already running")
+            return
+
+        self.running = True
+        if self.retention:
+            self.retention.start()
+        if self.hot_tier_server:
+            self.hot_tier_server.start()
+        self.loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+        self._stopping = asyncio.Event()
+        self.thread = threading.Thread(target=self._run_server)
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info(
+            f"DuckStatsD server started on {self.host}:{self.port} "
+            f"(asyncio{', uvloop' if uvloop else ''})"
+        )
+
+    def stop(self):
+        """Ask the event loop to shut down, then stop like the threaded server."""
+        if self.running and self.loop and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        super().stop()
+
+    def _run_server(self):
+        """Run the event loop until stop() is called."""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            self.logger.error(f"Server error: {e}")
+        finally:
+            self.loop.close()
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        self.socket = self._create_udp_socket()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: StatsDDatagramProtocol(self), sock=self.socket
+        )
+        self.logger.info(f"Listening for StatsD packets on {self.host}:{self.port}")
+
+        unix_transport = None
+        if self.socket_path:
+            self.unix_socket = self._create_unix_socket()
+            unix_transport, _ = await loop.create_datagram_endpoint(
+                lambda: StatsDDatagramProtocol(self), sock=self.unix_socket
+            )
+            self.logger.info(f"Listening for StatsD packets on {self.socket_path}")
+
+        tcp_server = None
+        if self.tcp_port:
+            self.tcp_socket = self._create_tcp_socket()
+            tcp_server = await loop.create_server(
+                lambda: StatsDStreamProtocol(self), sock=self.tcp_socket
+            )
+            self.logger.info(
+                f"Listening for StatsD over TCP on {self.host}:{self.tcp_port}"
+            )
+
+        tasks = [
+            loop.create_task(self._flush_periodically()),
+            loop.create_task(self._poll_kernel_drops()),
+        ]
+        try:
+            await self._stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._update_kernel_drops()
+            transport.close()
+            if unix_transport:
+                unix_transport.close()
+                self._close_unix_socket()
+            if tcp_server:
+                tcp_server.close()
+                for connection in list(self.connections):
+                    connection.transport.close()
+            # Let the protocol process anything received in this iteration;
+            # a periodic flush may still be running in the executor, which
+            # the writer's flush lock makes this one wait for
+            await asyncio.sleep(0)
+            await loop.run_in_executor(None, self.writer.flush)
+
+    async def _flush_periodically(self):
+        """Write queued metrics every batch_wait seconds, off the loop thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.batch_wait)
+            await loop.run_in_executor(None, self.writer.flush)
+
+    async def _poll_kernel_drops(self):
+        while True:
+            self._update_kernel_drops()
+            await asyncio.sleep(KERNEL_DROPS_POLL_INTERVAL)
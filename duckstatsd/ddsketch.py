@@ -0,0 +1,242 @@
+import math
+import operator
+import struct
+from array import array
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# Every quantile is estimated within 1% of the true value
+RELATIVE_ACCURACY = 0.01
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+# Values closer to zero than _MIN_VALUE are counted as zero, and larger than
+# _MAX_VALUE as _MAX_VALUE, which bounds a sketch to about 2100 buckets
+_MIN_VALUE = 1e-6
+_MAX_VALUE = 1e12
+_MAX_INDEX = math.ceil(math.log(_MAX_VALUE) / _LOG_GAMMA)
+
+# Serialized form: the header (version, type of the counts, zero count, then
+# first bucket index and number of buckets of the positive and the negative
+# values), then the counts of the positive and the negative buckets, as
+# uint32 unless one of them needs a uint64
+_HEADER = struct.Struct("<BcQiIiI")
+_VERSION = 1
+
+
+def _value(index: int) -> float:
+    """Value standing for the bucket ``index``, within 1% of all it holds."""
+    return 2 * _GAMMA**index / (_GAMMA + 1)
+
+
+class _Store:
+    """Counts of consecutive buckets, from bucket index ``offset`` on."""
+
+    __slots__ = ("offset", "counts")
+
+    def __init__(self):
+        self.offset = 0
+        self.counts: List[int] = []
+
+    def add(self, index: int, count: int = 1):
+        counts = self.counts
+        if not counts:
+            self.offset = index
+            counts.append(count)
+            return
+        position = index - self.offset
+        if position < 0:
+            counts[0:0] = [0] * -position
+            self.offset = index
+            position = 0
+        elif position >= len(counts):
+            counts.extend([0] * (position - len(counts) + 1))
+        counts[position] += count
+
+    def merge(self, offset: int, counts: Sequence[int]):
+        """Add the counts of the buckets from ``offset`` on."""
+        if not counts:
+            return
+        if not self.counts:
+            self.offset = offset
+            self.counts = list(counts)
+            return
+        # Make room for the first and last bucket
+        self.add(offset, 0)
+        self.add(offset + len(counts) - 1, 0)
+        start = offset - self.offset
+        end = start + len(counts)
+        self.counts[start:end] = map(operator.add, self.counts[start:end], counts)
+
+    def buckets(self) -> List[Tuple[int, int]]:
+        """(index, count) of the non-empty buckets, by increasing index."""
+        offset = self.offset
+        return [
+            (offset + position, count)
+            for position, count in enumerate(self.counts)
+            if count
+        ]
+
+
+class DDSketch:
+    """
+    DDSketch quantile sketch of timer values.
+
+    Values are counted in logarithmically sized buckets, so any quantile is
+    estimated within RELATIVE_ACCURACY of its true value, and sketches merge
+    by adding the counts of their buckets: per-minute sketches combine into
+    the exact sketch of any time range and set of series.
+    """
+
+    __slots__ = ("positive", "negative", "zero_count")
+
+    def __init__(self):
+        # Buckets of the positive values and of the absolute value of the
+        # negative ones
+        self.positive = _Store()
+        self.negative = _Store()
+        self.zero_count = 0
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.positive.counts) + sum(self.negative.counts)
+
+    def add(self, value: float):
+        if value > _MIN_VALUE:
+            store = self.positive
+        elif value < -_MIN_VALUE:
+            store = self.negative
+            value = -value
+        else:
+            self.zero_count += 1
+            return
+        store.add(min(math.ceil(math.log(value) / _LOG_GAMMA), _MAX_INDEX))
+
+    def update(self, values: Iterable[float]):
+        for value in values:
+            self.add(value)
+
+    def merge(self, other: "DDSketch"):
+        """Merge ``other`` into this sketch."""
+        self.positive.merge(other.positive.offset, other.positive.counts)
+        self.negative.merge(other.negative.offset, other.negative.counts)
+        self.zero_count += other.zero_count
+
+    def merge_bytes(self, data: bytes):
+        """Merge a sketch serialized with to_bytes() into this one."""
+        (
+            _,
+            count_type,
+            zero_count,
+            positive_offset,
+            positives,
+            negative_offset,
+            negatives,
+        ) = _HEADER.unpack_from(data)
+        counts = array(count_type.decode(), data[_HEADER.size :])
+        self.positive.merge(positive_offset, counts[:positives])
+        self.negative.merge(negative_offset, counts[positives : positives + negatives])
+        self.zero_count += zero_count
+
+    def to_bytes(self) -> bytes:
+        positive, negative = self.positive, self.negative
+        try:
+            count_type = "I"
+            counts = array(count_type, positive.counts)
+            counts.extend(negative.counts)
+        except OverflowError:
+            count_type = "Q"
+            counts = array(count_type, positive.counts)
+            counts.extend(negative.counts)
+        header = _HEADER.pack(
+            _VERSION,
+            count_type.encode(),
+            self.zero_count,
+            positive.offset,
+            len(positive.counts),
+            negative.offset,
+            len(negative.counts),
+        )
+        return header + counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "DDSketch":
+        sketch = cls()
+        sketch.merge_bytes(data)
+        return sketch
+
+    def _buckets(self) -> List[Tuple[float, int]]:
+        """(value, count) of every non-empty bucket, by increasing value."""
+        buckets = [
+            (-_value(index), count)
+            for index, count in reversed(self.negative.buckets())
+        ]
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        buckets.extend(
+            (_value(index), count) for index, count in self.positive.buckets()
+        )
+        return buckets
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        """Estimated values at the quantiles ``qs`` (0 to 1), None if empty."""
+        buckets = self._buckets()
+        total = sum(count for _, count in buckets)
+        results = []
+        for q in qs:
+            if not total:
+                results.append(None)
+                continue
+            rank = q * (total - 1)
+            seen = 0
+            for value, count in buckets:
+                seen += count
+                if seen > rank:
+                    break
+            results.append(value)
+        return results
+
+    def quantile(self, q: float) -> Optional[float]:
+        return self.quantiles([q])[0]
+
+    def histogram(self, bins: int = 20) -> List[Tuple[float, float, int]]:
+        """
+        Counts in ``bins`` equal width bins spanning the values, as (start,
+        end, count).
+        """
+        buckets = self._buckets()
+        if not buckets:
+            return []
+        low, high = buckets[0][0], buckets[-1][0]
+        width = (high - low) / bins or 1.0
+        counts = [0] * bins
+        for value, count in buckets:
+            counts[min(int((value - low) / width), bins - 1)] += count
+        return [
+            (low + i * width, low + (i + 1) * width, count)
+            for i, count in enumerate(counts)
+        ]
+
+
+def ddsketch_union(first: Optional[bytes], second: Optional[bytes]) -> Optional[bytes]:
+    """SQL function merging two serialized sketches."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    sketch = DDSketch.from_bytes(first)
+    sketch.merge_bytes(second)
+    return sketch.to_bytes()
+
+
+class DDSketchMerge:
+    """SQL aggregate merging serialized sketches into one."""
+
+    def __init__(self):
+        self.sketch = DDSketch()
+
+    def step(self, data: Optional[bytes]):
+        if data is not None:
+            self.sketch.merge_bytes(data)
+
+    def finalize(self) -> bytes:
+        return self.sketch.to_bytes()
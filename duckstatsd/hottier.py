@@ -0,0 +1,362 @@
+import json
+import logging
+import threading
+import urllib.parse
+import urllib.request
+from array import array
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+
+from .stats import InternalStats
+from .storage import MINUTE_MS, MetricRow, now_ms
+
+# Idle series are dropped from the hot tier this often
+PRUNE_INTERVAL_MS = MINUTE_MS
+
+
+class SeriesRing:
+    """
+    Per-minute aggregates of one series over its last ``size`` minutes.
+
+    Each aggregate column (those of the rollup tables) is an array indexed by
+    minute modulo ``size``; ``minutes`` records which minute a slot holds, so
+    a slot is reset when its minute comes round again.
+    """
+
+    __slots__ = (
+        "size",
+        "minutes",
+        "counts",
+        "totals",
+        "scaled",
+        "squares",
+        "mins",
+        "maxs",
+        "lasts",
+        "last_timestamps",
+    )
+
+    def __init__(self, size: int):
+        self.size = size
+        self.minutes = array("q", [-1]) * size
+        self.counts = array("q", [0]) * size
+        self.totals = array("d", [0.0]) * size
+        self.scaled = array("d", [0.0]) * size
+        self.squares = array("d", [0.0]) * size
+        self.mins = array("d", [0.0]) * size
+        self.maxs = array("d", [0.0]) * size
+        self.lasts = array("d", [0.0]) * size
+        self.last_timestamps = array("q", [0]) * size
+
+    def add(self, value: Optional[float], rate: float, timestamp: int):
+        minute = timestamp // MINUTE_MS
+        slot = minute % self.size
+        held = self.minutes[slot]
+        if held != minute:
+            if held > minute:
+                # Older than the minutes kept
+                return
+            self.minutes[slot] = minute
+            self.counts[slot] = 0
+            self.totals[slot] = self.scaled[slot] = self.squares[slot] = 0.0
+            self.last_timestamps[slot] = -1
+        self.counts[slot] += 1
+        if value is not None:
+            if self.counts[slot] == 1:
+                self.mins[slot] = self.maxs[slot] = value
+            elif value < self.mins[slot]:
+                self.mins[slot] = value
+            elif value > self.maxs[slot]:
+                self.maxs[slot] = value
+            self.totals[slot] += value
+            self.scaled[slot] += value / rate if rate else 0.0
+            self.squares[slot] += value * value
+        if timestamp >= self.last_timestamps[slot]:
+            self.last_timestamps[slot] = timestamp
+            if value is not None:
+                self.lasts[slot] = value
+
+    def slot_aggregate(self, slot: int, has_values: bool) -> list:
+        """
+        Rollup columns (count, total, total_scaled, total_squares,
+        min_value, max_value, last_value, last_timestamp) of a slot.
+        """
+        if not has_values:
+            return [self.counts[slot], *[None] * 6, self.last_timestamps[slot]]
+        return [
+            self.counts[slot],
+            self.totals[slot],
+            self.scaled[slot],
+            self.squares[slot],
+            self.mins[slot],
+            self.maxs[slot],
+            self.lasts[slot],
+            self.last_timestamps[slot],
+        ]
+
+    def minute_aggregates(self, since_minute: int, has_values: bool):
+        """Yield (minute, rollup columns) for the minutes from ``since_minute`` on."""
+        for slot in range(self.size):
+            minute = self.minutes[slot]
+            if minute >= since_minute:
+                yield minute, self.slot_aggregate(slot, has_values)
+
+    def aggregate(self, since_minute: int, has_values: bool) -> Optional[list]:
+        """
+        Rollup columns merged over the minutes from ``since_minute`` on, or
+        None if there are none.
+        """
+        merged = None
+        for _, current in self.minute_aggregates(since_minute, has_values):
+            if merged is None:
+                merged = current
+                continue
+            merged[0] += current[0]
+            if has_values:
+                merged[1] += current[1]
+                merged[2] += current[2]
+                merged[3] += current[3]
+                merged[4] = min(merged[4], current[4])
+                merged[5] = max(merged[5], current[5])
+            if current[7] >= merged[7]:
+                merged[6] = current[6]
+                merged[7] = current[7]
+        return merged
+
+    def newest_minute(self) -> int:
+        return max(self.minutes)
+
+
+class HotTier:
+    """
+    In-memory copy of the last ``minutes`` minutes of metrics, kept by the
+    ingest process for the web UI.
+
+    Every series gets a SeriesRing of per-minute aggregates, and the last
+    ``recent_size`` rows are kept as received. At most ``max_series`` series
+    are tracked, which caps memory at roughly ``max_series * minutes * 72``
+    bytes; metrics of further series are not kept, and the tier then only
+    claims to be complete from after them.
+    """
+
+    def __init__(
+        self,
+        minutes: int = 60,
+        max_series: int = 10000,
+        recent_size: int = 1000,
+        stats: Optional[InternalStats] = None,
+    ):
+        self.minutes = minutes
+        self.max_series = max_series
+        self.series: Dict[tuple, SeriesRing] = {}
+        self.recent: deque = deque(maxlen=recent_size)
+        self.lock = threading.Lock()
+        # Everything received from this time on is in the tier
+        self.start = now_ms()
+        self.next_prune = self.start + PRUNE_INTERVAL_MS
+        self.stats = stats or InternalStats()
+        self.stats.add_source(lambda: {"hot_tier_series": len(self.series)})
+
+    def add(self, rows: Iterable[MetricRow]):
+        """Add received rows; called by the writer before storing them."""
+        rows = list(rows)
+        series = self.series
+        dropped = 0
+        with self.lock:
+            for name, metric_type, value, _, rate, tags, timestamp in rows:
+                key = (name, metric_type, tags)
+                ring = series.get(key)
+                if ring is None:
+                    if len(series) >= self.max_series:
+                        self.start = max(self.start, timestamp + 1)
+                        dropped += 1
+                        continue
+                    ring = series[key] = SeriesRing(self.minutes)
+                ring.add(value, rate, timestamp)
+            self.recent.extend(rows)
+
+            now = now_ms()
+            if now >= self.next_prune:
+                self._prune(now)
+                self.next_prune = now + PRUNE_INTERVAL_MS
+        if dropped:
+            self.stats.incr("hot_tier_drops", dropped)
+
+    def _prune(self, now: int):
+        """Drop the series without data in the minutes kept."""
+        oldest = now // MINUTE_MS - self.minutes + 1
+        idle = [
+            key for key, ring in self.series.items() if ring.newest_minute() < oldest
+        ]
+        for key in idle:
+            del self.series[key]
+
+    def complete_since(self, since: int) -> int:
+        """
+        First minute boundary at or after ``since`` from which the tier
+        holds every metric.
+        """
+        oldest = (now_ms() // MINUTE_MS - self.minutes + 1) * MINUTE_MS
+        start = max(since, self.start, oldest)
+        return -(-start // MINUTE_MS) * MINUTE_MS
+
+    def aggregates(
+        self,
+        since: int,
+        per_minute: bool = False,
+        metric_name: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Aggregates from the first complete minute at or after ``since``, as
+        ``{"since": that minute, "rows": [[metric_name, metric_type, tags,
+        bucket, *rollup columns], ...]}``: one row per series, or per series
+        and minute with ``per_minute``, optionally only for ``metric_name``.
+        """
+        with self.lock:
+            since = self.complete_since(since)
+            since_minute = since // MINUTE_MS
+            rows = []
+            for (name, metric_type, tags), ring in self.series.items():
+                if metric_name is not None and name != metric_name:
+                    continue
+                has_values = metric_type != "s"
+                if per_minute:
+                    for minute, aggregate in ring.minute_aggregates(
+                        since_minute, has_values
+                    ):
+                        bucket = minute * MINUTE_MS
+                        rows.append([name, metric_type, tags, bucket, *aggregate])
+                else:
+                    aggregate = ring.aggregate(since_minute, has_values)
+                    if aggregate is not None:
+                        rows.append([name, metric_type, tags, since, *aggregate])
+        return {"since": since, "rows": rows}
+
+    def recent_rows(self, limit: int) -> Optional[List[MetricRow]]:
+        """
+        The ``limit`` most recent rows, newest first, or None if fewer were
+        received since the tier started.
+        """
+        with self.lock:
+            if len(self.recent) < limit:
+                return None
+            return [self.recent[-i] for i in range(1, limit + 1)]
+
+
+class HotTierRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP access to a HotTier:
+
+    - ``GET /aggregates?since=MS[&per_minute=1][&metric_name=NAME]``
+    - ``GET /recent?limit=N``
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        hot_tier: HotTier = self.server.hot_tier
+        try:
+            if url.path == "/aggregates":
+                body = hot_tier.aggregates(
+                    int(query.get("since", 0)),
+                    per_minute=query.get("per_minute") == "1",
+                    metric_name=query.get("metric_name"),
+                )
+            elif url.path == "/recent":
+                body = {"rows": hot_tier.recent_rows(int(query.get("limit", 50)))}
+            else:
+                self.send_error(404)
+                return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Polled on every page load; not worth a log line each
+        pass
+
+
+class HotTierServer:
+    """Serves a HotTier on ``host:port`` from a background thread."""
+
+    def __init__(self, hot_tier: HotTier, host: str = "127.0.0.1", port: int = 8127):
+        self.hot_tier = hot_tier
+        self.host = host
+        self.port = port
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Start serving in a background thread."""
+        if self.thread and self.thread.is_alive():
+            return
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), HotTierRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.hot_tier = self.hot_tier
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="duckstatsd-hot-tier"
+        )
+        self.thread.daemon = True
+        self.thread.start()
+        self.logger.info(f"Hot tier available on http://{self.host}:{self.port}")
+
+    def stop(self):
+        """Stop serving."""
+        if not self.thread:
+            return
+
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join(timeout=5)
+        self.thread = None
+
+
+class HotTierClient:
+    """
+    Reads a HotTierServer from the web UI; every method returns None when
+    the ingest process cannot be reached, so callers fall back to SQLite.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+
+    def _get(self, path: str, **params) -> Optional[Dict[str, Any]]:
+        query = urllib.parse.urlencode(
+            {name: value for name, value in params.items() if value is not None}
+        )
+        try:
+            with urllib.request.urlopen(
+                f"{self.url}{path}?{query}", timeout=self.timeout
+            ) as response:
+                return json.load(response)
+        except (OSError, ValueError) as e:
+            self.logger.debug(f"Hot tier unavailable: {e}")
+            return None
+
+    def aggregates(
+        self, since: int, per_minute: bool = False, metric_name: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """See HotTier.aggregates()."""
+        return self._get(
+            "/aggregates",
+            since=since,
+            per_minute=1 if per_minute else None,
+            metric_name=metric_name,
+        )
+
+    def recent_rows(self, limit: int) -> Optional[List[list]]:
+        """See HotTier.recent_rows()."""
+        body = self._get("/recent", limit=limit)
+        return body and body["rows"]
@@ -3,7 +3,18 @@ import signal
 import sys
 import time
 
+from .aioserver import AsyncDuckStatsDServer
+from .retention import parse_duration
 from .server import DuckStatsDServer
+from .storage import PARTITION_PERIODS, SYNCHRONOUS_MODES, TEMP_STORE_MODES
+from .workers import MultiProcessServer
+
+ENGINES = {"thread": DuckStatsDServer, "asyncio": AsyncDuckStatsDServer}
+
+
+def flush_interval(value: str) -> float:
+    """Duration argument where a bare number is in seconds."""
+    return parse_duration(value, default_unit="s")
 
 
 def main():
@@ -16,9 +27,142 @@ def main():
     parser.add_argument(
         "--port", type=int, default=8125, help="Port to bind to (default: 8125)"
     )
+    parser.add_argument(
+        "--tcp-port",
+        type=int,
+        default=None,
+        help="Also accept newline-separated StatsD over TCP on this port",
+    )
+    parser.add_argument(
+        "--socket",
+        default=None,
+        metavar="PATH",
+        help="Also listen on a Unix datagram socket at PATH "
+        "(e.g. /var/run/datadog/dsd.socket)",
+    )
     parser.add_argument(
         "--db", default="metrics.db", help="SQLite database file (default: metrics.db)"
     )
+    parser.add_argument(
+        "--retention",
+        type=parse_duration,
+        default=None,
+        metavar="DURATION",
+        help="Delete metrics older than DURATION, e.g. 30m, 48h or 7d "
+        "(default: keep everything)",
+    )
+    parser.add_argument(
+        "--partition",
+        choices=sorted(PARTITION_PERIODS),
+        default=None,
+        help="Store points in one database file per hour or day next to --db, "
+        "so retention deletes whole files (default: a single file)",
+    )
+    parser.add_argument(
+        "--set-members",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Store only the first N distinct members of each set per minute; "
+        "unique counts come from HyperLogLog sketches either way "
+        "(default: store every set event)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=sorted(ENGINES),
+        default="thread",
+        help="Receive loop implementation: a blocking socket loop in a thread, "
+        "or an asyncio event loop, using uvloop if installed (default: thread)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of receiving processes sharing the port via SO_REUSEPORT; "
+        "metrics are still written by a single process (default: 1)",
+    )
+    parser.add_argument(
+        "--recv-buffer",
+        type=int,
+        default=8 * 1024 * 1024,
+        help="UDP socket receive buffer size in bytes, capped by the kernel's "
+        "net.core.rmem_max (default: 8388608)",
+    )
+    parser.add_argument(
+        "--parse-cache-size",
+        type=int,
+        default=10000,
+        help="Distinct metric name/type/rate/tags combinations whose parsed "
+        "form is cached, 0 to disable (default: 10000)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=5000,
+        help="Max metrics written per SQLite transaction (default: 5000)",
+    )
+    parser.add_argument(
+        "--batch-wait-ms",
+        type=int,
+        default=50,
+        help="Max time a received metric waits before being written (default: 50)",
+    )
+    parser.add_argument(
+        "--flush-interval",
+        type=flush_interval,
+        default=None,
+        metavar="DURATION",
+        help="Aggregate metrics in memory and store one row per series every "
+        "DURATION (e.g. 10s), like StatsD; counters are summed, gauges keep "
+        "their last value, timers a sample of values (default: store every "
+        "metric)",
+    )
+    parser.add_argument(
+        "--hot-tier-port",
+        type=int,
+        default=None,
+        help="Keep the most recent metrics in memory and serve them to the web "
+        "UI (duckstatsd-web --hot-tier) on this port of localhost",
+    )
+    parser.add_argument(
+        "--hot-tier-minutes",
+        type=int,
+        default=60,
+        help="Minutes of metrics kept in memory (default: 60)",
+    )
+    parser.add_argument(
+        "--hot-tier-max-series",
+        type=int,
+        default=10000,
+        help="Maximum number of series kept in memory, about "
+        "72 bytes per series and minute (default: 10000)",
+    )
+    parser.add_argument(
+        "--sqlite-synchronous",
+        default="NORMAL",
+        choices=SYNCHRONOUS_MODES,
+        type=str.upper,
+        help="SQLite synchronous pragma (default: NORMAL)",
+    )
+    parser.add_argument(
+        "--sqlite-cache-size",
+        type=int,
+        default=-64000,
+        help="SQLite cache_size pragma, negative values are KiB (default: -64000)",
+    )
+    parser.add_argument(
+        "--sqlite-mmap-size",
+        type=int,
+        default=256 * 1024 * 1024,
+        help="SQLite mmap_size pragma in bytes (default: 268435456)",
+    )
+    parser.add_argument(
+        "--sqlite-temp-store",
+        default="MEMORY",
+        choices=TEMP_STORE_MODES,
+        type=str.upper,
+        help="SQLite temp_store pragma (default: MEMORY)",
+    )
     parser.add_argument(
         "--verbose", "-v", action="store_true", help="Enable verbose logging"
     )
@@ -26,7 +170,38 @@ def main():
     args = parser.parse_args()
 
     # Create and start server
-    server = DuckStatsDServer(host=args.host, port=args.port, db_path=args.db)
+    server_options = dict(
+        host=args.host,
+        port=args.port,
+        db_path=args.db,
+        batch_size=args.batch_size,
+        batch_wait=args.batch_wait_ms / 1000,
+        recv_buffer_size=args.recv_buffer,
+        tcp_port=args.tcp_port,
+        socket_path=args.socket,
+        parse_cache_size=args.parse_cache_size,
+        retention=args.retention,
+        aggregate_interval=args.flush_interval,
+        hot_tier_port=args.hot_tier_port,
+        hot_tier_options={
+            "minutes": args.hot_tier_minutes,
+            "max_series": args.hot_tier_max_series,
+        },
+        storage_options={
+            "synchronous": args.sqlite_synchronous,
+            "cache_size": args.sqlite_cache_size,
+            "mmap_size": args.sqlite_mmap_size,
+            "temp_store": args.sqlite_temp_store,
+            "partition": args.partition,
+            "set_members": args.set_members,
+        },
+    )
+    if args.workers > 1:
+        server = MultiProcessServer(
+            args.workers, server_class=ENGINES[args.engine], **server_options
+        )
+    else:
+        server = ENGINES[args.engine](**server_options)
 
     # Handle Ctrl+C gracefully
     def signal_handler(sig, frame):
@@ -40,7 +215,21 @@ def main():
     try:
         server.start()
         print(f"DuckStatsD running on {args.host}:{args.port}")
+        if args.tcp_port:
+            print(f"TCP listener: {args.host}:{args.tcp_port}")
+        if args.socket:
+            print(f"Unix socket: {args.socket}")
         print(f"Database: {args.db}")
+        if args.retention:
+            print(f"Retention: {args.retention:g}s")
+        if args.hot_tier_port:
+            print(f"Hot tier: http://127.0.0.1:{args.hot_tier_port}")
+        if args.flush_interval:
+            print(f"Flush interval: {args.flush_interval:g}s")
+        if args.partition:
+            print(f"Partitions: one file per {args.partition}")
+        if args.set_members is not None:
+            print(f"Set members: at most {args.set_members} per set and minute")
         print("Press Ctrl+C to stop")
 
         # Keep main thread alive
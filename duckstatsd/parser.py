@@ -1,9 +1,157 @@
-from typing import Dict, Optional, Tuple, Any
+import sys
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Any, Union
+
+from .storage import GAUGE_DELTA, canonical_tags_json
+
+# Metric types decoded once, so every parsed line shares the same str objects
+_METRIC_TYPES = {t.encode(): t for t in ("c", "g", "ms", "s", "h", "d")}
+
+# A gauge value with an explicit sign is a change, not a new value
+_DELTA_SIGNS = (b"+", b"-")
+
+
+# Result of StatsDParser.parse_line_bytes, a plain tuple to keep the hot path
+# allocation-free beyond the tuple itself:
+# (metric_name, metric_type, value, string_value, sample_rate, tags)
+# ``tags`` is the raw DogStatsD tag string (``env:dev,status:200``), left
+# unparsed; use StatsDParser.tags_to_json() when the serialized form is needed.
+ParsedMetric = Tuple[str, str, Optional[float], Optional[str], float, Optional[str]]
+
+# Compact codes for the type column of MetricColumns
+TYPE_CODES = {"c": 1, "g": 2, "ms": 3, "s": 4, "h": 5, "d": 6, GAUGE_DELTA: 7}
+METRIC_TYPES_BY_CODE = {code: t for t, code in TYPE_CODES.items()}
+
+
+def _column(index: int, doc: str) -> property:
+    return property(lambda self: self._build()[index], doc=doc)
+
+
+class MetricColumns:
+    """
+    Metrics parsed by StatsDParser.parse_many.
+
+    ``metrics`` holds the parsed metrics, in input order, and
+    ``error_lines`` the (row, line) of every non-blank line that could not
+    be parsed. They are also available as parallel columns, built on first
+    access, with a row per non-blank line: ``errors[i]`` is 1 when row ``i``
+    failed, in which case ``names[i]`` holds the offending line and the
+    other columns hold placeholders. Set members go in ``string_values``
+    (their ``values`` entry is NaN) and ``tags`` holds the serialized JSON
+    tags, as stored in series.
+    """
+
+    __slots__ = ("metrics", "error_lines", "_columns")
+
+    def __init__(self):
+        self.metrics: List[ParsedMetric] = []
+        self.error_lines: List[Tuple[int, bytes]] = []
+        self._columns: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self.metrics) + len(self.error_lines)
+
+    @property
+    def error_count(self) -> int:
+        return len(self.error_lines)
+
+    names = _column(0, "Metric names, or the offending line of failed rows")
+    type_codes = _column(1, "TYPE_CODES of the metric types, 0 for failed rows")
+    values = _column(2, "Values, NaN for sets and failed rows")
+    string_values = _column(3, "Set members, None for other types")
+    sample_rates = _column(4, "Sample rates")
+    tags = _column(5, "Serialized JSON tags, None if untagged")
+    errors = _column(6, "1 for the rows that failed to parse, 0 otherwise")
+
+    def _build(self) -> tuple:
+        if self._columns is not None:
+            return self._columns
+        nan = float("nan")
+        names, types, values, string_values, rates, tags = (
+            [list(column) for column in zip(*self.metrics)]
+            if self.metrics
+            else [[] for _ in range(6)]
+        )
+        type_codes = array("b", [TYPE_CODES[t] for t in types])
+        values = array("d", [nan if value is None else value for value in values])
+        sample_rates = array("d", rates)
+        errors = array("b", bytes(len(names)))
+        # In row order, so every row before each one is already in place
+        for row, line in self.error_lines:
+            names.insert(row, line.decode("utf-8", errors="replace"))
+            type_codes.insert(row, 0)
+            values.insert(row, nan)
+            string_values.insert(row, None)
+            sample_rates.insert(row, 1.0)
+            tags.insert(row, None)
+            errors.insert(row, 1)
+        self._columns = (
+            names,
+            type_codes,
+            values,
+            string_values,
+            sample_rates,
+            tags,
+            errors,
+        )
+        return self._columns
+
+    def rows(self, timestamp: int) -> List[tuple]:
+        """
+        The parsed metrics as MetricRow tuples at ``timestamp``.
+
+        Gauge deltas keep the GAUGE_DELTA type: pass the rows through
+        MetricsStorage.resolve_gauge_deltas() (MetricsWriter does) before
+        storing them.
+        """
+        return [(*metric, timestamp) for metric in self.metrics]
+
+
+class LineCache:
+    """
+    Bounded LRU mapping of the value-less part of a StatsD line (metric name
+    plus everything after the value) to its already parsed fields:
+    (interned metric_name, metric_type, sample_rate, serialized tags).
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "parse_cache_hits": self.hits,
+            "parse_cache_misses": self.misses,
+            "parse_cache_evictions": self.evictions,
+            "parse_cache_size": len(self.entries),
+        }
 
 
 class StatsDParser:
     """Parser for StatsD UDP packets in the format: metric:value|type|@rate|#tags"""
 
+    def __init__(self, cache_size: int = 10000):
+        self.cache = LineCache(cache_size) if cache_size > 0 else None
+
     @staticmethod
     def parse_packet(packet: str) -> Optional[Dict[str, Any]]:
         """
@@ -49,6 +197,8 @@ class StatsDParser:
                 result["value"] = float(value_str)
             except ValueError:
                 return None
+            if metric_type == "g" and value_str[:1] in ("+", "-"):
+                result["metric_type"] = GAUGE_DELTA
 
         # Parse optional components (sample rate and tags)
         for part in parts[2:]:
@@ -64,6 +214,161 @@ class StatsDParser:
 
         return result
 
+    @staticmethod
+    def parse_line_bytes(line: bytes) -> Optional[ParsedMetric]:
+        """
+        Parse a single StatsD line straight from the received bytes.
+
+        Same format as parse_packet, but only the name, set member and tag
+        fields are decoded (numbers are parsed from bytes directly), tags
+        are returned as their raw string and the result is a tuple.
+
+        Returns:
+            ParsedMetric tuple or None if invalid
+        """
+        parts = line.strip().split(b"|")
+        if len(parts) < 2:
+            return None
+
+        name, sep, raw_value = parts[0].rpartition(b":")
+        if not sep:
+            return None
+
+        metric_type = _METRIC_TYPES.get(parts[1])
+        if metric_type is None:
+            metric_type = parts[1].decode("utf-8", errors="ignore")
+
+        if metric_type == "s":  # set
+            value = None
+            string_value = raw_value.decode("utf-8", errors="ignore")
+        else:
+            string_value = None
+            try:
+                value = float(raw_value)
+            except ValueError:
+                return None
+            if metric_type == "g" and raw_value[:1] in _DELTA_SIGNS:
+                metric_type = GAUGE_DELTA
+
+        sample_rate = 1.0
+        tags = None
+        for part in parts[2:]:
+            prefix = part[:1]
+            if prefix == b"#":
+                tags = part[1:].decode("utf-8", errors="ignore") or None
+            elif prefix == b"@":
+                try:
+                    sample_rate = float(part[1:])
+                except ValueError:
+                    continue
+
+        return (
+            name.decode("utf-8", errors="ignore"),
+            metric_type,
+            value,
+            string_value,
+            sample_rate,
+            tags,
+        )
+
+    def parse_many(self, payloads: Union[bytes, Iterable[bytes]]) -> MetricColumns:
+        """
+        Parse a datagram, or a batch of datagrams, into MetricColumns.
+
+        Blank lines are skipped; lines that fail to parse (including unknown
+        metric types) are recorded as errors.
+        """
+        if isinstance(payloads, (bytes, bytearray)):
+            payloads = [payloads]
+
+        columns = MetricColumns()
+        metrics = columns.metrics
+        error_lines = columns.error_lines
+        parse_line = self.parse_line_cached
+        known_types = TYPE_CODES
+
+        for payload in payloads:
+            for line in payload.split(b"\n"):
+                try:
+                    parsed = parse_line(line)
+                except Exception:
+                    parsed = None
+                if parsed is not None and parsed[1] in known_types:
+                    metrics.append(parsed)
+                elif line.strip():
+                    error_lines.append((len(metrics) + len(error_lines), line))
+
+        return columns
+
+    def parse_line_cached(self, line: bytes) -> Optional[ParsedMetric]:
+        """
+        Like parse_line_bytes, but returns tags already serialized to JSON
+        (as stored in series) and memoizes everything but the value.
+
+        Traffic mostly repeats the same ``name|type|@rate|#tags`` with a
+        different value, so on a cache hit only the value is parsed.
+        """
+        if self.cache is None:
+            parsed = self.parse_line_bytes(line)
+            if parsed is None:
+                return None
+            *fields, tags = parsed
+            return (*fields, self.tags_to_json(tags))
+
+        line = line.strip()
+        bar = line.find(b"|")
+        if bar < 0:
+            return None
+        name, sep, raw_value = line[:bar].rpartition(b":")
+        if not sep:
+            return None
+
+        key = (name, line[bar:])
+        entry = self.cache.get(key)
+        if entry is None:
+            parsed = self.parse_line_bytes(line)
+            if parsed is None:
+                return None
+            metric_name, metric_type, value, string_value, sample_rate, tags = parsed
+            metric_name = sys.intern(metric_name)
+            tags_json = self.tags_to_json(tags)
+            # Whether a gauge is a delta depends on the value, not cached
+            cached_type = "g" if metric_type == GAUGE_DELTA else metric_type
+            self.cache.put(key, (metric_name, cached_type, sample_rate, tags_json))
+            return (
+                metric_name,
+                metric_type,
+                value,
+                string_value,
+                sample_rate,
+                tags_json,
+            )
+
+        metric_name, metric_type, sample_rate, tags_json = entry
+        if metric_type == "s":  # set
+            return (
+                metric_name,
+                metric_type,
+                None,
+                raw_value.decode("utf-8", errors="ignore"),
+                sample_rate,
+                tags_json,
+            )
+        try:
+            value = float(raw_value)
+        except ValueError:
+            return None
+        if metric_type == "g" and raw_value[:1] in _DELTA_SIGNS:
+            metric_type = GAUGE_DELTA
+        return (metric_name, metric_type, value, None, sample_rate, tags_json)
+
+    @staticmethod
+    def tags_to_json(tags_str: Optional[str]) -> Optional[str]:
+        """Serialize a raw tag string the way tags are stored in series."""
+        return canonical_tags_json(
+            StatsDParser._parse_tags(tags_str) if tags_str else None
+        )
+
     @staticmethod
     def _parse_tags(tags_str: str) -> Dict[str, str]:
         """Parse tag string into a dictionary."""
@@ -0,0 +1,162 @@
+import logging
+import re
+import threading
+import time
+from typing import Optional
+
+from .stats import InternalStats
+from .storage import MetricsStorage, now_ms
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value: str, default_unit: str = "h") -> float:
+    """
+    Parse a duration like ``90s``, ``30m``, ``48h``, ``7d`` or ``2w`` into
+    seconds; a bare number is taken in ``default_unit`` (hours).
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhdw]?)\s*", value.lower())
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    amount, unit = match.groups()
+    seconds = float(amount) * DURATION_UNITS[unit or default_unit]
+    if seconds <= 0:
+        raise ValueError(f"Invalid duration: {value}")
+    return seconds
+
+
+class RetentionJob:
+    """
+    Background thread deleting metrics older than ``retention`` seconds.
+
+    Every ``interval`` seconds, expired points are deleted oldest first in
+    transactions of at most ``chunk_size`` rows, pausing between them, so the
+    writer never waits long for the database. Expired rollup buckets and
+    series left without data follow, and freed pages are returned to the
+    file system ``vacuum_pages`` at a time. With partitioned storage, whole
+    expired partition files are dropped first, which leaves little for the
+    chunked deletes to do.
+    """
+
+    def __init__(
+        self,
+        storage: MetricsStorage,
+        retention: float,
+        interval: float = 60.0,
+        chunk_size: int = 5000,
+        chunk_pause: float = 0.01,
+        vacuum_pages: int = 1000,
+        stats: Optional[InternalStats] = None,
+    ):
+        self.storage = storage
+        self.retention = retention
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.chunk_pause = chunk_pause
+        self.vacuum_pages = vacuum_pages
+        self.stats = stats or InternalStats()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Start the retention thread."""
+        if self.thread and self.thread.is_alive():
+            return
+
+        if self.storage.auto_vacuum_mode() != 2:
+            self.logger.info(
+                "Database was created without auto_vacuum=INCREMENTAL: expired "
+                "metrics are deleted but the file only shrinks after a VACUUM"
+            )
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="duckstatsd-retention")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Stop the retention thread, interrupting a run in progress."""
+        if not self.thread:
+            return
+
+        self.stop_event.set()
+        self.thread.join(timeout=10)
+        self.thread = None
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"Error enforcing retention: {e}")
+            self.stop_event.wait(self.interval)
+
+    def _pause(self) -> bool:
+        """Yield the database to the writer; False once stop() was called."""
+        return not self.stop_event.wait(self.chunk_pause)
+
+    def run_once(self):
+        """Delete everything that expired, in chunks."""
+        start = time.perf_counter()
+        cutoff = now_ms() - int(self.retention * 1000)
+        try:
+            partitions = (
+                self.storage.drop_partitions_before(cutoff)
+                if self.storage.partition
+                else 0
+            )
+            rows = self._delete_points(cutoff)
+            rollups = self._delete_rollups(cutoff)
+            # After stop(), the earlier phases may have been cut short
+            series = (
+                self.storage.delete_unused_series(cutoff)
+                if not self.stop_event.is_set()
+                else 0
+            )
+            pages = self._vacuum()
+        finally:
+            self.stats.incr("retention_seconds", round(time.perf_counter() - start, 3))
+            self.stats.incr("retention_runs")
+
+        self.stats.incr("retention_partitions_dropped", partitions)
+        self.stats.incr("retention_rows_deleted", rows)
+        self.stats.incr("retention_rollups_deleted", rollups)
+        self.stats.incr("retention_series_deleted", series)
+        self.stats.incr("retention_pages_freed", pages)
+        if partitions or rows or series:
+            self.logger.info(
+                f"Retention dropped {partitions} partitions, deleted {rows} "
+                f"points, {rollups} rollups and {series} series, "
+                f"freed {pages} pages"
+            )
+
+    def _delete_points(self, cutoff: int) -> int:
+        deleted = 0
+        while True:
+            count = self.storage.delete_points_before(cutoff, self.chunk_size)
+            deleted += count
+            if count < self.chunk_size or not self._pause():
+                return deleted
+
+    def _delete_rollups(self, cutoff: int) -> int:
+        with self.storage.lock:
+            series_ids = sorted(self.storage.series_ids.values())
+        # Deleting a series' buckets is a primary key range, much cheaper
+        # than a point, so series are handled in larger groups
+        group = max(1, self.chunk_size // 50)
+        deleted = 0
+        for offset in range(0, len(series_ids), group):
+            deleted += self.storage.delete_rollups_before(
+                cutoff, series_ids[offset : offset + group]
+            )
+            if not self._pause():
+                break
+        return deleted
+
+    def _vacuum(self) -> int:
+        freed = 0
+        while True:
+            count = self.storage.incremental_vacuum(self.vacuum_pages)
+            freed += count
+            if count < self.vacuum_pages or not self._pause():
+                return freed
@@ -1,22 +1,196 @@
+import os
+import selectors
 import socket
+import stat
 import threading
+import time
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
-from .storage import MetricsStorage
+from .storage import MetricsStorage, now_ms
 from .parser import StatsDParser
+from .hottier import HotTier, HotTierServer
+from .retention import RetentionJob
+from .stats import InternalStats
+from .writer import MetricsWriter
+
+# Largest payload a UDP datagram can carry
+MAX_DATAGRAM_SIZE = 65535
+
+# Max datagrams drained from a socket before handing the batch to the parser
+MAX_DATAGRAMS_PER_BURST = 1024
+
+# How often the kernel drop counter is polled, in seconds
+KERNEL_DROPS_POLL_INTERVAL = 5.0
+
+# Bytes read from a TCP connection per recv() call
+TCP_READ_SIZE = 65536
+
+# Longest unterminated line kept for a TCP connection before it is discarded
+MAX_TCP_LINE_LENGTH = 65536
+
+# Marker for the TCP listening socket in the selector
+_TCP_LISTENER = "tcp-listener"
+
+
+def read_kernel_drops(sock: socket.socket) -> Optional[int]:
+    """
+    Return how many datagrams the kernel dropped for ``sock`` because its
+    receive buffer was full, as reported by /proc/net/udp (Linux only).
+
+    Returns None when the counter is not available.
+    """
+    try:
+        inode = str(os.fstat(sock.fileno()).st_ino)
+    except OSError:
+        return None
+
+    for path in ("/proc/net/udp", "/proc/net/udp6"):
+        try:
+            with open(path) as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            # sl local rem st tx:rx tr:tm retrnsmt uid timeout inode ref ptr drops
+            fields = line.split()
+            if len(fields) >= 13 and fields[9] == inode:
+                return int(fields[12])
+    return None
+
+
+class LineFramer:
+    """
+    Incremental newline framing for stream (TCP) connections.
+
+    Each received chunk is split at its last newline: everything before it is
+    returned as a complete payload, the remainder is kept until a later chunk
+    completes it. Chunks without a newline are only collected, and joined
+    once, when the line finally ends. A line growing past
+    ``max_line_length`` is dropped, up to and including its newline.
+    """
+
+    def __init__(self, max_line_length: int = MAX_TCP_LINE_LENGTH):
+        self.max_line_length = max_line_length
+        self.parts: List[bytes] = []
+        self.size = 0
+        self.dropped_lines = 0
+        # Whether the rest of a dropped line is still to be skipped
+        self.discarding = False
+
+    def feed(self, chunk: bytes):
+        """Add a chunk, returning the complete lines it finished (or None)."""
+        if self.discarding:
+            start = chunk.find(b"\n")
+            if start < 0:
+                return None
+            self.discarding = False
+            chunk = chunk[start + 1 :]
+
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            self.parts.append(chunk)
+            self.size += len(chunk)
+            if self.size > self.max_line_length:
+                # Drop the runaway line rather than buffering without bound
+                self.parts, self.size = [], 0
+                self.dropped_lines += 1
+                self.discarding = True
+            return None
+
+        if self.parts:
+            self.parts.append(chunk[:end])
+            payload = b"".join(self.parts)
+        elif end == len(chunk) - 1:
+            # The usual case: whole lines, passed on without a copy
+            payload = chunk
+        else:
+            payload = chunk[:end]
+
+        rest = chunk[end + 1 :]
+        self.parts = [rest] if rest else []
+        self.size = len(rest)
+        return payload
+
+    def close(self):
+        """Return a trailing line left without a newline when the peer closes."""
+        payload = b"".join(self.parts) if self.parts else None
+        self.parts, self.size = [], 0
+        return payload
 
 
 class DuckStatsDServer:
     """UDP server that receives StatsD metrics and stores them in SQLite."""
 
     def __init__(
-        self, host: str = "localhost", port: int = 8125, db_path: str = "metrics.db"
+        self,
+        host: str = "localhost",
+        port: int = 8125,
+        db_path: str = "metrics.db",
+        batch_size: int = 5000,
+        batch_wait: float = 0.05,
+        storage_options: Optional[Dict[str, Any]] = None,
+        recv_buffer_size: int = 8 * 1024 * 1024,
+        reuse_port: bool = False,
+        tcp_port: Optional[int] = None,
+        socket_path: Optional[str] = None,
+        parse_cache_size: int = 10000,
+        retention: Optional[float] = None,
+        aggregate_interval: Optional[float] = None,
+        hot_tier_port: Optional[int] = None,
+        hot_tier_options: Optional[Dict[str, Any]] = None,
+        writer: Optional[Any] = None,
+        stats: Optional[InternalStats] = None,
     ):
+        """
+        ``writer`` replaces the local MetricsStorage/MetricsWriter pair with
+        any object offering start(), stop() and put_many(rows); worker
+        processes use it to ship rows to the single writer in the parent.
+
+        ``retention`` (in seconds) enables deleting older metrics; it only
+        applies to the local storage, as does ``aggregate_interval`` (in
+        seconds), which stores per-series aggregates once per interval
+        instead of every event, and ``hot_tier_port``, which keeps the last
+        minutes of metrics in memory (a HotTier built with
+        ``hot_tier_options``) and serves them to the web UI on that port of
+        localhost.
+        """
         self.host = host
         self.port = port
-        self.storage = MetricsStorage(db_path)
-        self.parser = StatsDParser()
+        self.batch_wait = batch_wait
+        self.recv_buffer_size = recv_buffer_size
+        self.reuse_port = reuse_port
+        self.tcp_port = tcp_port
+        self.tcp_socket: Optional[socket.socket] = None
+        # Accept the DogStatsD-style unix:///path form as well as a bare path
+        if socket_path and socket_path.startswith("unix://"):
+            socket_path = socket_path[len("unix://") :]
+        self.socket_path = socket_path
+        self.unix_socket: Optional[socket.socket] = None
+        self.stats = stats or InternalStats()
+        self.storage: Optional[MetricsStorage] = None
+        self.hot_tier_server: Optional[HotTierServer] = None
+        if writer is None:
+            self.storage = MetricsStorage(db_path, **(storage_options or {}))
+            hot_tier = None
+            if hot_tier_port:
+                hot_tier = HotTier(stats=self.stats, **(hot_tier_options or {}))
+                self.hot_tier_server = HotTierServer(hot_tier, port=hot_tier_port)
+            writer = MetricsWriter(
+                self.storage,
+                batch_size=batch_size,
+                flush_interval=batch_wait,
+                aggregate_interval=aggregate_interval,
+                hot_tier=hot_tier,
+                stats=self.stats,
+            )
+        self.writer = writer
+        self.retention: Optional[RetentionJob] = None
+        if self.storage and retention:
+            self.retention = RetentionJob(self.storage, retention, stats=self.stats)
+        self.parser = StatsDParser(cache_size=parse_cache_size)
+        if self.parser.cache:
+            self.stats.add_source(self.parser.cache.stats)
         self.socket: Optional[socket.socket] = None
         self.running = False
         self.thread: Optional[threading.Thread] = None
@@ -34,6 +208,11 @@ class DuckStatsDServer:
             return
 
         self.running = True
+        self.writer.start()
+        if self.retention:
+            self.retention.start()
+        if self.hot_tier_server:
+            self.hot_tier_server.start()
         self.thread = threading.Thread(target=self._run_server)
         self.thread.daemon = True
         self.thread.start()
@@ -45,30 +224,132 @@ class DuckStatsDServer:
             return
 
         self.running = False
-        if self.socket:
-            self.socket.close()
         if self.thread:
             self.thread.join(timeout=5)
+
+        if self.retention:
+            self.retention.stop()
+        if self.hot_tier_server:
+            self.hot_tier_server.stop()
+        # Flush whatever the receive loop already queued
+        self.writer.stop()
+        if self.storage:
+            self.storage.close()
+        self.logger.info(f"Internal stats: {self.stats.format()}")
         self.logger.info("DuckStatsD server stopped")
 
-    def _run_server(self):
-        """Main server loop."""
+    def _create_udp_socket(self) -> socket.socket:
+        """Create the non-blocking UDP socket, with an enlarged receive buffer."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            # Every worker binds the same port; the kernel spreads datagrams
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        self._set_recv_buffer(sock)
+        sock.bind((self.host, self.port))
+        sock.setblocking(False)
+        return sock
+
+    def _create_tcp_socket(self) -> socket.socket:
+        """Create the non-blocking TCP listening socket."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.tcp_port))
+        sock.listen(socket.SOMAXCONN)
+        sock.setblocking(False)
+        return sock
+
+    def _create_unix_socket(self) -> socket.socket:
+        """Create the non-blocking Unix datagram socket at socket_path."""
+        # A socket left behind by a previous run would make bind() fail;
+        # anything else at that path is not ours to delete
         try:
-            # Create UDP socket
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.socket.bind((self.host, self.port))
+            mode = os.stat(self.socket_path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(
+                    f"{self.socket_path} already exists and is not a socket"
+                )
+            os.unlink(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._set_recv_buffer(sock)
+        sock.bind(self.socket_path)
+        sock.setblocking(False)
+        return sock
 
+    def _close_unix_socket(self):
+        """Close the Unix socket and remove its file."""
+        if not self.unix_socket:
+            return
+        self.unix_socket.close()
+        self.unix_socket = None
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def _set_recv_buffer(self, sock: socket.socket):
+        """Ask for recv_buffer_size bytes of kernel buffer, logging what we got."""
+        if not self.recv_buffer_size:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer_size)
+        except OSError as e:
+            self.logger.warning(f"Could not set receive buffer size: {e}")
+        actual = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        # Linux reports twice the granted size (it adds bookkeeping overhead),
+        # so only a value below the request means we were capped
+        if actual < self.recv_buffer_size:
+            self.logger.warning(
+                f"Receive buffer is {actual} bytes, less than the requested "
+                f"{self.recv_buffer_size} (check net.core.rmem_max)"
+            )
+
+    def _run_server(self):
+        """Main server loop, multiplexing every listener with a selector."""
+        selector = selectors.DefaultSelector()
+        try:
+            self.socket = self._create_udp_socket()
+            selector.register(self.socket, selectors.EVENT_READ)
             self.logger.info(f"Listening for StatsD packets on {self.host}:{self.port}")
 
+            if self.socket_path:
+                self.unix_socket = self._create_unix_socket()
+                selector.register(self.unix_socket, selectors.EVENT_READ)
+                self.logger.info(f"Listening for StatsD packets on {self.socket_path}")
+
+            if self.tcp_port:
+                self.tcp_socket = self._create_tcp_socket()
+                selector.register(self.tcp_socket, selectors.EVENT_READ, _TCP_LISTENER)
+                self.logger.info(
+                    f"Listening for StatsD over TCP on {self.host}:{self.tcp_port}"
+                )
+
+            buffer = bytearray(MAX_DATAGRAM_SIZE)
+            next_drops_poll = 0.0
+
             while self.running:
                 try:
-                    # Receive UDP packet (max 1024 bytes should be enough for StatsD)
-                    data, addr = self.socket.recvfrom(1024)
-                    packet = data.decode("utf-8", errors="ignore")
+                    payloads: list = []
+                    # Wake up periodically so stop() is noticed promptly
+                    for key, _ in selector.select(timeout=0.5):
+                        if key.data is None:
+                            payloads.extend(self._drain_datagrams(key.fileobj, buffer))
+                        elif key.data is _TCP_LISTENER:
+                            self._accept_tcp(selector)
+                        else:
+                            self._read_tcp(selector, key, payloads)
+
+                    if payloads:
+                        self._process_datagrams(payloads)
 
-                    # Parse and store the metric
-                    self._process_packet(packet)
+                    if time.monotonic() >= next_drops_poll:
+                        next_drops_poll = time.monotonic() + KERNEL_DROPS_POLL_INTERVAL
+                        self._update_kernel_drops()
 
                 except socket.error as e:
                     if self.running:
@@ -79,32 +360,106 @@ class DuckStatsDServer:
         except Exception as e:
             self.logger.error(f"Server error: {e}")
         finally:
+            for key in list(selector.get_map().values()):
+                if key.fileobj not in (self.socket, self.tcp_socket, self.unix_socket):
+                    key.fileobj.close()
+                    self.stats.incr("tcp_connections_open", -1)
+            selector.close()
+            self._close_unix_socket()
+            if self.tcp_socket:
+                self.tcp_socket.close()
             if self.socket:
+                self._update_kernel_drops()
                 self.socket.close()
 
+    def _accept_tcp(self, selector: selectors.BaseSelector):
+        """Accept every pending TCP connection."""
+        while True:
+            try:
+                conn, _ = self.tcp_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.setblocking(False)
+            selector.register(conn, selectors.EVENT_READ, LineFramer())
+            self.stats.incr("tcp_connections_accepted")
+            self.stats.incr("tcp_connections_open")
+
+    def _read_tcp(self, selector: selectors.BaseSelector, key, payloads: list):
+        """Read a chunk from a TCP connection, collecting completed lines."""
+        conn, framer = key.fileobj, key.data
+        try:
+            chunk = conn.recv(TCP_READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            chunk = b""
+
+        if chunk:
+            self.stats.incr("bytes_received", len(chunk))
+            payload = framer.feed(chunk)
+        else:
+            # Peer closed: flush the unterminated last line, if any
+            payload = framer.close()
+            selector.unregister(conn)
+            conn.close()
+            self.stats.incr("tcp_connections_open", -1)
+            self.stats.incr("tcp_lines_dropped", framer.dropped_lines)
+
+        if payload:
+            payloads.append(payload)
+
+    def _drain_datagrams(self, sock: socket.socket, buffer: bytearray) -> List[bytes]:
+        """
+        Read every datagram already queued on ``sock`` (up to a burst limit)
+        into ``buffer``, returning copies of their payloads.
+        """
+        view = memoryview(buffer)
+        datagrams = []
+        try:
+            while len(datagrams) < MAX_DATAGRAMS_PER_BURST:
+                nbytes, _ = sock.recvfrom_into(buffer)
+                datagrams.append(bytes(view[:nbytes]))
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        self.stats.incr("packets_received", len(datagrams))
+        self.stats.incr("bytes_received", sum(len(d) for d in datagrams))
+        return datagrams
+
+    def _update_kernel_drops(self):
+        """Record the kernel drop counter, warning when it has grown."""
+        if not self.socket:
+            return
+        drops = read_kernel_drops(self.socket)
+        if drops is None:
+            return
+        previous = self.stats.get("kernel_drops")
+        if drops > previous:
+            self.logger.warning(
+                f"Kernel dropped {drops - previous} packets, "
+                "consider increasing --recv-buffer"
+            )
+        self.stats.set("kernel_drops", drops)
+
+    def _process_datagrams(self, datagrams: List[bytes]):
+        """
+        Parse a batch of received payloads and queue them in one go.
+
+        Payloads are datagrams or runs of complete TCP lines.
+        """
+        timestamp = now_ms()
+        parsed = self.parser.parse_many(datagrams)
+        if parsed.error_lines:
+            self.stats.incr("parse_errors", parsed.error_count)
+            for _, line in parsed.error_lines:
+                self.logger.warning(f"Failed to parse packet: {line!r}")
+        self._enqueue(parsed.rows(timestamp))
+
     def _process_packet(self, packet: str):
-        """Process a single StatsD packet."""
-        # Handle multiple metrics in one packet (separated by newlines)
-        for line in packet.strip().split("\n"):
-            line = line.strip()
-            if not line:
-                continue
+        """Process a single StatsD packet, queueing its metrics for storage."""
+        self._process_datagrams([packet.encode("utf-8")])
 
-            try:
-                parsed = self.parser.parse_packet(line)
-                if parsed:
-                    self.storage.store_metric(
-                        metric_name=parsed["metric_name"],
-                        metric_type=parsed["metric_type"],
-                        value=parsed["value"],
-                        string_value=parsed["string_value"],
-                        sample_rate=parsed["sample_rate"],
-                        tags=parsed["tags"],
-                    )
-                    self.logger.debug(
-                        f"Stored metric: {parsed['metric_name']} ({parsed['metric_type']})"
-                    )
-                else:
-                    self.logger.warning(f"Failed to parse packet: {line}")
-            except Exception as e:
-                self.logger.error(f"Error processing metric '{line}': {e}")
+    def _enqueue(self, rows: list):
+        self.stats.incr("metrics_received", len(rows))
+        self.writer.put_many(rows)
+        self.logger.debug(f"Queued {len(rows)} metrics")
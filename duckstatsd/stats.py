@@ -0,0 +1,45 @@
+import threading
+from typing import Callable, Dict, List, Union
+
+Number = Union[int, float]
+
+
+class InternalStats:
+    """Thread-safe counters describing DuckStatsD's own behaviour."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[str, Number] = {}
+        self._sources: List[Callable[[], Dict[str, Number]]] = []
+
+    def add_source(self, source: Callable[[], Dict[str, Number]]):
+        """
+        Register a callable whose values are merged into every snapshot, for
+        components that keep their own counters on a hot path.
+        """
+        self._sources.append(source)
+
+    def incr(self, name: str, amount: Number = 1):
+        """Add ``amount`` to the counter ``name``."""
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def set(self, name: str, value: Number):
+        """Set ``name`` to an absolute value."""
+        with self._lock:
+            self._values[name] = value
+
+    def get(self, name: str, default: Number = 0) -> Number:
+        with self._lock:
+            return self._values.get(name, default)
+
+    def snapshot(self) -> Dict[str, Number]:
+        """Return a copy of all current values, sorted by name."""
+        with self._lock:
+            values = dict(self._values)
+        for source in self._sources:
+            values.update(source())
+        return dict(sorted(values.items()))
+
+    def format(self) -> str:
+        return ", ".join(f"{name}={value}" for name, value in self.snapshot().items())
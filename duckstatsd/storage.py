@@ -1,45 +1,837 @@
 import sqlite3
 import json
-from datetime import datetime
-from typing import Optional, Dict, Any
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
+
+from .ddsketch import DDSketch, ddsketch_union
+from .hyperloglog import HyperLogLog, hll_union
+
+# One received metric, as queued for storage:
+# (metric_name, metric_type, value, string_value, sample_rate, tags, timestamp)
+# where ``tags`` is the canonical JSON from canonical_tags_json() and
+# ``timestamp`` is in milliseconds since the epoch, as returned by now_ms()
+MetricRow = Tuple[str, str, Optional[float], Optional[str], float, Optional[str], int]
+
+# The coarse clock is only as precise as the kernel tick (a few ms), which is
+# plenty for metrics and much cheaper to read than the regular one
+_CLOCK = getattr(time, "CLOCK_REALTIME_COARSE", time.CLOCK_REALTIME)
+
+# Converts the TEXT timestamps of older databases to milliseconds
+TEXT_TIMESTAMP_TO_MS = (
+    "CAST(ROUND((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)"
+)
+
+
+def now_ms() -> int:
+    """Current UTC time in milliseconds since the epoch."""
+    return time.clock_gettime_ns(_CLOCK) // 1_000_000
+
+
+def format_timestamp_ms(timestamp: int) -> str:
+    """Format a stored timestamp as ``YYYY-MM-DD HH:MM:SS.mmm`` (UTC)."""
+    seconds, millis = divmod(timestamp, 1000)
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds)) + f".{millis:03d}"
+
+
+def canonical_tags_json(tags: Optional[Dict[str, str]]) -> Optional[str]:
+    """
+    Serialize a tag set canonically (sorted keys), so the same tags sent in a
+    different order map to the same series.
+    """
+    return json.dumps(tags, sort_keys=True) if tags else None
+
+
+# Metric type of gauge rows holding a +N/-N change rather than a new value;
+# MetricsStorage.resolve_gauge_deltas() turns them into plain gauge rows
+GAUGE_DELTA = "g+"
+
+INSERT_POINT_SQL = """
+    INSERT INTO {schema}.points (series_id, value, string_value, sample_rate, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+POINTS_COLUMNS = "id, series_id, value, string_value, sample_rate, timestamp"
+
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+
+# Rollup tables, coarsest first, as (bucket size in ms, table name). They hold
+# per series and per bucket aggregates, maintained as points are stored.
+ROLLUPS = ((HOUR_MS, "rollup_1h"), (MINUTE_MS, "rollup_1m"))
+
+ROLLUP_COLUMNS = (
+    "series_id, bucket, count, total, total_scaled, total_squares, "
+    "min_value, max_value, last_value, last_timestamp"
+)
+
+# Merges a batch's aggregates into the stored ones. last_value follows the
+# latest point, and the later row wins ties (as with the points' ids).
+UPSERT_ROLLUP_SQL = f"""
+    INSERT INTO {{table}} ({ROLLUP_COLUMNS})
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (series_id, bucket) DO UPDATE SET
+        count = count + excluded.count,
+        total = total + excluded.total,
+        total_scaled = total_scaled + excluded.total_scaled,
+        total_squares = total_squares + excluded.total_squares,
+        min_value = MIN(min_value, excluded.min_value),
+        max_value = MAX(max_value, excluded.max_value),
+        last_value = CASE WHEN excluded.last_timestamp >= last_timestamp
+                          THEN excluded.last_value ELSE last_value END,
+        last_timestamp = MAX(last_timestamp, excluded.last_timestamp)
+"""
+
+# Set cardinality sketches, coarsest first like ROLLUPS: per series and per
+# bucket HyperLogLog registers of the set members, as HyperLogLog.to_bytes()
+SET_SKETCHES = ((HOUR_MS, "set_sketch_1h"), (MINUTE_MS, "set_sketch_1m"))
+
+UPSERT_SKETCH_SQL = """
+    INSERT INTO {table} (series_id, bucket, registers) VALUES (?, ?, ?)
+    ON CONFLICT (series_id, bucket) DO UPDATE SET
+        registers = hll_union(registers, excluded.registers)
+"""
+
+# Metric types whose values are sketched for quantiles: timers, histograms
+# and distributions
+QUANTILE_TYPES = frozenset(["ms", "h", "d"])
+
+# Quantile sketches of their values, coarsest first like ROLLUPS, as
+# DDSketch.to_bytes()
+QUANTILE_SKETCHES = (
+    (HOUR_MS, "quantile_sketch_1h"),
+    (MINUTE_MS, "quantile_sketch_1m"),
+)
+
+UPSERT_QUANTILE_SQL = """
+    INSERT INTO {table} (series_id, bucket, sketch) VALUES (?, ?, ?)
+    ON CONFLICT (series_id, bucket) DO UPDATE SET
+        sketch = ddsketch_union(sketch, excluded.sketch)
+"""
+
+# With a set_members limit, how many minutes back the members already stored
+# are remembered; later rows of older minutes may store a member again
+SET_MEMBER_MINUTES = 5
+
+# Keeps the latest value of every gauge; a batch's rows are applied in order
+# and never replace a later value
+UPSERT_GAUGE_SQL = """
+    INSERT INTO gauge_current (series_id, value, timestamp) VALUES (?, ?, ?)
+    ON CONFLICT (series_id) DO UPDATE SET
+        value = excluded.value,
+        timestamp = excluded.timestamp
+    WHERE excluded.timestamp >= gauge_current.timestamp
+"""
+
+# Indexes the tags of a series, stored as canonical JSON in series.tags, for
+# the web UI's tag filters; malformed tags (from old databases) are skipped
+INSERT_SERIES_TAGS_SQL = """
+    INSERT OR IGNORE INTO series_tags (series_id, key, value)
+    SELECT ?, key, value FROM json_each(?)
+    WHERE json_valid(?) AND json_type(?) = 'object'
+"""
+
+# Published in the same transaction as every change to the stored data, so
+# readers can tell cheaply whether anything changed since they last looked
+# (the web UI's query cache): ``generation`` counts the writes and
+# ``committed_at`` is the time of the last one, in ms
+PUBLISH_WATERMARK_SQL = """
+    UPDATE watermark SET generation = generation + 1, committed_at = ?
+"""
+
+SERIES_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        metric_name TEXT NOT NULL,
+        metric_type TEXT NOT NULL,
+        tags TEXT
+    );
+"""
+
+# Partitioned storage: the period each points file covers, as (length in ms,
+# strftime format of its name)
+PARTITION_PERIODS = {
+    "hour": (HOUR_MS, "%Y-%m-%dT%H"),
+    "day": (24 * HOUR_MS, "%Y-%m-%d"),
+}
+
+# Partitions kept attached to the writing connection; data normally only
+# arrives for the current period
+MAX_WRITE_PARTITIONS = 3
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+TEMP_STORE_MODES = ("DEFAULT", "FILE", "MEMORY")
+
+
+def rollup_points(points: Iterable[tuple], resolution: int) -> Dict[tuple, list]:
+    """
+    Aggregate ``(series_id, value, string_value, sample_rate, timestamp)``
+    points into ``{(series_id, bucket): [count, total, total_scaled,
+    total_squares, min_value, max_value, last_value, last_timestamp]}``.
+
+    Set members have no value; only their count and last timestamp are kept.
+    """
+    buckets: Dict[tuple, list] = {}
+    for series_id, value, _, rate, timestamp in points:
+        key = (series_id, timestamp - timestamp % resolution)
+        aggregate = buckets.get(key)
+        if value is None:
+            if aggregate is None:
+                buckets[key] = [1, None, None, None, None, None, None, timestamp]
+            else:
+                aggregate[0] += 1
+                if timestamp >= aggregate[7]:
+                    aggregate[7] = timestamp
+            continue
+
+        scaled = value / rate if rate else 0.0
+        if aggregate is None:
+            buckets[key] = [
+                1,
+                value,
+                scaled,
+                value * value,
+                value,
+                value,
+                value,
+                timestamp,
+            ]
+            continue
+        aggregate[0] += 1
+        aggregate[1] += value
+        aggregate[2] += scaled
+        aggregate[3] += value * value
+        if value < aggregate[4]:
+            aggregate[4] = value
+        if value > aggregate[5]:
+            aggregate[5] = value
+        if timestamp >= aggregate[7]:
+            aggregate[6] = value
+            aggregate[7] = timestamp
+    return buckets
+
+
+def coarsen_rollups(buckets: Dict[tuple, list], resolution: int) -> Dict[tuple, list]:
+    """Merge rollup_points() aggregates into buckets of ``resolution`` ms."""
+    coarse: Dict[tuple, list] = {}
+    for (series_id, bucket), aggregate in buckets.items():
+        key = (series_id, bucket - bucket % resolution)
+        merged = coarse.get(key)
+        if merged is None:
+            coarse[key] = list(aggregate)
+            continue
+        merged[0] += aggregate[0]
+        if aggregate[1] is not None:
+            merged[1] += aggregate[1]
+            merged[2] += aggregate[2]
+            merged[3] += aggregate[3]
+            merged[4] = min(merged[4], aggregate[4])
+            merged[5] = max(merged[5], aggregate[5])
+        if aggregate[7] >= merged[7]:
+            merged[6] = aggregate[6]
+            merged[7] = aggregate[7]
+    return coarse
+
+
+def sketch_members(
+    points: Iterable[tuple], resolution: int
+) -> Dict[tuple, HyperLogLog]:
+    """
+    Sketch the set members of ``(series_id, value, string_value,
+    sample_rate, timestamp)`` points into ``{(series_id, bucket):
+    HyperLogLog}``; points without a member are skipped.
+    """
+    sketches: Dict[tuple, HyperLogLog] = {}
+    for series_id, _, member, _, timestamp in points:
+        if member is None:
+            continue
+        key = (series_id, timestamp - timestamp % resolution)
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = HyperLogLog()
+        sketch.add(member)
+    return sketches
+
+
+def sketch_values(points: Iterable[tuple], resolution: int) -> Dict[tuple, DDSketch]:
+    """
+    Sketch the values of ``(series_id, value, string_value, sample_rate,
+    timestamp)`` points into ``{(series_id, bucket): DDSketch}``.
+    """
+    sketches: Dict[tuple, DDSketch] = {}
+    for series_id, value, _, _, timestamp in points:
+        key = (series_id, timestamp - timestamp % resolution)
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = DDSketch()
+        sketch.add(value)
+    return sketches
+
+
+def coarsen_sketches(sketches: Dict[tuple, Any], resolution: int) -> Dict[tuple, Any]:
+    """
+    Merge sketch_members() or sketch_values() sketches into buckets of
+    ``resolution`` ms.
+    """
+    coarse: Dict[tuple, Any] = {}
+    for (series_id, bucket), sketch in sketches.items():
+        key = (series_id, bucket - bucket % resolution)
+        merged = coarse.get(key)
+        if merged is None:
+            merged = coarse[key] = type(sketch)()
+        merged.merge(sketch)
+    return coarse
+
+
+def partition_schema(name: str) -> str:
+    """Schema name under which the partition ``name`` is attached."""
+    return "p_" + re.sub(r"\W", "_", name)
+
+
+def partition_path(db_path: str, name: str) -> str:
+    """Path of the points file of partition ``name`` next to ``db_path``."""
+    return f"{os.path.splitext(db_path)[0]}-{name}.db"
 
 
 class MetricsStorage:
-    def __init__(self, db_path: str = "metrics.db"):
+    def __init__(
+        self,
+        db_path: str = "metrics.db",
+        synchronous: str = "NORMAL",
+        cache_size: int = -64000,
+        mmap_size: int = 256 * 1024 * 1024,
+        temp_store: str = "MEMORY",
+        partition: Optional[str] = None,
+        set_members: Optional[int] = None,
+    ):
+        """
+        Open the metrics database and keep the connection for the lifetime of
+        the storage object.
+
+        The database is switched to WAL so the web UI can read while the
+        server writes; the next arguments map directly to the SQLite pragmas
+        of the same name (a negative ``cache_size`` is in KiB).
+
+        With ``partition`` ("hour" or "day"), points are written to one file
+        per period next to ``db_path`` (e.g. ``metrics-2026-10-17.db``),
+        listed in its ``partitions`` table; series and rollups stay in
+        ``db_path``.
+
+        Set cardinalities come from the SET_SKETCHES tables. With
+        ``set_members``, only the first ``set_members`` distinct members of
+        each set per minute are kept as points (once each), so high
+        cardinality sets do not store every member; by default every set
+        event is kept.
+        """
+        synchronous = synchronous.upper()
+        temp_store = temp_store.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous mode: {synchronous}")
+        if temp_store not in TEMP_STORE_MODES:
+            raise ValueError(f"Invalid temp_store mode: {temp_store}")
+        if partition and partition not in PARTITION_PERIODS:
+            raise ValueError(f"Invalid partition period: {partition}")
+        if set_members is not None and set_members < 0:
+            raise ValueError(f"Invalid set members limit: {set_members}")
+
         self.db_path = db_path
+        self.synchronous = synchronous
+        self.partition = partition
+        self.set_members = set_members
+        # (series_id, minute) -> the set members stored as points
+        self.stored_members: Dict[tuple, set] = {}
+        self.stored_members_minute = 0
+        # Attached partitions by period start, least recently written first
+        self.partitions: "OrderedDict[int, str]" = OrderedDict()
+        self.lock = threading.Lock()
+        # The writer thread, not the thread creating the storage, does the
+        # inserts; access is serialized with self.lock instead.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        # Lets retention hand freed pages back with incremental_vacuum; only
+        # takes effect on databases created with it
+        self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={synchronous}")
+        self.conn.execute(f"PRAGMA cache_size={int(cache_size)}")
+        self.conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+        self.conn.execute(f"PRAGMA temp_store={temp_store}")
+        self.conn.create_function("hll_union", 2, hll_union, deterministic=True)
+        self.conn.create_function(
+            "ddsketch_union", 2, ddsketch_union, deterministic=True
+        )
         self.init_database()
 
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.conn.close()
+
     def init_database(self):
-        """Initialize the SQLite database with the raw_metrics table."""
-        with sqlite3.connect(self.db_path) as conn:
+        """
+        Initialize the SQLite database.
+
+        Each distinct (metric name, type, tag set) is stored once in
+        ``series``; ``points`` holds the received values and references its
+        series, with timestamps in integer milliseconds since the epoch.
+        The ROLLUPS tables aggregate points per series and per minute or hour,
+        the SET_SKETCHES tables sketch the members of sets likewise and the
+        QUANTILE_SKETCHES tables the values of QUANTILE_TYPES,
+        ``series_tags`` indexes the tags of each series, and
+        ``watermark`` changes with every write (see PUBLISH_WATERMARK_SQL).
+        ``raw_metrics`` is a view joining both, with the columns of
+        the original single-table design, for ad hoc inspection.
+        """
+        with self.lock, self.conn as conn:
             cursor = conn.cursor()
 
-            # Create the raw_metrics table as specified in the design
+            # AUTOINCREMENT: ids of deleted series are never reused, so points
+            # not deleted yet (in a partition) can never name another series
+            cursor.execute(SERIES_TABLE_SQL.format(table="series"))
+            self._migrate_series_ids(cursor)
+            # tags is NULL for untagged series, and NULLs never collide in a
+            # plain UNIQUE constraint
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_series_key
+                ON series (metric_name, metric_type, IFNULL(tags, ''));
+            """)
+            # Covers the per-type listings, which read all three columns
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS raw_metrics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    metric_name TEXT NOT NULL,
-                    metric_type TEXT NOT NULL,
-                    value REAL,
-                    string_value TEXT,
-                    sample_rate REAL DEFAULT 1.0,
-                    tags TEXT,
-                    timestamp DATETIME NOT NULL
+                CREATE INDEX IF NOT EXISTS idx_series_type_name
+                ON series (metric_type, metric_name, tags);
+            """)
+            cursor.execute("DROP INDEX IF EXISTS idx_series_type;")
+
+            self._create_points_table(cursor, "main")
+            cursor.execute("DROP INDEX IF EXISTS idx_points_series_timestamp;")
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS partitions (
+                    name TEXT PRIMARY KEY,
+                    start INTEGER NOT NULL,
+                    end INTEGER NOT NULL,
+                    path TEXT NOT NULL
                 );
             """)
 
-            # Create indexes for performance
+            backfill_rollups = not self._has_table(cursor, ROLLUPS[0][1], "table")
+            for _, table in ROLLUPS:
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        series_id INTEGER NOT NULL REFERENCES series (id),
+                        bucket INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        total REAL,
+                        total_scaled REAL,
+                        total_squares REAL,
+                        min_value REAL,
+                        max_value REAL,
+                        last_value REAL,
+                        last_timestamp INTEGER NOT NULL,
+                        PRIMARY KEY (series_id, bucket)
+                    ) WITHOUT ROWID;
+                """)
+
+            backfill_sketches = not self._has_table(cursor, SET_SKETCHES[0][1], "table")
+            for _, table in SET_SKETCHES:
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        series_id INTEGER NOT NULL REFERENCES series (id),
+                        bucket INTEGER NOT NULL,
+                        registers BLOB NOT NULL,
+                        PRIMARY KEY (series_id, bucket)
+                    );
+                """)
+
+            backfill_quantiles = not self._has_table(
+                cursor, QUANTILE_SKETCHES[0][1], "table"
+            )
+            for _, table in QUANTILE_SKETCHES:
+                cursor.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        series_id INTEGER NOT NULL REFERENCES series (id),
+                        bucket INTEGER NOT NULL,
+                        sketch BLOB NOT NULL,
+                        PRIMARY KEY (series_id, bucket)
+                    );
+                """)
+
+            # Each tag of each series, by tag first so filters on tags are
+            # index lookups
+            backfill_tags = not self._has_table(cursor, "series_tags", "table")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS series_tags (
+                    key TEXT NOT NULL,
+                    value TEXT,
+                    series_id INTEGER NOT NULL REFERENCES series (id),
+                    PRIMARY KEY (key, value, series_id)
+                ) WITHOUT ROWID;
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_series_tags_series
+                ON series_tags (series_id);
+            """)
+
+            backfill_gauges = not self._has_table(cursor, "gauge_current", "table")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS gauge_current (
+                    series_id INTEGER PRIMARY KEY REFERENCES series (id),
+                    value REAL NOT NULL,
+                    timestamp INTEGER NOT NULL
+                );
+            """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS watermark (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    generation INTEGER NOT NULL,
+                    committed_at INTEGER NOT NULL
+                );
+            """)
+            cursor.execute("INSERT OR IGNORE INTO watermark VALUES (0, 0, 0)")
+
+            if self._has_table(cursor, "raw_metrics", "table"):
+                self._migrate_raw_metrics(cursor)
+            else:
+                self._migrate_text_timestamps(cursor)
+
+            if backfill_rollups:
+                self._backfill_rollups(cursor)
+            if backfill_tags:
+                self._backfill_tags(cursor)
+            if backfill_gauges:
+                self._backfill_gauges(cursor)
+            if backfill_sketches:
+                self._backfill_sketches(cursor)
+            if backfill_quantiles:
+                self._backfill_quantiles(cursor)
+
+            cursor.execute("""
+                CREATE VIEW IF NOT EXISTS raw_metrics AS
+                SELECT points.id, series.metric_name, series.metric_type,
+                       points.value, points.string_value, points.sample_rate,
+                       series.tags, points.timestamp
+                FROM points JOIN series ON series.id = points.series_id;
+            """)
+            # Migrations and backfills may have changed the data
+            self._publish_watermark(cursor)
+
+        # Preload the series cache so ingest never has to look them up
+        self.series_ids = {
+            (name, metric_type, tags): series_id
+            for series_id, name, metric_type, tags in self.conn.execute(
+                "SELECT id, metric_name, metric_type, tags FROM series"
+            )
+        }
+        # Current value of every gauge by (metric_name, tags), which gauge
+        # deltas apply to
+        self.gauge_values = {
+            (name, tags): value
+            for name, tags, value in self.conn.execute("""
+                SELECT metric_name, tags, value
+                FROM gauge_current JOIN series ON series.id = gauge_current.series_id
+            """)
+        }
+
+    @staticmethod
+    def _create_points_table(cursor, schema: str):
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.points (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                series_id INTEGER NOT NULL,
+                value REAL,
+                string_value TEXT,
+                sample_rate REAL DEFAULT 1.0,
+                timestamp INTEGER NOT NULL
+            );
+        """)
+        # Series are read over a time range and the queries only need these
+        # columns, so the index covers them and the points table itself is
+        # never visited
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {schema}.idx_points_series_values
+            ON points (series_id, timestamp, value, sample_rate, string_value);
+        """)
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS {schema}.idx_points_timestamp "
+            "ON points (timestamp);"
+        )
+
+    def _attach_partition(self, start: int) -> str:
+        """
+        Attach (creating it if needed) the partition for the period starting
+        at ``start``, returning its schema name. Must be called outside of a
+        transaction, with self.lock held.
+        """
+        schema = self.partitions.get(start)
+        if schema:
+            self.partitions.move_to_end(start)
+            return schema
+
+        if len(self.partitions) >= MAX_WRITE_PARTITIONS:
+            _, oldest = self.partitions.popitem(last=False)
+            self.conn.execute(f"DETACH DATABASE {oldest}")
+
+        period, name_format = PARTITION_PERIODS[self.partition]
+        name = time.strftime(name_format, time.gmtime(start // 1000))
+        schema = partition_schema(name)
+        path = partition_path(self.db_path, name)
+        cursor = self.conn.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        cursor.execute(f"PRAGMA {schema}.journal_mode=WAL")
+        cursor.execute(f"PRAGMA {schema}.synchronous={self.synchronous}")
+        self._create_points_table(cursor, schema)
+        with self.conn:
+            # Ids start from the period's start time, so they increase across
+            # partitions and never collide
             cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_metric_name ON raw_metrics (metric_name);"
+                f"""
+                INSERT INTO {schema}.sqlite_sequence (name, seq)
+                SELECT 'points', ? WHERE NOT EXISTS (
+                    SELECT 1 FROM {schema}.sqlite_sequence WHERE name = 'points'
+                )
+            """,
+                (start * 1000,),
             )
             cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_metric_type ON raw_metrics (metric_type);"
+                "INSERT OR IGNORE INTO partitions (name, start, end, path) "
+                "VALUES (?, ?, ?, ?)",
+                (name, start, start + period, os.path.basename(path)),
+            )
+        self.partitions[start] = schema
+        return schema
+
+    def drop_partitions_before(self, cutoff: int) -> int:
+        """
+        Delete the partitions whose whole period is before ``cutoff``,
+        returning how many were deleted.
+        """
+        with self.lock:
+            expired = self.conn.execute(
+                "SELECT name, start, path FROM partitions WHERE end <= ?", (cutoff,)
+            ).fetchall()
+            directory = os.path.dirname(self.db_path)
+            for name, start, path in expired:
+                schema = self.partitions.pop(start, None)
+                if schema:
+                    self.conn.execute(f"DETACH DATABASE {schema}")
+                with self.conn:
+                    self.conn.execute("DELETE FROM partitions WHERE name = ?", (name,))
+                    self._publish_watermark(self.conn)
+                for suffix in ("", "-wal", "-shm"):
+                    try:
+                        os.remove(os.path.join(directory, path + suffix))
+                    except FileNotFoundError:
+                        pass
+        return len(expired)
+
+    @staticmethod
+    def _publish_watermark(cursor):
+        """Record a change to the stored data, within its transaction."""
+        cursor.execute(PUBLISH_WATERMARK_SQL, (now_ms(),))
+
+    @staticmethod
+    def _has_table(cursor, name: str, kind: str) -> bool:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ? AND type = ?", (name, kind)
+        )
+        return cursor.fetchone() is not None
+
+    def _migrate_raw_metrics(self, cursor):
+        """
+        Move rows from the original single raw_metrics table into series and
+        points, keeping their ids, then drop the table (it becomes a view).
+        """
+        cursor.execute("""
+            CREATE TEMP TABLE series_map (
+                metric_name TEXT, metric_type TEXT, tags TEXT, series_id INTEGER
+            );
+        """)
+        cursor.execute(
+            "SELECT DISTINCT metric_name, metric_type, tags FROM raw_metrics"
+        )
+        for metric_name, metric_type, tags in cursor.fetchall():
+            try:
+                canonical = canonical_tags_json(json.loads(tags)) if tags else None
+            except ValueError:
+                canonical = tags
+            series_id = self._get_or_create_series(
+                cursor, metric_name, metric_type, canonical
             )
             cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_timestamp ON raw_metrics (timestamp);"
+                "INSERT INTO series_map VALUES (?, ?, ?, ?)",
+                (metric_name, metric_type, tags, series_id),
             )
 
-            conn.commit()
+        cursor.execute(
+            "CREATE INDEX temp.idx_series_map ON series_map (metric_name, metric_type);"
+        )
+        cursor.execute(f"""
+            INSERT INTO points
+                (id, series_id, value, string_value, sample_rate, timestamp)
+            SELECT r.id, m.series_id, r.value, r.string_value, r.sample_rate,
+                   {TEXT_TIMESTAMP_TO_MS.format(column="r.timestamp")}
+            FROM raw_metrics r
+            JOIN series_map m
+              ON m.metric_name = r.metric_name
+             AND m.metric_type = r.metric_type
+             AND m.tags IS r.tags
+            ORDER BY r.id;
+        """)
+        cursor.execute("DROP TABLE series_map;")
+        cursor.execute("DROP TABLE raw_metrics;")
+
+    @staticmethod
+    def _migrate_series_ids(cursor):
+        """
+        Rebuild a series table created without AUTOINCREMENT, keeping its ids;
+        the copy leaves sqlite_sequence at the highest one.
+        """
+        cursor.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'series' AND type = 'table'"
+        )
+        if "AUTOINCREMENT" in cursor.fetchone()[0].upper():
+            return
+        # Renaming checks the views of the schema, and this one names series
+        # (it is created again afterwards)
+        cursor.execute("DROP VIEW IF EXISTS raw_metrics;")
+        cursor.execute(SERIES_TABLE_SQL.format(table="series_autoincrement"))
+        cursor.execute("""
+            INSERT INTO series_autoincrement (id, metric_name, metric_type, tags)
+            SELECT id, metric_name, metric_type, tags FROM series ORDER BY id;
+        """)
+        # The indexes go with the table and are created again by the caller
+        cursor.execute("DROP TABLE series;")
+        cursor.execute("ALTER TABLE series_autoincrement RENAME TO series;")
+
+    @staticmethod
+    def _migrate_text_timestamps(cursor):
+        """
+        Convert points stored with formatted TEXT timestamps to milliseconds.
+        """
+        # SQLite sorts integers before text, so the indexed MAX() is only text
+        # while unconverted rows remain
+        cursor.execute("SELECT typeof(MAX(timestamp)) FROM points")
+        if cursor.fetchone()[0] != "text":
+            return
+        cursor.execute(f"""
+            UPDATE points
+            SET timestamp = {TEXT_TIMESTAMP_TO_MS.format(column="timestamp")}
+            WHERE typeof(timestamp) = 'text';
+        """)
+
+    @staticmethod
+    def _backfill_tags(cursor):
+        """Index the tags of the series created before series_tags existed."""
+        cursor.execute("""
+            INSERT OR IGNORE INTO series_tags (series_id, key, value)
+            SELECT series.id, json_each.key, json_each.value
+            FROM series CROSS JOIN json_each(series.tags)
+            WHERE json_valid(series.tags) AND json_type(series.tags) = 'object'
+        """)
+
+    @staticmethod
+    def _backfill_gauges(cursor):
+        """Fill gauge_current with the latest value of every gauge stored."""
+        minute_table = ROLLUPS[-1][1]
+        # The bare last_value comes from the row holding MAX(last_timestamp)
+        cursor.execute(f"""
+            INSERT INTO gauge_current (series_id, value, timestamp)
+            SELECT series_id, last_value, MAX(last_timestamp)
+            FROM {minute_table}
+            WHERE series_id IN (SELECT id FROM series WHERE metric_type = 'g')
+            GROUP BY series_id
+        """)
+
+    @classmethod
+    def _backfill_sketches(cls, cursor):
+        """Sketch the members of the set points stored before sketches existed."""
+        cursor.execute("""
+            SELECT series_id, NULL, string_value, NULL, timestamp FROM points
+            WHERE series_id IN (SELECT id FROM series WHERE metric_type = 's')
+              AND string_value IS NOT NULL
+        """)
+        sketches = sketch_members(cursor, MINUTE_MS)
+        cls._upsert_sketches(cursor, sketches, SET_SKETCHES, UPSERT_SKETCH_SQL)
+
+    @classmethod
+    def _backfill_quantiles(cls, cursor):
+        """Sketch the values of the timer points stored before sketches existed."""
+        types = ", ".join(f"'{metric_type}'" for metric_type in sorted(QUANTILE_TYPES))
+        cursor.execute(f"""
+            SELECT series_id, value, NULL, NULL, timestamp FROM points
+            WHERE series_id IN (SELECT id FROM series WHERE metric_type IN ({types}))
+              AND value IS NOT NULL
+        """)
+        sketches = sketch_values(cursor, MINUTE_MS)
+        cls._upsert_sketches(cursor, sketches, QUANTILE_SKETCHES, UPSERT_QUANTILE_SQL)
+
+    @staticmethod
+    def _backfill_rollups(cursor):
+        """Compute the rollups of points stored before they existed."""
+        (hour, hour_table), (minute, minute_table) = ROLLUPS
+        cursor.execute(f"""
+            INSERT INTO {minute_table} ({ROLLUP_COLUMNS})
+            SELECT series_id, bucket, count, total, total_scaled, total_squares,
+                   min_value, max_value,
+                   (SELECT value FROM points AS latest
+                    WHERE latest.series_id = buckets.series_id
+                      AND latest.timestamp = buckets.last_timestamp
+                    ORDER BY latest.id DESC LIMIT 1),
+                   last_timestamp
+            FROM (
+                SELECT series_id, timestamp / {minute} * {minute} AS bucket,
+                       COUNT(*) AS count, SUM(value) AS total,
+                       SUM(value / sample_rate) AS total_scaled,
+                       SUM(value * value) AS total_squares,
+                       MIN(value) AS min_value, MAX(value) AS max_value,
+                       MAX(timestamp) AS last_timestamp
+                FROM points
+                GROUP BY series_id, bucket
+            ) AS buckets;
+        """)
+        cursor.execute(f"""
+            INSERT INTO {hour_table} ({ROLLUP_COLUMNS})
+            SELECT series_id, bucket, count, total, total_scaled, total_squares,
+                   min_value, max_value,
+                   (SELECT last_value FROM {minute_table} AS latest
+                    WHERE latest.series_id = buckets.series_id
+                      AND latest.bucket >= buckets.bucket
+                      AND latest.bucket < buckets.bucket + {hour}
+                    ORDER BY latest.last_timestamp DESC LIMIT 1),
+                   last_timestamp
+            FROM (
+                SELECT series_id, bucket / {hour} * {hour} AS bucket,
+                       SUM(count) AS count, SUM(total) AS total,
+                       SUM(total_scaled) AS total_scaled,
+                       SUM(total_squares) AS total_squares,
+                       MIN(min_value) AS min_value, MAX(max_value) AS max_value,
+                       MAX(last_timestamp) AS last_timestamp
+                FROM {minute_table}
+                GROUP BY series_id, bucket / {hour}
+            ) AS buckets;
+        """)
+
+    @staticmethod
+    def _get_or_create_series(
+        cursor, metric_name: str, metric_type: str, tags: Optional[str]
+    ) -> int:
+        cursor.execute(
+            "INSERT OR IGNORE INTO series (metric_name, metric_type, tags) "
+            "VALUES (?, ?, ?)",
+            (metric_name, metric_type, tags),
+        )
+        cursor.execute(
+            "SELECT id FROM series "
+            "WHERE metric_name = ? AND metric_type = ? AND IFNULL(tags, '') = ?",
+            (metric_name, metric_type, tags or ""),
+        )
+        series_id = cursor.fetchone()[0]
+        if tags:
+            cursor.execute(INSERT_SERIES_TAGS_SQL, (series_id, tags, tags, tags))
+        return series_id
 
     def store_metric(
         self,
@@ -51,30 +843,406 @@ class MetricsStorage:
         tags: Optional[Dict[str, str]] = None,
     ):
         """Store a metric in the database."""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        tags_json = canonical_tags_json(tags)
 
-            # Convert tags dict to JSON string
-            tags_json = json.dumps(tags) if tags else None
+        timestamp = now_ms()
 
-            # Get current UTC timestamp
-            timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        self.store_metrics(
+            self.resolve_gauge_deltas(
+                [
+                    (
+                        metric_name,
+                        metric_type,
+                        value,
+                        string_value,
+                        sample_rate,
+                        tags_json,
+                        timestamp,
+                    )
+                ]
+            )
+        )
 
-            cursor.execute(
-                """
-                INSERT INTO raw_metrics 
-                (metric_name, metric_type, value, string_value, sample_rate, tags, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
+    def resolve_gauge_deltas(self, rows: Iterable[MetricRow]) -> List[MetricRow]:
+        """
+        Replace the GAUGE_DELTA rows of a batch with plain gauge rows holding
+        the gauge's new value (its current value, 0 for a new gauge, plus the
+        change), keeping track of the current value of every gauge.
+
+        Must see every gauge row, in order, before it is stored; the writer
+        calls it on each batch.
+        """
+        values = self.gauge_values
+        resolved = []
+        for row in rows:
+            metric_type = row[1]
+            if metric_type == "g":
+                values[row[0], row[5]] = row[2]
+            elif metric_type == GAUGE_DELTA:
+                name, _, change, string_value, rate, tags, timestamp = row
+                value = values.get((name, tags), 0.0) + change
+                values[name, tags] = value
+                row = (name, "g", value, string_value, rate, tags, timestamp)
+            resolved.append(row)
+        return resolved
+
+    def store_metrics(
+        self,
+        rows: Iterable[MetricRow],
+        aggregates: Optional[Dict[tuple, list]] = None,
+        quantiles: Optional[Dict[tuple, DDSketch]] = None,
+    ):
+        """
+        Store a batch of metric rows in a single transaction. Gauge deltas
+        must already be resolved, see resolve_gauge_deltas().
+
+        ``aggregates`` and ``quantiles``, as returned with the rows by
+        MetricsAggregator.drain(), are the exact per-minute rollups and
+        quantile sketches of the events the rows stand for and replace the
+        ones computed from the rows.
+
+        With partitioned storage, a batch spanning more than
+        MAX_WRITE_PARTITIONS periods is stored in one transaction per group
+        of that many periods, as only that many stay attached.
+        """
+        if self.partition:
+            groups = self._partition_groups(list(rows), aggregates, quantiles)
+        else:
+            groups = [((), rows, aggregates, quantiles)]
+        new_series: list = []
+        try:
+            with self.lock:
+                for starts, batch, batch_aggregates, batch_quantiles in groups:
+                    # ATTACH is not allowed inside the transaction
+                    schemas = {start: self._attach_partition(start) for start in starts}
+                    new_series = []
+                    self._store_rows(
+                        batch, schemas, new_series, batch_aggregates, batch_quantiles
+                    )
+        except Exception:
+            # Series created in the rolled back transaction no longer exist
+            for key in new_series:
+                self.series_ids.pop(key, None)
+            raise
+
+    def _partition_groups(
+        self,
+        rows: List[MetricRow],
+        aggregates: Optional[Dict[tuple, list]],
+        quantiles: Optional[Dict[tuple, DDSketch]],
+    ) -> List[tuple]:
+        """
+        Split a batch into (period starts, rows, aggregates, quantiles)
+        groups covering at most MAX_WRITE_PARTITIONS periods each.
+        """
+        period = PARTITION_PERIODS[self.partition][0]
+        starts = sorted({row[6] - row[6] % period for row in rows})
+        if len(starts) <= MAX_WRITE_PARTITIONS:
+            return [(starts, rows, aggregates, quantiles)]
+
+        def select(items: Optional[dict], group: set) -> Optional[dict]:
+            # Keyed by (name, metric_type, tags, minute bucket), and every
+            # period is a whole number of minutes
+            if items is None:
+                return None
+            return {
+                key: item
+                for key, item in items.items()
+                if key[3] - key[3] % period in group
+            }
+
+        groups = []
+        for offset in range(0, len(starts), MAX_WRITE_PARTITIONS):
+            group = set(starts[offset : offset + MAX_WRITE_PARTITIONS])
+            group_rows = [row for row in rows if row[6] - row[6] % period in group]
+            groups.append(
                 (
-                    metric_name,
-                    metric_type,
-                    value,
-                    string_value,
-                    sample_rate,
-                    tags_json,
-                    timestamp,
-                ),
+                    sorted(group),
+                    group_rows,
+                    select(aggregates, group),
+                    select(quantiles, group),
+                )
             )
+        return groups
+
+    def _store_rows(
+        self,
+        rows: Iterable[MetricRow],
+        schemas: Dict[int, str],
+        new_series: list,
+        aggregates: Optional[Dict[tuple, list]] = None,
+        quantiles: Optional[Dict[tuple, DDSketch]] = None,
+    ):
+        """
+        Write rows in one transaction, to the partitions in ``schemas`` (by
+        period start) if any, recording the series it creates in
+        ``new_series``.
+        """
+        series_ids = self.series_ids
+        with self.conn as conn:
+            cursor = conn.cursor()
+            points = []
+            gauges = {}
+            members = []
+            timings = []
+            for name, metric_type, value, string_value, rate, tags, timestamp in rows:
+                key = (name, metric_type, tags)
+                series_id = series_ids.get(key)
+                if series_id is None:
+                    series_id = self._get_or_create_series(
+                        cursor, name, metric_type, tags
+                    )
+                    series_ids[key] = series_id
+                    new_series.append(key)
+                point = (series_id, value, string_value, rate, timestamp)
+                points.append(point)
+                if metric_type == "g":
+                    gauges[series_id] = (series_id, value, timestamp)
+                elif metric_type == "s":
+                    members.append(point)
+                elif metric_type in QUANTILE_TYPES:
+                    timings.append(point)
+
+            stored = points
+            if self.set_members is not None and members:
+                stored = self._retain_members(points)
+
+            # Reusing the same SQL text lets sqlite3's statement cache hand
+            # back the already prepared INSERT instead of compiling it per
+            # batch.
+            if not schemas:
+                by_schema = {"main": stored}
+            elif len(schemas) == 1:
+                by_schema = {schema: stored for schema in schemas.values()}
+            else:
+                period = PARTITION_PERIODS[self.partition][0]
+                by_schema = {}
+                for point in stored:
+                    schema = schemas[point[4] - point[4] % period]
+                    by_schema.setdefault(schema, []).append(point)
+            for schema, schema_points in by_schema.items():
+                cursor.executemany(
+                    INSERT_POINT_SQL.format(schema=schema), schema_points
+                )
+
+            cursor.executemany(UPSERT_GAUGE_SQL, gauges.values())
+
+            # Rollups are updated in the same transaction, so they always
+            # match the stored points (or the events they stand for); each
+            # level is computed from the finer one
+            if aggregates is None:
+                buckets = rollup_points(points, MINUTE_MS)
+            else:
+                # Aggregates always come with at least one row of their series
+                buckets = {
+                    (series_ids[key[:3]], key[3]): aggregate
+                    for key, aggregate in aggregates.items()
+                }
+            for resolution, table in reversed(ROLLUPS):
+                if resolution != MINUTE_MS:
+                    buckets = coarsen_rollups(buckets, resolution)
+                cursor.executemany(
+                    UPSERT_ROLLUP_SQL.format(table=table),
+                    [
+                        (series_id, bucket, *aggregate)
+                        for (series_id, bucket), aggregate in buckets.items()
+                    ],
+                )
+
+            # The aggregator's rows hold each member of a set and minute, so
+            # set sketches come from the rows in both cases
+            sketches = sketch_members(members, MINUTE_MS)
+            self._upsert_sketches(cursor, sketches, SET_SKETCHES, UPSERT_SKETCH_SQL)
+
+            if quantiles is None:
+                sketches = sketch_values(timings, MINUTE_MS)
+            else:
+                sketches = {
+                    (series_ids[name, metric_type, tags], bucket): sketch
+                    for (name, metric_type, tags, bucket), sketch in quantiles.items()
+                }
+            self._upsert_sketches(
+                cursor, sketches, QUANTILE_SKETCHES, UPSERT_QUANTILE_SQL
+            )
+            self._publish_watermark(cursor)
+
+    @staticmethod
+    def _upsert_sketches(
+        cursor, sketches: Dict[tuple, Any], levels: tuple, upsert_sql: str
+    ):
+        """Merge per-minute sketches into the tables of ``levels``."""
+        for resolution, table in reversed(levels):
+            if resolution != MINUTE_MS:
+                sketches = coarsen_sketches(sketches, resolution)
+            cursor.executemany(
+                upsert_sql.format(table=table),
+                [
+                    (series_id, bucket, sketch.to_bytes())
+                    for (series_id, bucket), sketch in sketches.items()
+                ],
+            )
+
+    def _retain_members(self, points: List[tuple]) -> List[tuple]:
+        """
+        The points to store: all but the set members already stored for
+        their series and minute, or beyond the set_members limit.
+        """
+        limit = self.set_members
+        stored_members = self.stored_members
+        retained = []
+        newest = self.stored_members_minute
+        for point in points:
+            member = point[2]
+            if member is None:
+                retained.append(point)
+                continue
+            minute = point[4] // MINUTE_MS
+            if minute > newest:
+                newest = minute
+            key = (point[0], minute)
+            stored = stored_members.get(key)
+            if stored is None:
+                stored = stored_members[key] = set()
+            if member in stored or len(stored) >= limit:
+                continue
+            stored.add(member)
+            retained.append(point)
+
+        if newest > self.stored_members_minute:
+            self.stored_members_minute = newest
+            oldest = newest - SET_MEMBER_MINUTES
+            for key in [key for key in stored_members if key[1] < oldest]:
+                del stored_members[key]
+        return retained
+
+    def delete_points_before(self, cutoff: int, limit: int) -> int:
+        """
+        Delete up to ``limit`` of the oldest points with a timestamp before
+        ``cutoff``, returning how many were deleted.
+
+        With partitioned storage, the partition holding ``cutoff`` has points
+        on both sides of it and is cleaned up here too; the partitions wholly
+        before ``cutoff`` are left to drop_partitions_before().
+        """
+        with self.lock:
+            schemas = ["main"]
+            if self.partition:
+                overlapping = self.conn.execute(
+                    "SELECT start FROM partitions WHERE start < ? AND end > ?",
+                    (cutoff, cutoff),
+                ).fetchall()
+                schemas.extend(
+                    self._attach_partition(start) for (start,) in overlapping
+                )
+
+            deleted = 0
+            with self.conn as conn:
+                for schema in schemas:
+                    cursor = conn.execute(
+                        f"""
+                        DELETE FROM {schema}.points WHERE id IN (
+                            SELECT id FROM {schema}.points WHERE timestamp < ?
+                            ORDER BY timestamp LIMIT ?
+                        )
+                    """,
+                        (cutoff, limit - deleted),
+                    )
+                    deleted += cursor.rowcount
+                    if deleted >= limit:
+                        break
+                if deleted:
+                    self._publish_watermark(conn)
+            return deleted
+
+    def delete_rollups_before(self, cutoff: int, series_ids: Iterable[int]) -> int:
+        """
+        Delete the rollup and sketch buckets of ``series_ids`` that end before
+        ``cutoff``, returning how many were deleted.
+        """
+        series_ids = list(series_ids)
+        deleted = 0
+        with self.lock, self.conn as conn:
+            for bucket_size, table in ROLLUPS + SET_SKETCHES + QUANTILE_SKETCHES:
+                # Lookups by (series_id, bucket) use the primary key
+                cursor = conn.executemany(
+                    f"DELETE FROM {table} WHERE series_id = ? AND bucket <= ?",
+                    [(series_id, cutoff - bucket_size) for series_id in series_ids],
+                )
+                deleted += cursor.rowcount
+            if deleted:
+                self._publish_watermark(conn)
+        return deleted
+
+    def delete_unused_series(self, cutoff: int) -> int:
+        """
+        Delete series left without any data, returning how many were deleted.
+
+        A series' points all fall in its hourly rollup buckets, which expire
+        last, so only series without any are candidates. They are still
+        checked for points before ``cutoff`` (the retention cutoff), which
+        may remain after an interrupted or partial cleanup.
+        """
+        hour_table = ROLLUPS[0][1]
+        with self.lock:
+            unused = self.conn.execute(f"""
+                SELECT id FROM series
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {hour_table} WHERE series_id = series.id
+                )
+            """).fetchall()
+            for schema in self._schemas_before(cutoff) if unused else ():
+                has_points = f"SELECT 1 FROM {schema}.points WHERE series_id = ?"
+                unused = [
+                    row
+                    for row in unused
+                    if not self.conn.execute(has_points, row).fetchone()
+                ]
+
+            with self.conn as conn:
+                conn.executemany(
+                    "DELETE FROM gauge_current WHERE series_id = ?", unused
+                )
+                conn.executemany("DELETE FROM series_tags WHERE series_id = ?", unused)
+                conn.executemany("DELETE FROM series WHERE id = ?", unused)
+                if unused:
+                    self._publish_watermark(conn)
+
+            unused_ids = {series_id for (series_id,) in unused}
+            for key, series_id in list(self.series_ids.items()):
+                if series_id in unused_ids:
+                    del self.series_ids[key]
+                    if key[1] == "g":
+                        self.gauge_values.pop((key[0], key[2]), None)
+        return len(unused)
+
+    def _schemas_before(self, cutoff: int) -> Iterator[str]:
+        """
+        The schemas whose points table can hold points before ``cutoff``:
+        main, then the partitions starting before it, attached one at a time
+        (so use each before the next). Must be used with self.lock held,
+        outside of a transaction.
+        """
+        yield "main"
+        if self.partition:
+            starts = self.conn.execute(
+                "SELECT start FROM partitions WHERE start < ? ORDER BY start",
+                (cutoff,),
+            ).fetchall()
+            for (start,) in starts:
+                yield self._attach_partition(start)
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """
+        Return up to ``pages`` free pages to the file system, returning how
+        many were freed (always 0 unless auto_vacuum is INCREMENTAL).
+        """
+        with self.lock:
+            before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            self.conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            after = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
 
-            conn.commit()
+    def auto_vacuum_mode(self) -> int:
+        """The database's auto_vacuum mode (0 none, 1 full, 2 incremental)."""
+        with self.lock:
+            return self.conn.execute("PRAGMA auto_vacuum").fetchone()[0]
@@ -1,9 +1,11 @@
 import argparse
-from flask import Flask, render_template, request
+from flask import Flask, jsonify, render_template, request
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.utils import PlotlyJSONEncoder
 from datetime import datetime
+from typing import Optional
+from urllib.parse import urlencode
 
 from .database import MetricsDB
 
@@ -19,11 +21,23 @@ def add_global_context(**kwargs):
     return {"time_range": time_range, **kwargs}
 
 
-def create_app(db_path: str = "metrics.db"):
+def create_app(
+    db_path: str = "metrics.db",
+    hot_tier: Optional[str] = None,
+    cache_size: int = 256,
+    cache_ttl: float = 60.0,
+    cache_max_staleness: float = 5.0,
+):
     app = Flask(__name__)
     app.json_encoder = PlotlyJSONEncoder
 
-    db = MetricsDB(db_path)
+    db = MetricsDB(
+        db_path,
+        hot_tier,
+        cache_size=cache_size,
+        cache_ttl=cache_ttl,
+        cache_max_staleness=cache_max_staleness,
+    )
 
     @app.context_processor
     def inject_global_vars():
@@ -220,12 +234,17 @@ def create_app(db_path: str = "metrics.db"):
         chart_html = None
 
         if selected_timer:
-            timer_values = db.get_timer_values(selected_timer, time_range, tag_filter)
+            histogram = db.get_timer_histogram(selected_timer, time_range, tag_filter)
 
-            if timer_values:
+            if histogram:
                 fig = go.Figure()
                 fig.add_trace(
-                    go.Histogram(x=timer_values, name=selected_timer, nbinsx=20)
+                    go.Bar(
+                        x=[(b["start"] + b["end"]) / 2 for b in histogram],
+                        y=[b["count"] for b in histogram],
+                        width=[b["end"] - b["start"] for b in histogram],
+                        name=selected_timer,
+                    )
                 )
 
                 fig.update_layout(
@@ -299,9 +318,8 @@ def create_app(db_path: str = "metrics.db"):
     @app.route("/raw")
     def raw_data():
         """Raw data page with filtering and pagination."""
-        page = int(request.args.get("page", 1))
+        cursor = request.args.get("cursor") or None
         limit = 100
-        offset = (page - 1) * limit
 
         metric_name = request.args.get("metric_name", "").strip()
         metric_type = request.args.get("metric_type", "")
@@ -316,7 +334,8 @@ def create_app(db_path: str = "metrics.db"):
             "hours": int(hours) if hours else None,
         }
 
-        raw_metrics = db.get_raw_metrics(limit, offset, **filters)
+        page = db.get_raw_metrics(limit, cursor, **filters)
+        raw_metrics = page["rows"]
 
         # Format timestamps
         for metric in raw_metrics:
@@ -324,15 +343,31 @@ def create_app(db_path: str = "metrics.db"):
                 dt = datetime.fromisoformat(metric["timestamp"])
                 metric["timestamp_display"] = dt.strftime("%Y-%m-%d %H:%M:%S")
 
+        def page_url(token: Optional[str]) -> Optional[str]:
+            """URL of the page ``token`` refers to, with the same filters."""
+            if not token:
+                return None
+            args = {
+                key: value
+                for key, value in request.args.items()
+                if value and key != "cursor"
+            }
+            return "?" + urlencode({**args, "cursor": token})
+
         return render_template(
             "raw.html",
             raw_metrics=raw_metrics,
-            page=page,
-            has_next=len(raw_metrics) == limit,
+            next_url=page_url(page["next"]),
+            prev_url=page_url(page["prev"]),
             filters=request.args,
             current_page="raw",
         )
 
+    @app.route("/stats")
+    def internal_stats():
+        """Internal stats of the web UI, such as the query cache hit rate."""
+        return jsonify(db.stats.snapshot())
+
     return app
 
 
@@ -342,10 +377,45 @@ def main():
     parser.add_argument("--host", default="127.0.0.1", help="Host to bind to")
     parser.add_argument("--port", type=int, default=5000, help="Port to bind to")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
+    parser.add_argument(
+        "--hot-tier",
+        metavar="URL",
+        help="Hot tier of the StatsD server (duckstatsd --hot-tier-port), e.g. "
+        "http://127.0.0.1:8127, serving recent metrics from memory",
+    )
+
+    parser.add_argument(
+        "--query-cache-size",
+        type=int,
+        default=256,
+        help="Query results kept in memory until new metrics are written "
+        "(0 to disable)",
+    )
+    parser.add_argument(
+        "--query-cache-ttl",
+        type=float,
+        default=60.0,
+        metavar="SECONDS",
+        help="Longest time a cached query result is served",
+    )
+    parser.add_argument(
+        "--query-cache-max-staleness",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="Time a cached query result is served even if new metrics were "
+        "written since (default: 5)",
+    )
 
     args = parser.parse_args()
 
-    app = create_app(args.db)
+    app = create_app(
+        args.db,
+        args.hot_tier,
+        args.query_cache_size,
+        args.query_cache_ttl,
+        args.query_cache_max_staleness,
+    )
     app.run(host=args.host, port=args.port, debug=args.debug)
 
 
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Union
+
+# Returned by QueryCache.get() when there is no valid entry (None is a valid
+# query result)
+MISSING = object()
+
+
+class QueryCache:
+    """
+    Bounded LRU of query results.
+
+    An entry younger than ``max_staleness`` seconds is always served. After
+    that it is valid only while the watermark it was stored with is
+    current, and for at most ``ttl`` seconds. The ingest watermark moves
+    with every write, which under steady ingest is every few tens of
+    milliseconds, so the staleness bound is what lets busy dashboards hit
+    the cache. The watermark keeps unchanged data in memory for longer, and
+    ``ttl`` bounds what it does not track, such as time ranges moving
+    forward or the hot tier.
+    """
+
+    def __init__(
+        self, max_size: int = 256, ttl: float = 60.0, max_staleness: float = 5.0
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        # key -> (watermark, stored at, result)
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, watermark: Any) -> Any:
+        """The result stored for ``key``, valid at ``watermark``, or MISSING."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or not self._valid(entry, watermark):
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[2]
+
+    def _valid(self, entry: tuple, watermark: Any) -> bool:
+        age = time.monotonic() - entry[1]
+        if age >= self.ttl:
+            return False
+        return age < self.max_staleness or entry[0] == watermark
+
+    def put(self, key: Hashable, watermark: Any, result: Any):
+        with self.lock:
+            self.entries[key] = (watermark, time.monotonic(), result)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return {
+            "query_cache_hits": self.hits,
+            "query_cache_misses": self.misses,
+            "query_cache_hit_rate": round(hit_rate, 4),
+            "query_cache_evictions": self.evictions,
+            "query_cache_size": len(self.entries),
+        }
@@ -1,194 +1,640 @@
+import base64
+import functools
+import json
+import os
 import sqlite3
-import re
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+
+from ..ddsketch import DDSketch, DDSketchMerge
+from ..hottier import HotTierClient
+from ..hyperloglog import HLLCount
+from ..stats import InternalStats
+from ..storage import MINUTE_MS, HOUR_MS, ROLLUP_COLUMNS, ROLLUPS, SET_SKETCHES
+from ..storage import QUANTILE_SKETCHES
+from ..storage import POINTS_COLUMNS, format_timestamp_ms, now_ms
+from ..storage import partition_schema
+from .cache import MISSING, QueryCache
+from .tagfilter import compile_tag_filter, tag_condition
+
+
+# Join for queries that select series first (by type, name and tags) and then
+# read their points through the (series_id, timestamp) index; CROSS JOIN makes
+# SQLite keep that order.
+SERIES_POINTS = "series CROSS JOIN points ON points.series_id = series.id"
+
+# Join for queries driven by the points' timestamp (most recent events)
+POINTS_SERIES = "points JOIN series ON series.id = points.series_id"
+
+# Result columns holding timestamps (integer milliseconds since the epoch),
+# formatted for display as rows are fetched
+TIMESTAMP_COLUMNS = frozenset(["timestamp", "last_seen", "minute"])
+
+# Aggregates the points not covered by a rollup bucket (the start of a time
+# range), per series and minute, with the columns of the rollup tables
+RAW_ROLLUP_SQL = f"""
+    SELECT series_id, bucket, COUNT(*) AS count, SUM(value) AS total,
+           SUM(value / sample_rate) AS total_scaled,
+           SUM(value * value) AS total_squares,
+           MIN(value) AS min_value, MAX(value) AS max_value,
+           last_value, MAX(timestamp) AS last_timestamp
+    FROM (
+        SELECT series_id, timestamp / {MINUTE_MS} * {MINUTE_MS} AS bucket,
+               value, sample_rate, timestamp,
+               FIRST_VALUE(value) OVER (
+                   PARTITION BY series_id, timestamp / {MINUTE_MS}
+                   ORDER BY timestamp DESC, id DESC
+               ) AS last_value
+        FROM points
+        WHERE {{where_clause}}
+    )
+    GROUP BY series_id, bucket
+"""
+
+# Aggregates from the hot tier, passed as one JSON array parameter of
+# [metric_name, metric_type, tags, bucket, *rollup columns] rows, with the
+# columns of the rollup tables
+HOT_ROLLUP_SQL = """
+    SELECT series.id AS series_id,
+           json_extract(hot.value, '$[3]') AS bucket,
+           json_extract(hot.value, '$[4]') AS count,
+           json_extract(hot.value, '$[5]') AS total,
+           json_extract(hot.value, '$[6]') AS total_scaled,
+           json_extract(hot.value, '$[7]') AS total_squares,
+           json_extract(hot.value, '$[8]') AS min_value,
+           json_extract(hot.value, '$[9]') AS max_value,
+           json_extract(hot.value, '$[10]') AS last_value,
+           json_extract(hot.value, '$[11]') AS last_timestamp
+    FROM json_each(?) AS hot
+    JOIN series ON series.metric_name = json_extract(hot.value, '$[0]')
+               AND series.metric_type = json_extract(hot.value, '$[1]')
+               AND series.tags IS json_extract(hot.value, '$[2]')
+    WHERE {where_clause}
+"""
+
+# Quantiles reported for timers, as (result column, quantile)
+TIMER_QUANTILES = (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))
+
+# SQLite's default limit on attached databases is 10
+MAX_READ_PARTITIONS = 9
+
+# Idle read connections kept open for reuse, and their page cache (in KiB,
+# per connection) and memory map sizes
+READ_POOL_SIZE = 8
+READ_CACHE_SIZE = -16000
+READ_MMAP_SIZE = 256 * 1024 * 1024
+
+
+def _read_only_uri(path: str) -> str:
+    return f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro"
+
+
+class _ReadConnection:
+    """A pooled read-only connection, with what is attached to it."""
+
+    __slots__ = ("conn", "schema_version", "partitions", "main_points")
+
+    def __init__(self, conn: sqlite3.Connection, schema_version: int):
+        self.conn = conn
+        self.schema_version = schema_version
+        # Names of the attached partitions, in the order of the points view,
+        # and whether the view also reads main.points
+        self.partitions: Tuple[str, ...] = ()
+        self.main_points = True
+
+
+# Directions of raw metrics page cursors, from the row they hold
+_OLDER = "o"
+_NEWER = "n"
+
+
+def _encode_cursor(direction: str, point_id: int, timestamp: int) -> str:
+    """Opaque page token for the rows ``direction`` of a point."""
+    raw = f"{direction}{timestamp}.{point_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(token: str) -> Optional[Tuple[str, int, int]]:
+    """(direction, timestamp, id) of a page token, None if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        direction = raw[:1]
+        timestamp, point_id = raw[1:].split(".")
+        if direction not in (_OLDER, _NEWER):
+            return None
+        return direction, int(timestamp), int(point_id)
+    except ValueError:
+        return None
+
+
+def _copy_result(result: Any) -> Any:
+    """Copy of a query result that callers can modify, as they do rows."""
+    if isinstance(result, list):
+        return [dict(row) if isinstance(row, dict) else row for row in result]
+    if isinstance(result, dict):
+        return dict(result)
+    return result
+
+
+def _cached(method):
+    """
+    Serve a MetricsDB query method from the query cache, by method and
+    arguments, while the entry is recent or the ingest watermark unchanged.
+    """
+
+    @functools.wraps(method)
+    def cached_method(self, *args, **kwargs):
+        if self.cache is None:
+            return method(self, *args, **kwargs)
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        # Read before querying: a write committed meanwhile makes the entry
+        # look stale, never fresh
+        watermark = self._watermark()
+        result = self.cache.get(key, watermark)
+        if result is MISSING:
+            result = method(self, *args, **kwargs)
+            self.cache.put(key, watermark, result)
+        return _copy_result(result)
+
+    return cached_method
 
 
 class MetricsDB:
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        hot_tier: Optional[str] = None,
+        cache_size: int = 256,
+        cache_ttl: float = 60.0,
+        cache_max_staleness: float = 5.0,
+        stats: Optional[InternalStats] = None,
+    ):
+        """
+        ``hot_tier`` is the URL of the StatsD server's hot tier; the recent
+        part of time ranges is then read from its memory instead of SQLite.
+
+        Query results are cached (up to ``cache_size`` of them, 0 disables
+        the cache) for ``cache_max_staleness`` seconds, then until the
+        storage publishes a new watermark, for at most ``cache_ttl`` seconds
+        in all; see QueryCache.
+        """
         self.db_path = db_path
+        self.hot_tier = HotTierClient(hot_tier) if hot_tier else None
+        # Idle connections, most recently used last
+        self.pool: List[_ReadConnection] = []
+        self.pool_lock = threading.Lock()
+        self.cache = (
+            QueryCache(cache_size, cache_ttl, cache_max_staleness)
+            if cache_size > 0
+            else None
+        )
+        self.stats = stats or InternalStats()
+        if self.cache is not None:
+            self.stats.add_source(self.cache.stats)
+
+    def close(self):
+        """Close the idle connections."""
+        with self.pool_lock:
+            pool, self.pool = self.pool, []
+        for read_connection in pool:
+            read_connection.conn.close()
+
+    @contextmanager
+    def _get_connection(
+        self,
+        since: Optional[int] = None,
+        points: bool = True,
+        partitions: Optional[Tuple[List[Tuple[str, str]], bool]] = None,
+    ) -> Iterator[sqlite3.Connection]:
+        """
+        Borrow a read-only connection to the database for the calling thread,
+        returning it to the pool afterwards. With partitioned storage and
+        ``points``, ``points`` is a view over the attached partitions: those
+        of ``partitions`` (a group from _partition_groups) if given, else
+        the oldest ones holding points at or after ``since``, which is where
+        the rollup queries read the points before their first full minute.
+
+        ``hll_count(registers)`` estimates the distinct members of the set
+        sketches it aggregates, and ``ddsketch_merge(sketch)`` merges
+        quantile sketches.
+        """
+        read_connection = self._checkout()
+        try:
+            if points:
+                if partitions is None:
+                    selected = self._select_partitions(
+                        read_connection.conn, since, newest_first=False
+                    )
+                    partitions = (selected[:MAX_READ_PARTITIONS], True)
+                self._attach_partitions(read_connection, *partitions)
+            yield read_connection.conn
+        except Exception:
+            # Do not reuse a connection left in an unknown state
+            read_connection.conn.close()
+            raise
+        else:
+            self._checkin(read_connection)
 
-    def _get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def _connect(self) -> _ReadConnection:
+        """
+        Open a connection that cannot write: the database is opened read-only
+        and queries are restricted to reading (query_only).
+        """
+        # Connections move between threads, but only one uses it at a time
+        conn = sqlite3.connect(
+            _read_only_uri(self.db_path), uri=True, check_same_thread=False
+        )
+        conn.execute("PRAGMA query_only=ON")
+        conn.execute(f"PRAGMA cache_size={READ_CACHE_SIZE}")
+        conn.execute(f"PRAGMA mmap_size={READ_MMAP_SIZE}")
+        conn.create_aggregate("hll_count", 1, HLLCount)
+        conn.create_aggregate("ddsketch_merge", 1, DDSketchMerge)
+        schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        return _ReadConnection(conn, schema_version)
+
+    def _checkout(self) -> _ReadConnection:
+        with self.pool_lock:
+            read_connection = self.pool.pop() if self.pool else None
+        if read_connection is not None:
+            # Reopen after schema changes (migrations, new tables), rather
+            # than keep state built on the previous schema
+            conn = read_connection.conn
+            if (
+                conn.execute("PRAGMA schema_version").fetchone()[0]
+                == read_connection.schema_version
+            ):
+                return read_connection
+            conn.close()
+        return self._connect()
+
+    def _checkin(self, read_connection: _ReadConnection):
+        # Undo what callers may have set
+        read_connection.conn.row_factory = None
+        read_connection.conn.set_trace_callback(None)
+        with self.pool_lock:
+            if len(self.pool) < READ_POOL_SIZE:
+                self.pool.append(read_connection)
+                return
+        read_connection.conn.close()
+
+    @staticmethod
+    def _select_partitions(
+        conn: sqlite3.Connection,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        newest_first: bool = True,
+    ) -> List[Tuple[str, str]]:
+        """
+        (name, path) of the partitions that may hold points in [since,
+        until) (None being unbounded), none for databases created before
+        partitioning existed.
+        """
+        conditions = ["end > ?"]
+        params = [since or 0]
+        if until is not None:
+            conditions.append("start < ?")
+            params.append(until)
+        try:
+            return conn.execute(
+                f"SELECT name, path FROM main.partitions "
+                f"WHERE {' AND '.join(conditions)} "
+                f"ORDER BY start {'DESC' if newest_first else 'ASC'}",
+                params,
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Database created before partitioning existed
+            return []
+
+    def _partition_groups(
+        self, since: Optional[int] = None, until: Optional[int] = None
+    ) -> List[Tuple[List[Tuple[str, str]], bool]]:
+        """
+        The partitions that may hold points in [since, until), in groups
+        that can be attached at once, most recent first, as (partitions,
+        main_points) for _get_connection. Only the oldest group reads
+        main.points, which holds the points from before partitioning.
+        """
+        with self._get_connection(points=False) as conn:
+            partitions = self._select_partitions(conn, since, until)
+        groups = [
+            (partitions[start : start + MAX_READ_PARTITIONS], False)
+            for start in range(0, len(partitions), MAX_READ_PARTITIONS)
+        ] or [([], False)]
+        groups[-1] = (groups[-1][0], True)
+        return groups
+
+    def _read_points(
+        self,
+        sql: str,
+        params: List[Any],
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        newest_first: bool = True,
+        limit: Optional[int] = None,
+        row_factory: Optional[Callable] = None,
+    ) -> List[Any]:
+        """
+        Run a query over the ``points`` view, whose rows are ordered by
+        timestamp (descending if ``newest_first``), for each group of
+        partitions that may hold points in [since, until), and concatenate
+        the rows, in the same order since groups do not overlap. Stops once
+        ``limit`` rows are read, if given.
+        """
+        groups = self._partition_groups(since, until)
+        if not newest_first:
+            groups.reverse()
+        rows: List[Any] = []
+        for group in groups:
+            with self._get_connection(partitions=group) as conn:
+                conn.row_factory = row_factory
+                rows.extend(conn.execute(sql, params).fetchall())
+            if limit is not None and len(rows) >= limit:
+                break
+        return rows
+
+    def _attach_partitions(
+        self,
+        read_connection: _ReadConnection,
+        partitions: List[Tuple[str, str]],
+        main_points: bool = True,
+    ):
+        """
+        Attach ``partitions``, unless the connection already has exactly
+        those, and (re)create the ``points`` view over them, and over
+        main.points if ``main_points``.
+        """
+        names = tuple(name for name, _ in partitions)
+        if (names, main_points) == (
+            read_connection.partitions,
+            read_connection.main_points,
+        ):
+            return
+
+        conn = read_connection.conn
+        # Temporary objects are not written to the database, but query_only
+        # forbids them too
+        conn.execute("PRAGMA query_only=OFF")
+        try:
+            conn.execute("DROP VIEW IF EXISTS temp.points")
+            for name in read_connection.partitions:
+                conn.execute(f"DETACH DATABASE {partition_schema(name)}")
+            read_connection.partitions = ()
+            read_connection.main_points = True
+
+            if not partitions:
+                return
+            directory = os.path.dirname(self.db_path)
+            selects = (
+                [f"SELECT {POINTS_COLUMNS} FROM main.points"] if main_points else []
+            )
+            for name, path in partitions:
+                schema = partition_schema(name)
+                conn.execute(
+                    f"ATTACH DATABASE ? AS {schema}",
+                    (_read_only_uri(os.path.join(directory, path)),),
+                )
+                selects.append(f"SELECT {POINTS_COLUMNS} FROM {schema}.points")
+            # Temporary objects shadow main ones, so every query reading
+            # points reads the partitions instead
+            conn.execute(f"CREATE TEMP VIEW points AS {' UNION ALL '.join(selects)}")
+            read_connection.partitions = names
+            read_connection.main_points = main_points
+        finally:
+            conn.execute("PRAGMA query_only=ON")
+
+    def _watermark(self) -> Optional[tuple]:
+        """
+        The storage's watermark, as (generation, committed_at), or None for
+        databases written before it existed (cached results then only
+        expire).
+        """
+        with self._get_connection(points=False) as conn:
+            try:
+                return conn.execute(
+                    "SELECT generation, committed_at FROM watermark"
+                ).fetchone()
+            except sqlite3.OperationalError:
+                return None
 
     def _dict_factory(self, cursor, row):
-        """Convert row to dictionary."""
+        """Convert row to dictionary, formatting its timestamps."""
         columns = [col[0] for col in cursor.description]
-        return dict(zip(columns, row))
-
-    def _parse_tag_filter_expression(self, expression: str) -> Tuple[str, List[str]]:
+        result = dict(zip(columns, row))
+        for column in TIMESTAMP_COLUMNS.intersection(result):
+            if result[column] is not None:
+                result[column] = format_timestamp_ms(result[column])
+        return result
+
+    @staticmethod
+    def _since(hours: int) -> int:
+        """Timestamp (in ms) ``hours`` ago."""
+        return now_ms() - int(hours * HOUR_MS)
+
+    def _rollup_source(
+        self,
+        series_where: str,
+        series_params: List[Any],
+        since: Optional[int] = None,
+        resolution: Optional[int] = None,
+        metric_name: Optional[str] = None,
+        tag_filter: Optional[str] = None,
+    ) -> Tuple[str, List[Any]]:
         """
-        Parse complex tag filter expressions like:
-        - tag1:value1
-        - tag1:value1 OR tag2:value2
-        - tag1:value1 AND tag2:value2
-        - (tag1:value1 OR tag2:value2) AND -tag3:value3
-        - -tag1:value1
-
-        Returns (sql_condition, params_list)
+        Build a subquery returning per series aggregates (the rollup tables'
+        columns) of the series matching ``series_where``, for points at or
+        after ``since`` (all points if None).
+
+        The range is covered by the coarsest rollup whose buckets fit in it,
+        and in ``resolution`` if given (e.g. MINUTE_MS for per minute
+        results), then by finer rollups; only points before the first full
+        minute are aggregated from the points table. With a hot tier, the
+        minutes it holds are read from it instead (only those of
+        ``metric_name`` if given, and of the series matching ``tag_filter``,
+        which should also be part of ``series_where``).
+
+        Returns (sql, params)
         """
-        if not expression or not expression.strip():
-            return "1=1", []
-
-        # Clean up the expression
-        expression = expression.strip()
-
-        # Simple tokenizer
-        tokens = self._tokenize_tag_expression(expression)
-        if not tokens:
-            return "1=1", []
-
-        # Parse the expression into SQL
-        sql_condition, params = self._parse_tag_tokens(tokens)
-        return sql_condition, params
-
-    def _tokenize_tag_expression(self, expression: str) -> List[str]:
-        """Tokenize the tag filter expression."""
-        # Pattern to match: tag:value, operators, parentheses, negation
-        # Updated to handle more characters in tag names and values
-        pattern = r"(\(|\)|AND|OR|-?[a-zA-Z_][a-zA-Z0-9_.-]*:[^()\s]+|-?[a-zA-Z_][a-zA-Z0-9_.-]*)"
-        tokens = re.findall(pattern, expression, re.IGNORECASE)
-        return [token.strip() for token in tokens if token.strip()]
-
-    def _parse_tag_tokens(self, tokens: List[str]) -> Tuple[str, List[str]]:
-        """Parse tokenized expression into SQL condition."""
-        if not tokens:
-            return "1=1", []
+        series_condition = f"series_id IN (SELECT id FROM series WHERE {series_where})"
+        levels = [
+            (bucket_size, table)
+            for bucket_size, table in ROLLUPS
+            if not (resolution and resolution % bucket_size)
+        ]
+        parts = []
+        params: List[Any] = []
+
+        def cover(start: Optional[int], end: Optional[int], levels: list):
+            """Add parts for [start, end), None being unbounded."""
+            if start is not None and end is not None and start >= end:
+                return
+            if not levels:
+                conditions = [series_condition, "timestamp >= ?"]
+                params.extend([*series_params, start])
+                if end is not None:
+                    conditions.append("timestamp < ?")
+                    params.append(end)
+                parts.append(
+                    RAW_ROLLUP_SQL.format(where_clause=" AND ".join(conditions))
+                )
+                return
+
+            (bucket_size, table), finer = levels[0], levels[1:]
+            lower = None if start is None else -(-start // bucket_size) * bucket_size
+            upper = None if end is None else end // bucket_size * bucket_size
+            if lower is not None and upper is not None and lower >= upper:
+                cover(start, end, finer)
+                return
+            conditions = [series_condition]
+            params.extend(series_params)
+            if lower is not None:
+                conditions.append("bucket >= ?")
+                params.append(lower)
+            if upper is not None:
+                conditions.append("bucket < ?")
+                params.append(upper)
+            parts.append(
+                f"SELECT {ROLLUP_COLUMNS} FROM {table} WHERE {' AND '.join(conditions)}"
+            )
+            if lower is not None:
+                cover(start, lower, finer)
+            if upper is not None:
+                cover(upper, end, finer)
 
-        # Convert to postfix notation and then to SQL
-        try:
-            postfix = self._infix_to_postfix(tokens)
-            return self._postfix_to_sql(postfix)
-        except Exception:
-            # If parsing fails, fall back to simple single tag parsing
-            if len(tokens) == 1:
-                return self._parse_single_tag(tokens[0])
-            return "1=1", []
-
-    def _infix_to_postfix(self, tokens: List[str]) -> List[str]:
-        """Convert infix notation to postfix using Shunting Yard algorithm."""
-        precedence = {"OR": 1, "AND": 2}
-        stack = []
-        output = []
-
-        for token in tokens:
-            if self._is_tag_token(token):
-                output.append(token)
-            elif token.upper() in ["AND", "OR"]:
-                while (
-                    stack
-                    and stack[-1] != "("
-                    and stack[-1].upper() in precedence
-                    and precedence[stack[-1].upper()] >= precedence[token.upper()]
-                ):
-                    output.append(stack.pop())
-                stack.append(token.upper())
-            elif token == "(":
-                stack.append(token)
-            elif token == ")":
-                while stack and stack[-1] != "(":
-                    output.append(stack.pop())
-                if stack:
-                    stack.pop()  # Remove the '('
-
-        while stack:
-            output.append(stack.pop())
-
-        return output
-
-    def _postfix_to_sql(self, postfix: List[str]) -> Tuple[str, List[str]]:
-        """Convert postfix notation to SQL condition."""
-        stack = []
-        all_params = []
-
-        for token in postfix:
-            if self._is_tag_token(token):
-                condition, params = self._parse_single_tag(token)
-                stack.append(condition)
-                all_params.extend(params)
-            elif token.upper() == "AND":
-                if len(stack) >= 2:
-                    right = stack.pop()
-                    left = stack.pop()
-                    stack.append(f"({left} AND {right})")
-                elif len(stack) == 1:
-                    # If only one operand, just use it
-                    pass
-            elif token.upper() == "OR":
-                if len(stack) >= 2:
-                    right = stack.pop()
-                    left = stack.pop()
-                    stack.append(f"({left} OR {right})")
-                elif len(stack) == 1:
-                    # If only one operand, just use it
-                    pass
-
-        if stack:
-            return stack[0], all_params
-        return "1=1", []
-
-    def _is_tag_token(self, token: str) -> bool:
-        """Check if token is a tag (not an operator or parenthesis)."""
-        return token.upper() not in ["AND", "OR", "(", ")"] and (
-            ":" in token or token.startswith("-")
+        hot = self.hot_tier and self.hot_tier.aggregates(
+            since or 0, per_minute=resolution is not None, metric_name=metric_name
         )
+        cover(since, hot["since"] if hot else None, levels)
+        if hot and tag_filter:
+            # Spares SQLite the rows it would filter out anyway
+            hot["rows"] = self._filter_hot_rows(hot["rows"], tag_filter)
+        if hot:
+            params.extend([json.dumps(hot["rows"]), *series_params])
+            hot_where = f"series.id IN (SELECT id FROM series WHERE {series_where})"
+            parts.append(HOT_ROLLUP_SQL.format(where_clause=hot_where))
+
+        return " UNION ALL ".join(parts), params
+
+    @staticmethod
+    def _filter_hot_rows(rows: List[list], tag_filter: str) -> List[list]:
+        """The hot tier rows of the series matching ``tag_filter``."""
+        compiled = compile_tag_filter(tag_filter)
+        # Series of one tag set often appear many times
+        matches: Dict[Optional[str], bool] = {}
+        filtered = []
+        for row in rows:
+            tags = row[2]
+            match = matches.get(tags)
+            if match is None:
+                match = matches[tags] = compiled.matches(
+                    json.loads(tags) if tags else None
+                )
+            if match:
+                filtered.append(row)
+        return filtered
+
+    def _sketch_source(
+        self,
+        levels: tuple,
+        column: str,
+        series_where: str,
+        series_params: List[Any],
+        since: Optional[int] = None,
+    ) -> Tuple[str, List[Any]]:
+        """
+        Build a subquery returning the sketches (series_id, ``column``) of
+        the series matching ``series_where`` from ``since`` on (all if
+        None), from the tables of ``levels`` (SET_SKETCHES or
+        QUANTILE_SKETCHES): hourly sketches from the first full hour, minute
+        sketches before it. Sketches cannot be split, so the minute holding
+        ``since`` is included whole.
+
+        Returns (sql, params)
+        """
+        series_condition = f"series_id IN (SELECT id FROM series WHERE {series_where})"
+        (hour, hour_table), (minute, minute_table) = levels
+        if since is None:
+            sql = f"SELECT series_id, {column} FROM {hour_table} WHERE "
+            return sql + series_condition, list(series_params)
+
+        start = since // minute * minute
+        hour_start = -(-start // hour) * hour
+        sql = f"""
+            SELECT series_id, {column} FROM {hour_table}
+            WHERE {series_condition} AND bucket >= ?
+            UNION ALL
+            SELECT series_id, {column} FROM {minute_table}
+            WHERE {series_condition} AND bucket >= ? AND bucket < ?
+        """
+        return sql, [*series_params, hour_start, *series_params, start, hour_start]
+
+    @staticmethod
+    def _add_tag_filter(
+        tag_filter: Optional[str],
+        conditions: List[str],
+        params: List[Any],
+        series: str = "series",
+    ):
+        """
+        Add the condition of ``tag_filter`` (see TagFilter) on the series
+        table aliased ``series`` to ``conditions`` and ``params``, unless it
+        is empty.
+        """
+        compiled = compile_tag_filter(tag_filter) if tag_filter else None
+        if compiled:
+            condition, tag_params = compiled.to_sql(series)
+            conditions.append(condition)
+            params.extend(tag_params)
 
-    def _parse_single_tag(self, tag_token: str) -> Tuple[str, List[str]]:
-        """Parse a single tag token into SQL condition."""
-        # Handle negation
-        negated = tag_token.startswith("-")
-        if negated:
-            tag_token = tag_token[1:]
-
-        if ":" in tag_token:
-            # tag:value format
-            tag_key, tag_value = tag_token.split(":", 1)
-            condition = "json_extract(tags, '$.' || ?) = ?"
-            params = [tag_key, tag_value]
-        else:
-            # just tag key existence
-            tag_key = tag_token
-            condition = "json_extract(tags, '$.' || ?) IS NOT NULL"
-            params = [tag_key]
-
-        if negated:
-            if ":" in tag_token:
-                condition = f"NOT ({condition})"
-            else:
-                condition = "json_extract(tags, '$.' || ?) IS NULL"
-
-        return condition, params
-
+    @_cached
     def get_recent_metrics(self, limit: int = 50) -> List[Dict[str, Any]]:
         """Get recent metrics for dashboard."""
-        with self._get_connection() as conn:
-            conn.row_factory = self._dict_factory
-            cursor = conn.cursor()
-            cursor.execute(
-                """
+        rows = self.hot_tier and self.hot_tier.recent_rows(limit)
+        if rows:
+            columns = (
+                "metric_name",
+                "metric_type",
+                "value",
+                "string_value",
+                "sample_rate",
+                "tags",
+                "timestamp",
+            )
+            return [
+                {**dict(zip(columns, row)), "timestamp": format_timestamp_ms(row[6])}
+                for row in rows
+            ]
+
+        rows = self._read_points(
+            f"""
                 SELECT metric_name, metric_type, value, string_value, 
                        sample_rate, tags, timestamp
-                FROM raw_metrics 
+                FROM {POINTS_SERIES}
                 ORDER BY timestamp DESC 
                 LIMIT ?
             """,
-                (limit,),
-            )
-            return cursor.fetchall()
+            [limit],
+            limit=limit,
+            row_factory=self._dict_factory,
+        )
+        return rows[:limit]
 
+    @_cached
     def get_metrics_summary(self, hours: int = 24) -> Dict[str, int]:
         """Get count of metrics by type."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        with self._get_connection() as conn:
+        since = self._since(hours)
+        source, params = self._rollup_source("1=1", [], since)
+        with self._get_connection(since) as conn:
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT metric_type, COUNT(*) as count
-                FROM raw_metrics 
-                WHERE timestamp >= ?
+                f"""
+                SELECT metric_type, SUM(count) as count
+                FROM ({source}) AS rollup
+                JOIN series ON series.id = rollup.series_id
                 GROUP BY metric_type
             """,
-                (since.strftime("%Y-%m-%d %H:%M:%S"),),
+                params,
             )
 
             result = {"c": 0, "g": 0, "ms": 0, "s": 0}
@@ -196,54 +642,56 @@ class MetricsDB:
                 result[row[0]] = row[1]
             return result
 
+    @_cached
     def get_active_metrics(
         self, hours: int = 1, limit: int = 10
     ) -> List[Dict[str, Any]]:
         """Get most active metrics."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        with self._get_connection() as conn:
+        since = self._since(hours)
+        source, params = self._rollup_source("1=1", [], since)
+        params.append(limit)
+        with self._get_connection(since) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT metric_name, metric_type, COUNT(*) as event_count
-                FROM raw_metrics 
-                WHERE timestamp >= ?
+                f"""
+                SELECT metric_name, metric_type, SUM(count) as event_count
+                FROM ({source}) AS rollup
+                JOIN series ON series.id = rollup.series_id
                 GROUP BY metric_name, metric_type
                 ORDER BY event_count DESC
                 LIMIT ?
             """,
-                (since.strftime("%Y-%m-%d %H:%M:%S"), limit),
+                params,
             )
             return cursor.fetchall()
 
+    @_cached
     def get_counter_metrics(
         self, hours: int = 24, tag_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Get counter metrics with totals filtered by time range and optional tag filter."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        conditions = ["metric_type = 'c'", "timestamp >= ?"]
-        params = [since.strftime("%Y-%m-%d %H:%M:%S")]
+        conditions = ["metric_type = 'c'"]
+        params = []
 
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
+        self._add_tag_filter(tag_filter, conditions, params)
 
-        where_clause = " AND ".join(conditions)
+        since = self._since(hours)
+        source, params = self._rollup_source(
+            " AND ".join(conditions), params, since, tag_filter=tag_filter
+        )
 
-        with self._get_connection() as conn:
+        with self._get_connection(since) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
                 f"""
-                SELECT metric_name, 
-                       SUM(value / sample_rate) as total_count,
-                       COUNT(*) as event_count,
-                       MAX(timestamp) as last_seen
-                FROM raw_metrics 
-                WHERE {where_clause}
+                SELECT metric_name,
+                       SUM(total_scaled) as total_count,
+                       SUM(count) as event_count,
+                       MAX(last_timestamp) as last_seen
+                FROM ({source}) AS rollup
+                JOIN series ON series.id = rollup.series_id
                 GROUP BY metric_name
                 ORDER BY total_count DESC
             """,
@@ -251,38 +699,36 @@ class MetricsDB:
             )
             return cursor.fetchall()
 
+    @_cached
     def get_counter_timeseries(
         self, metric_name: str, hours: int = 24, tag_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Get counter events over time (per minute)."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        conditions = ["metric_type = 'c'", "metric_name = ?", "timestamp >= ?"]
-        params = [metric_name, since.strftime("%Y-%m-%d %H:%M:%S")]
+        conditions = ["metric_type = 'c'", "metric_name = ?"]
+        params = [metric_name]
 
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
+        self._add_tag_filter(tag_filter, conditions, params)
 
-        where_clause = " AND ".join(conditions)
+        since = self._since(hours)
+        source, params = self._rollup_source(
+            " AND ".join(conditions), params, since, MINUTE_MS, tag_filter=tag_filter
+        )
 
-        with self._get_connection() as conn:
+        with self._get_connection(since) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
                 f"""
-                SELECT strftime('%Y-%m-%d %H:%M:00', timestamp) as minute,
-                       SUM(value / sample_rate) as count
-                FROM raw_metrics 
-                WHERE {where_clause}
-                GROUP BY minute
-                ORDER BY minute
+                SELECT bucket as minute, SUM(total_scaled) as count
+                FROM ({source})
+                GROUP BY bucket
+                ORDER BY bucket
             """,
                 params,
             )
             return cursor.fetchall()
 
+    @_cached
     def get_gauge_metrics(
         self, hours: int = None, tag_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
@@ -290,192 +736,240 @@ class MetricsDB:
         conditions = ["metric_type = 'g'"]
         params = []
 
-        if hours:
-            since = datetime.utcnow() - timedelta(hours=hours)
-            conditions.append("timestamp >= ?")
-            params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
-
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
-
-        subquery_where = " AND ".join(conditions)
-        outer_conditions = ["r1.metric_type = 'g'"]
-        outer_params = []
+        self._add_tag_filter(tag_filter, conditions, params)
 
         if hours:
-            outer_conditions.append("r1.timestamp >= ?")
-            outer_params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
-
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                outer_conditions.append(tag_condition.replace("tags", "r1.tags"))
-                outer_params.extend(tag_params)
+            conditions.append("gauge_current.timestamp >= ?")
+            params.append(self._since(hours))
 
-        outer_where = " AND ".join(outer_conditions)
-        all_params = params + outer_params
+        where_clause = " AND ".join(conditions)
 
-        with self._get_connection() as conn:
+        # gauge_current holds the latest value of each series, so only one
+        # row per series is read
+        with self._get_connection(points=False) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
+            # SQLite takes the bare columns of an aggregate query from the row
+            # holding the MAX(), i.e. the latest series of each metric
             cursor.execute(
                 f"""
-                SELECT r1.metric_name, r1.value, r1.timestamp
-                FROM raw_metrics r1
-                INNER JOIN (
-                    SELECT metric_name, MAX(timestamp) as max_timestamp
-                    FROM raw_metrics 
-                    WHERE {subquery_where}
-                    GROUP BY metric_name
-                ) r2 ON r1.metric_name = r2.metric_name 
-                    AND r1.timestamp = r2.max_timestamp
-                WHERE {outer_where}
-                ORDER BY r1.metric_name
+                SELECT metric_name, value,
+                       MAX(gauge_current.timestamp) as timestamp
+                FROM series
+                JOIN gauge_current ON gauge_current.series_id = series.id
+                WHERE {where_clause}
+                GROUP BY metric_name
+                ORDER BY metric_name
             """,
-                all_params,
+                params,
             )
             return cursor.fetchall()
 
+    @_cached
     def get_gauge_timeseries(
         self, metric_name: str, hours: int = 24, tag_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
         """Get gauge values over time."""
-        since = datetime.utcnow() - timedelta(hours=hours)
+        since = self._since(hours)
         conditions = ["metric_type = 'g'", "metric_name = ?", "timestamp >= ?"]
-        params = [metric_name, since.strftime("%Y-%m-%d %H:%M:%S")]
+        params = [metric_name, since]
 
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
+        self._add_tag_filter(tag_filter, conditions, params)
 
         where_clause = " AND ".join(conditions)
 
-        with self._get_connection() as conn:
-            conn.row_factory = self._dict_factory
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
+        return self._read_points(
+            f"""
                 SELECT timestamp, value
-                FROM raw_metrics 
+                FROM {SERIES_POINTS}
                 WHERE {where_clause}
                 ORDER BY timestamp
             """,
-                params,
-            )
-            return cursor.fetchall()
+            params,
+            since,
+            newest_first=False,
+            row_factory=self._dict_factory,
+        )
 
+    @_cached
     def get_timer_metrics(
         self, hours: int = None, tag_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Get timer metrics with basic stats filtered by time range and optional tag filter."""
+        """
+        Get timer metrics with basic stats and TIMER_QUANTILES filtered by
+        time range and optional tag filter. Quantiles are estimated within
+        1% from the quantile sketches, over whole minutes.
+        """
         conditions = ["metric_type = 'ms'"]
         params = []
 
-        if hours:
-            since = datetime.utcnow() - timedelta(hours=hours)
-            conditions.append("timestamp >= ?")
-            params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+        self._add_tag_filter(tag_filter, conditions, params)
 
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
-
-        where_clause = " AND ".join(conditions)
+        since = self._since(hours) if hours else None
+        series_where = " AND ".join(conditions)
+        source, source_params = self._rollup_source(
+            series_where, params, since, tag_filter=tag_filter
+        )
+        sketches, sketch_params = self._sketch_source(
+            QUANTILE_SKETCHES, "sketch", series_where, params, since
+        )
 
-        with self._get_connection() as conn:
+        # Without a time range, only the rollups and sketches are read
+        with self._get_connection(since, points=since is not None) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
                 f"""
-                SELECT metric_name,
-                       AVG(value) as avg_value,
-                       MIN(value) as min_value,
-                       MAX(value) as max_value,
-                       COUNT(*) as event_count,
-                       MAX(timestamp) as last_seen
-                FROM raw_metrics 
-                WHERE {where_clause}
-                GROUP BY metric_name
+                WITH stats AS (
+                    SELECT metric_name,
+                           SUM(total) / SUM(count) as avg_value,
+                           MIN(min_value) as min_value,
+                           MAX(max_value) as max_value,
+                           SUM(count) as event_count,
+                           MAX(last_timestamp) as last_seen
+                    FROM ({source}) AS rollup
+                    JOIN series ON series.id = rollup.series_id
+                    GROUP BY metric_name
+                ), quantiles AS (
+                    SELECT metric_name, ddsketch_merge(sketch) as sketch
+                    FROM ({sketches}) AS sketch
+                    JOIN series ON series.id = sketch.series_id
+                    GROUP BY metric_name
+                )
+                SELECT stats.*, quantiles.sketch
+                FROM stats LEFT JOIN quantiles USING (metric_name)
                 ORDER BY avg_value DESC
             """,
-                params,
+                source_params + sketch_params,
             )
-            return cursor.fetchall()
+            rows = cursor.fetchall()
+
+        for row in rows:
+            sketch = row.pop("sketch")
+            values = (
+                DDSketch.from_bytes(sketch).quantiles(q for _, q in TIMER_QUANTILES)
+                if sketch
+                else [None] * len(TIMER_QUANTILES)
+            )
+            row.update(zip((column for column, _ in TIMER_QUANTILES), values))
+        return rows
+
+    @_cached
+    def get_timer_histogram(
+        self,
+        metric_name: str,
+        hours: int = 24,
+        tag_filter: Optional[str] = None,
+        bins: int = 20,
+    ) -> List[Dict[str, Any]]:
+        """
+        Get a timer's distribution as ``bins`` equal width bins ({"start",
+        "end", "count"}), from its quantile sketches over whole minutes.
+        """
+        conditions = ["metric_type = 'ms'", "metric_name = ?"]
+        params = [metric_name]
+
+        self._add_tag_filter(tag_filter, conditions, params)
 
+        since = self._since(hours)
+        sketches, params = self._sketch_source(
+            QUANTILE_SKETCHES, "sketch", " AND ".join(conditions), params, since
+        )
+
+        with self._get_connection(points=False) as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT ddsketch_merge(sketch) FROM ({sketches}) AS sketch", params
+            )
+            sketch = DDSketch.from_bytes(cursor.fetchone()[0])
+        return [
+            {"start": start, "end": end, "count": count}
+            for start, end, count in sketch.histogram(bins)
+        ]
+
+    @_cached
     def get_timer_values(
         self, metric_name: str, hours: int = 24, tag_filter: Optional[str] = None
     ) -> List[float]:
         """Get timer values for histogram."""
-        since = datetime.utcnow() - timedelta(hours=hours)
+        since = self._since(hours)
         conditions = ["metric_type = 'ms'", "metric_name = ?", "timestamp >= ?"]
-        params = [metric_name, since.strftime("%Y-%m-%d %H:%M:%S")]
+        params = [metric_name, since]
 
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
+        self._add_tag_filter(tag_filter, conditions, params)
 
         where_clause = " AND ".join(conditions)
 
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
+        rows = self._read_points(
+            f"""
                 SELECT value
-                FROM raw_metrics 
+                FROM {SERIES_POINTS}
                 WHERE {where_clause}
                 ORDER BY timestamp
             """,
-                params,
-            )
-            return [row[0] for row in cursor.fetchall()]
+            params,
+            since,
+            newest_first=False,
+        )
+        return [row[0] for row in rows]
 
+    @_cached
     def get_set_metrics(
         self, hours: int = None, tag_filter: Optional[str] = None
     ) -> List[Dict[str, Any]]:
-        """Get set metrics with unique counts filtered by time range and optional tag filter."""
+        """
+        Get set metrics with unique counts filtered by time range and optional
+        tag filter. Unique counts are HyperLogLog estimates (about 1.6%
+        standard error) merged from the set sketches.
+        """
         conditions = ["metric_type = 's'"]
         params = []
 
-        if hours:
-            since = datetime.utcnow() - timedelta(hours=hours)
-            conditions.append("timestamp >= ?")
-            params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+        # Points may not hold every set event (see MetricsStorage's
+        # set_members), so both counts cover whole minutes, from the one
+        # holding the start of the range
+        since = self._since(hours) // MINUTE_MS * MINUTE_MS if hours else None
 
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
+        self._add_tag_filter(tag_filter, conditions, params)
 
-        where_clause = " AND ".join(conditions)
+        series_where = " AND ".join(conditions)
+        source, source_params = self._rollup_source(
+            series_where, params, since, tag_filter=tag_filter
+        )
+        sketches, sketch_params = self._sketch_source(
+            SET_SKETCHES, "registers", series_where, params, since
+        )
 
-        with self._get_connection() as conn:
+        with self._get_connection(since) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
                 f"""
+                WITH counts AS (
+                    SELECT metric_name,
+                           SUM(count) as event_count,
+                           MAX(last_timestamp) as last_seen
+                    FROM ({source}) AS rollup
+                    JOIN series ON series.id = rollup.series_id
+                    GROUP BY metric_name
+                ), uniques AS (
+                    SELECT metric_name, hll_count(registers) as unique_count
+                    FROM ({sketches}) AS sketch
+                    JOIN series ON series.id = sketch.series_id
+                    GROUP BY metric_name
+                )
                 SELECT metric_name,
-                       COUNT(DISTINCT string_value) as unique_count,
-                       COUNT(*) as event_count,
-                       MAX(timestamp) as last_seen
-                FROM raw_metrics 
-                WHERE {where_clause}
-                GROUP BY metric_name
+                       IFNULL(unique_count, 0) as unique_count,
+                       event_count,
+                       last_seen
+                FROM counts LEFT JOIN uniques USING (metric_name)
                 ORDER BY unique_count DESC
             """,
-                params,
+                source_params + sketch_params,
             )
             return cursor.fetchall()
 
+    @_cached
     def get_set_members(
         self,
         metric_name: str,
@@ -483,50 +977,61 @@ class MetricsDB:
         hours: int = None,
         tag_filter: Optional[str] = None,
     ) -> List[str]:
-        """Get recent unique set members filtered by time range and optional tag filter."""
+        """
+        Get recent unique set members filtered by time range and optional tag
+        filter, from the members kept as points (see the ``set_members``
+        option of MetricsStorage).
+        """
         conditions = ["metric_type = 's'", "metric_name = ?"]
         params = [metric_name]
 
-        if hours:
-            since = datetime.utcnow() - timedelta(hours=hours)
+        since = self._since(hours) if hours else None
+        if since:
             conditions.append("timestamp >= ?")
-            params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+            params.append(since)
 
-        if tag_filter:
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":
-                conditions.append(tag_condition)
-                params.extend(tag_params)
+        self._add_tag_filter(tag_filter, conditions, params)
 
         where_clause = " AND ".join(conditions)
         params.append(limit)
 
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
+        rows = self._read_points(
+            f"""
                 SELECT DISTINCT string_value
-                FROM raw_metrics 
+                FROM {SERIES_POINTS}
                 WHERE {where_clause}
                 ORDER BY timestamp DESC
                 LIMIT ?
             """,
-                params,
-            )
-            return [row[0] for row in cursor.fetchall()]
+            params,
+            since,
+        )
+        # Members may repeat across partition groups
+        return list(dict.fromkeys(row[0] for row in rows))[:limit]
 
     def get_raw_metrics(
         self,
         limit: int = 100,
-        offset: int = 0,
+        cursor: Optional[str] = None,
         metric_name: Optional[str] = None,
         metric_type: Optional[str] = None,
         hours: Optional[int] = None,
         tag_filter: Optional[str] = None,
-    ) -> List[Dict[str, Any]]:
-        """Get raw metrics with filtering."""
+    ) -> Dict[str, Any]:
+        """
+        Get a page of raw metrics with filtering, most recent first.
+
+        Pages are read from a position in the (timestamp, id) order rather
+        than an offset, so every page costs the same: ``cursor`` is the
+        "next" or "prev" token of the current page (the first page if None).
+
+        Returns {"rows": [...], "next": token, "prev": token}, where a token
+        is None if there is no such page.
+        """
+        position = _decode_cursor(cursor) if cursor else None
+        older = position is None or position[0] == _OLDER
         conditions = []
-        params = []
+        params: List[Any] = []
 
         if metric_name:
             conditions.append("metric_name LIKE ?")
@@ -536,85 +1041,121 @@ class MetricsDB:
             conditions.append("metric_type = ?")
             params.append(metric_type)
 
-        if hours:
-            since = datetime.utcnow() - timedelta(hours=hours)
+        since = self._since(hours) if hours else None
+        if since:
             conditions.append("timestamp >= ?")
-            params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
+            params.append(since)
 
-        if tag_filter:
-            # Parse complex tag filter expression
-            tag_condition, tag_params = self._parse_tag_filter_expression(tag_filter)
-            if tag_condition != "1=1":  # Only add if it's not a no-op
-                conditions.append(tag_condition)
-                params.extend(tag_params)
+        self._add_tag_filter(tag_filter, conditions, params)
 
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-        params.extend([limit, offset])
+        if position is not None:
+            # The first condition is a range of the timestamp index, whose
+            # entries end with the id
+            _, timestamp, point_id = position
+            if older:
+                conditions.append("timestamp <= ? AND (timestamp < ? OR points.id < ?)")
+            else:
+                conditions.append("timestamp >= ? AND (timestamp > ? OR points.id > ?)")
+            params.extend([timestamp, timestamp, point_id])
 
-        with self._get_connection() as conn:
-            conn.row_factory = self._dict_factory
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        order = "DESC" if older else "ASC"
+        # One more row tells whether there is a page after this one
+        params.append(limit + 1)
+
+        # Only the partitions on this side of the position are read
+        start, end = since, None
+        if position is not None:
+            if older:
+                end = position[1] + 1
+            else:
+                start = max(since or 0, position[1])
+        rows = self._read_points(
+            f"""
                 SELECT metric_name, metric_type, value, string_value,
-                       sample_rate, tags, timestamp
-                FROM raw_metrics 
+                       sample_rate, tags, timestamp,
+                       points.id AS id, points.timestamp AS position
+                FROM {POINTS_SERIES}
                 WHERE {where_clause}
-                ORDER BY timestamp DESC
-                LIMIT ? OFFSET ?
+                ORDER BY timestamp {order}, points.id {order}
+                LIMIT ?
             """,
-                params,
-            )
-            return cursor.fetchall()
+            params,
+            start,
+            end,
+            newest_first=older,
+            limit=limit + 1,
+            row_factory=self._dict_factory,
+        )
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if not older:
+            if not more:
+                # Back to the most recent rows: the first page, in full
+                return self.get_raw_metrics(
+                    limit, None, metric_name, metric_type, hours, tag_filter
+                )
+            rows.reverse()
+
+        positions = [(row["id"], row.pop("position")) for row in rows]
+        has_next = bool(rows) and (more or not older)
+        has_prev = bool(rows) and position is not None
+        return {
+            "rows": rows,
+            "next": _encode_cursor(_OLDER, *positions[-1]) if has_next else None,
+            "prev": _encode_cursor(_NEWER, *positions[0]) if has_prev else None,
+        }
 
     # Tag-related queries
+    @_cached
     def get_all_tag_keys(self) -> List[str]:
         """Get all unique tag keys across all metrics."""
-        with self._get_connection() as conn:
+        with self._get_connection(points=False) as conn:
             cursor = conn.cursor()
-            # Use SQLite JSON functions to extract all keys
-            cursor.execute("""
-                SELECT DISTINCT json_each.key
-                FROM raw_metrics, json_each(raw_metrics.tags)
-                WHERE tags IS NOT NULL AND tags != 'null'
-                ORDER BY json_each.key
-            """)
+            # series_tags is ordered by key
+            cursor.execute("SELECT DISTINCT key FROM series_tags ORDER BY key")
             return [row[0] for row in cursor.fetchall()]
 
+    @_cached
     def get_tag_values(self, tag_key: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Get all values for a specific tag key with counts."""
-        with self._get_connection() as conn:
+        with self._get_connection(points=False) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT json_extract(tags, '$.' || ?) as tag_value,
-                       COUNT(*) as count,
-                       MAX(timestamp) as last_seen
-                FROM raw_metrics
-                WHERE tags IS NOT NULL 
-                  AND json_extract(tags, '$.' || ?) IS NOT NULL
+                f"""
+                SELECT series_tags.value as tag_value,
+                       SUM(rollup.count) as count,
+                       MAX(rollup.last_timestamp) as last_seen
+                FROM series_tags
+                CROSS JOIN {ROLLUPS[0][1]} AS rollup
+                  ON rollup.series_id = series_tags.series_id
+                WHERE series_tags.key = ?
                 GROUP BY tag_value
                 ORDER BY count DESC
                 LIMIT ?
             """,
-                (tag_key, tag_key, limit),
+                (tag_key, limit),
             )
             return cursor.fetchall()
 
+    @_cached
     def get_top_tag_combinations(self, limit: int = 20) -> List[Dict[str, Any]]:
         """Get most common tag combinations."""
-        with self._get_connection() as conn:
+        with self._get_connection(points=False) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT tags,
-                       COUNT(*) as count,
-                       MAX(timestamp) as last_seen
-                FROM raw_metrics
-                WHERE tags IS NOT NULL AND tags != 'null' AND tags != '{}'
-                GROUP BY tags
+                f"""
+                SELECT series.tags,
+                       SUM(rollup.count) as count,
+                       MAX(rollup.last_timestamp) as last_seen
+                FROM series
+                CROSS JOIN {ROLLUPS[0][1]} AS rollup
+                  ON rollup.series_id = series.id
+                WHERE tags IS NOT NULL AND tags != 'null' AND tags != '{{}}'
+                GROUP BY series.tags
                 ORDER BY count DESC
                 LIMIT ?
             """,
@@ -622,96 +1163,107 @@ class MetricsDB:
             )
             return cursor.fetchall()
 
+    @_cached
     def get_recent_tagged_metrics(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Get recent metrics that have tags."""
-        with self._get_connection() as conn:
-            conn.row_factory = self._dict_factory
-            cursor = conn.cursor()
-            cursor.execute(
-                """
+        rows = self._read_points(
+            f"""
                 SELECT metric_name, metric_type, value, string_value,
                        sample_rate, tags, timestamp
-                FROM raw_metrics
-                WHERE tags IS NOT NULL AND tags != 'null' AND tags != '{}'
+                FROM {POINTS_SERIES}
+                WHERE tags IS NOT NULL AND tags != 'null' AND tags != '{{}}'
                 ORDER BY timestamp DESC
                 LIMIT ?
             """,
-                (limit,),
-            )
-            return cursor.fetchall()
+            [limit],
+            limit=limit,
+            row_factory=self._dict_factory,
+        )
+        return rows[:limit]
 
+    @_cached
     def get_counter_timeseries_by_tag(
         self, metric_name: str, tag_key: str, hours: int = 24
     ) -> List[Dict[str, Any]]:
         """Get counter time series grouped by tag value."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        with self._get_connection() as conn:
+        since = self._since(hours)
+        has_tag, tag_params = tag_condition(tag_key)
+        source, params = self._rollup_source(
+            f"metric_type = 'c' AND metric_name = ? AND {has_tag}",
+            [metric_name, *tag_params],
+            since,
+            MINUTE_MS,
+        )
+        with self._get_connection(since) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT strftime('%Y-%m-%d %H:%M:00', timestamp) as minute,
-                       json_extract(tags, '$.' || ?) as tag_value,
-                       SUM(value / sample_rate) as count
-                FROM raw_metrics 
-                WHERE metric_type = 'c' 
-                  AND metric_name = ?
-                  AND timestamp >= ?
-                  AND json_extract(tags, '$.' || ?) IS NOT NULL
+                f"""
+                SELECT bucket as minute,
+                       series_tags.value as tag_value,
+                       SUM(total_scaled) as count
+                FROM ({source}) AS rollup
+                JOIN series_tags ON series_tags.series_id = rollup.series_id
+                WHERE series_tags.key = ?
                 GROUP BY minute, tag_value
                 ORDER BY minute, tag_value
             """,
-                (tag_key, metric_name, since.strftime("%Y-%m-%d %H:%M:%S"), tag_key),
+                [*params, tag_key],
             )
             return cursor.fetchall()
 
+    @_cached
     def get_gauge_timeseries_by_tag(
         self, metric_name: str, tag_key: str, hours: int = 24
     ) -> List[Dict[str, Any]]:
         """Get gauge time series grouped by tag value."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        with self._get_connection() as conn:
-            conn.row_factory = self._dict_factory
-            cursor = conn.cursor()
-            cursor.execute(
-                """
+        since = self._since(hours)
+        return self._read_points(
+            """
                 SELECT timestamp,
-                       json_extract(tags, '$.' || ?) as tag_value,
-                       value
-                FROM raw_metrics 
-                WHERE metric_type = 'g' 
+                       series_tags.value as tag_value,
+                       points.value
+                FROM series
+                CROSS JOIN series_tags ON series_tags.series_id = series.id
+                CROSS JOIN points ON points.series_id = series.id
+                WHERE metric_type = 'g'
                   AND metric_name = ?
                   AND timestamp >= ?
-                  AND json_extract(tags, '$.' || ?) IS NOT NULL
+                  AND series_tags.key = ?
                 ORDER BY timestamp, tag_value
             """,
-                (tag_key, metric_name, since.strftime("%Y-%m-%d %H:%M:%S"), tag_key),
-            )
-            return cursor.fetchall()
+            [metric_name, since, tag_key],
+            since,
+            newest_first=False,
+            row_factory=self._dict_factory,
+        )
 
+    @_cached
     def get_timer_values_by_tag(
         self, metric_name: str, tag_key: str, hours: int = 24
     ) -> List[Dict[str, Any]]:
         """Get timer values grouped by tag value."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        with self._get_connection() as conn:
-            conn.row_factory = self._dict_factory
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT json_extract(tags, '$.' || ?) as tag_value,
-                       value
-                FROM raw_metrics 
-                WHERE metric_type = 'ms' 
+        since = self._since(hours)
+        return self._read_points(
+            """
+                SELECT series_tags.value as tag_value,
+                       points.value
+                FROM series
+                CROSS JOIN series_tags ON series_tags.series_id = series.id
+                CROSS JOIN points ON points.series_id = series.id
+                WHERE metric_type = 'ms'
                   AND metric_name = ?
                   AND timestamp >= ?
-                  AND json_extract(tags, '$.' || ?) IS NOT NULL
+                  AND series_tags.key = ?
                 ORDER BY timestamp
             """,
-                (tag_key, metric_name, since.strftime("%Y-%m-%d %H:%M:%S"), tag_key),
-            )
-            return cursor.fetchall()
+            [metric_name, since, tag_key],
+            since,
+            newest_first=False,
+            row_factory=self._dict_factory,
+        )
 
+    @_cached
     def get_metrics_by_tag_filter(
         self,
         tag_key: str,
@@ -720,9 +1272,10 @@ class MetricsDB:
         hours: int = 24,
     ) -> List[Dict[str, Any]]:
         """Get metrics filtered by specific tag key=value."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        conditions = ["timestamp >= ?", "json_extract(tags, '$.' || ?) = ?"]
-        params = [since.strftime("%Y-%m-%d %H:%M:%S"), tag_key, tag_value]
+        since = self._since(hours)
+        has_tag, tag_params = tag_condition(tag_key, tag_value)
+        conditions = ["timestamp >= ?", has_tag]
+        params = [since, *tag_params]
 
         if metric_type:
             conditions.append("metric_type = ?")
@@ -730,40 +1283,43 @@ class MetricsDB:
 
         where_clause = " AND ".join(conditions)
 
-        with self._get_connection() as conn:
-            conn.row_factory = self._dict_factory
-            cursor = conn.cursor()
-            cursor.execute(
-                f"""
+        rows = self._read_points(
+            f"""
                 SELECT metric_name, metric_type, value, string_value,
                        sample_rate, tags, timestamp
-                FROM raw_metrics
+                FROM {SERIES_POINTS}
                 WHERE {where_clause}
                 ORDER BY timestamp DESC
                 LIMIT 1000
             """,
-                params,
-            )
-            return cursor.fetchall()
+            params,
+            since,
+            limit=1000,
+            row_factory=self._dict_factory,
+        )
+        return rows[:1000]
 
+    @_cached
     def get_tag_summary(self, hours: int = 24) -> List[Dict[str, Any]]:
         """Get summary of tag usage."""
-        since = datetime.utcnow() - timedelta(hours=hours)
-        with self._get_connection() as conn:
+        since = self._since(hours)
+        source, params = self._rollup_source(
+            "tags IS NOT NULL AND tags != 'null'", [], since
+        )
+        with self._get_connection(since) as conn:
             conn.row_factory = self._dict_factory
             cursor = conn.cursor()
             cursor.execute(
-                """
-                SELECT json_each.key as tag_key,
-                       COUNT(*) as usage_count,
-                       COUNT(DISTINCT json_each.value) as unique_values,
-                       MAX(timestamp) as last_seen
-                FROM raw_metrics, json_each(raw_metrics.tags)
-                WHERE timestamp >= ?
-                  AND tags IS NOT NULL AND tags != 'null'
-                GROUP BY json_each.key
+                f"""
+                SELECT series_tags.key as tag_key,
+                       SUM(rollup.count) as usage_count,
+                       COUNT(DISTINCT series_tags.value) as unique_values,
+                       MAX(rollup.last_timestamp) as last_seen
+                FROM ({source}) AS rollup
+                JOIN series_tags ON series_tags.series_id = rollup.series_id
+                GROUP BY series_tags.key
                 ORDER BY usage_count DESC
             """,
-                (since.strftime("%Y-%m-%d %H:%M:%S"),),
+                params,
             )
             return cursor.fetchall()
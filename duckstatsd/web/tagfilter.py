@@ -0,0 +1,221 @@
+import functools
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Compiled filters kept for reuse, by expression
+TAG_FILTER_CACHE_SIZE = 256
+
+# Parentheses, operators (whole words only, so "origin:us" or "android" stay
+# tags) and tags: key:value, key (has the tag), each optionally negated with
+# a leading "-"
+_TOKEN_PATTERN = re.compile(
+    r"(\(|\)|(?:AND|OR)(?=[\s()]|$)"
+    r"|-?[a-zA-Z_][a-zA-Z0-9_.-]*:[^()\s]+|-?[a-zA-Z_][a-zA-Z0-9_.-]*)",
+    re.IGNORECASE,
+)
+
+# Series having the tag key (and value); series_tags' primary key starts with
+# (key, value), so both are index lookups
+_TAG_SQL = "{series}.id IN (SELECT series_id FROM series_tags WHERE key = ?)"
+_TAG_VALUE_SQL = (
+    "{series}.id IN (SELECT series_id FROM series_tags WHERE key = ? AND value = ?)"
+)
+
+Tags = Dict[str, str]
+Predicate = Callable[[Tags], bool]
+
+
+class _Tag:
+    """Series tagged ``key``, with ``value`` unless it is None."""
+
+    __slots__ = ("key", "value")
+
+    def __init__(self, key: str, value: Optional[str]):
+        self.key = key
+        self.value = value
+
+    def sql(self, series: str) -> Tuple[str, List[str]]:
+        if self.value is None:
+            return _TAG_SQL.format(series=series), [self.key]
+        return _TAG_VALUE_SQL.format(series=series), [self.key, self.value]
+
+    def predicate(self) -> Predicate:
+        key, value = self.key, self.value
+        if value is None:
+            return lambda tags: key in tags
+        return lambda tags: tags.get(key) == value
+
+
+class _Not:
+    __slots__ = ("operand",)
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def sql(self, series: str) -> Tuple[str, List[str]]:
+        # Every condition is true or false (never NULL), so NOT is exact
+        sql, params = self.operand.sql(series)
+        return f"NOT ({sql})", params
+
+    def predicate(self) -> Predicate:
+        operand = self.operand.predicate()
+        return lambda tags: not operand(tags)
+
+
+class _And:
+    __slots__ = ("operands",)
+
+    # SQL operator, and the Python function combining the operands' results
+    operator = "AND"
+    combine = all
+
+    def __init__(self, operands: list):
+        self.operands = operands
+
+    def sql(self, series: str) -> Tuple[str, List[str]]:
+        conditions = []
+        params: List[str] = []
+        for operand in self.operands:
+            sql, operand_params = operand.sql(series)
+            conditions.append(sql)
+            params.extend(operand_params)
+        return f"({f' {self.operator} '.join(conditions)})", params
+
+    def predicate(self) -> Predicate:
+        predicates = [operand.predicate() for operand in self.operands]
+        combine = type(self).combine
+        return lambda tags: combine(predicate(tags) for predicate in predicates)
+
+
+class _Or(_And):
+    __slots__ = ()
+
+    operator = "OR"
+    combine = any
+
+
+class _Parser:
+    """
+    Recursive descent parser of tokenized expressions, where AND binds
+    tighter than OR and adjacent terms are ANDed. Malformed input is
+    tolerated: dangling operators and unbalanced parentheses are ignored.
+    """
+
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> Optional[str]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def parse(self):
+        node = self.parse_or()
+        while self.peek() is not None:
+            # Only left over after an unmatched ")"
+            self.position += 1
+            node = self.combine(_And, node, self.parse_or())
+        return node
+
+    @staticmethod
+    def combine(kind, left, right):
+        if left is None or right is None:
+            return left if right is None else right
+        operands = left.operands if type(left) is kind else [left]
+        return kind([*operands, right])
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() is not None and self.peek().upper() == "OR":
+            self.position += 1
+            node = self.combine(_Or, node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = None
+        while True:
+            token = self.peek()
+            if token is None or token == ")" or token.upper() == "OR":
+                return node
+            if token.upper() == "AND":
+                self.position += 1
+                continue
+            node = self.combine(_And, node, self.parse_term())
+
+    def parse_term(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        if token == "(":
+            node = self.parse_or()
+            if self.peek() == ")":
+                self.position += 1
+            return node
+        negated = token.startswith("-")
+        key, _, value = token.lstrip("-").partition(":")
+        node = _Tag(key, value or None)
+        return _Not(node) if negated else node
+
+
+class TagFilter:
+    """
+    A compiled tag filter expression, such as
+    ``(env:dev OR env:staging) AND -status:error``: ``key:value`` matches
+    series with that tag, ``key`` series with the tag key, ``-`` negates.
+
+    It can be evaluated in SQL, as a condition on the series table, or in
+    Python against a tag dict. Filters are immutable; get them from
+    compile_tag_filter(), which caches them.
+    """
+
+    __slots__ = ("expression", "root", "statements", "predicate")
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        tokens = _TOKEN_PATTERN.findall(expression)
+        self.root = _Parser(tokens).parse() if tokens else None
+        # (sql, params) by series table alias
+        self.statements: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+        self.predicate: Optional[Predicate] = (
+            self.root.predicate() if self.root is not None else None
+        )
+
+    def __bool__(self) -> bool:
+        """False for expressions without any tag, which match everything."""
+        return self.root is not None
+
+    def to_sql(self, series: str = "series") -> Tuple[str, List[str]]:
+        """
+        The condition on the ``series`` table (or alias) and its parameters.
+        """
+        statement = self.statements.get(series)
+        if statement is None:
+            if self.root is None:
+                statement = ("1=1", ())
+            else:
+                sql, params = self.root.sql(series)
+                statement = (sql, tuple(params))
+            self.statements[series] = statement
+        return statement[0], list(statement[1])
+
+    def matches(self, tags: Optional[Tags]) -> bool:
+        """Whether a series with ``tags`` (None if untagged) passes."""
+        if self.predicate is None:
+            return True
+        return self.predicate(tags or {})
+
+
+def tag_condition(
+    key: str, value: Optional[str] = None, series: str = "series"
+) -> Tuple[str, List[str]]:
+    """
+    The condition on the ``series`` table (or alias) selecting series tagged
+    ``key``, with ``value`` unless it is None, and its parameters.
+    """
+    return _Tag(key, value).sql(series)
+
+
+@functools.lru_cache(maxsize=TAG_FILTER_CACHE_SIZE)
+def compile_tag_filter(expression: str) -> TagFilter:
+    """The compiled TagFilter of ``expression``, shared between calls."""
+    return TagFilter(expression.strip())
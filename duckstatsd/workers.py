@@ -0,0 +1,218 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+from typing import Any, Dict, List, Optional, Type
+
+from .hottier import HotTier, HotTierServer
+from .retention import RetentionJob
+from .server import DuckStatsDServer
+from .stats import InternalStats
+from .storage import MetricsStorage
+from .writer import MetricsWriter
+
+# Message kinds sent from workers to the parent process
+_ROWS = "rows"
+_STATS = "stats"
+_DONE = "done"
+
+
+class QueueSink:
+    """
+    Stand-in for MetricsWriter inside a worker process: ships parsed rows to
+    the parent process, which owns the only SQLite writer.
+    """
+
+    def __init__(self, rows_queue, stats: InternalStats):
+        self.rows_queue = rows_queue
+        self.stats = stats
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def put_many(self, rows: List[Any]):
+        if not rows:
+            return
+        try:
+            self.rows_queue.put_nowait((_ROWS, rows))
+        except queue.Full:
+            self.stats.incr("queue_drops", len(rows))
+
+
+def _worker_main(
+    index: int,
+    rows_queue,
+    stop_event,
+    server_class: Type[DuckStatsDServer],
+    server_options: Dict[str, Any],
+):
+    """Entry point of a worker process: receive and parse until told to stop."""
+    # Shutdown is coordinated by the parent through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    stats = InternalStats()
+    server = server_class(
+        **server_options,
+        reuse_port=True,
+        writer=QueueSink(rows_queue, stats),
+        stats=stats,
+    )
+    server.logger = logging.getLogger(f"{__name__}.worker{index}")
+    server.start()
+    try:
+        stop_event.wait()
+    finally:
+        server.stop()
+        rows_queue.put((_STATS, stats.snapshot()))
+        rows_queue.put((_DONE, index))
+
+
+class MultiProcessServer:
+    """
+    Runs ``workers`` processes that each bind the same UDP port with
+    SO_REUSEPORT, so the kernel spreads datagrams across them. Workers parse
+    independently and send rows back to this process, where a single
+    MetricsWriter keeps SQLite down to one writer.
+
+    Exposes the same start()/stop() interface as DuckStatsDServer.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        host: str = "localhost",
+        port: int = 8125,
+        db_path: str = "metrics.db",
+        batch_size: int = 5000,
+        batch_wait: float = 0.05,
+        storage_options: Optional[Dict[str, Any]] = None,
+        max_queue_size: int = 10000,
+        retention: Optional[float] = None,
+        aggregate_interval: Optional[float] = None,
+        hot_tier_port: Optional[int] = None,
+        hot_tier_options: Optional[Dict[str, Any]] = None,
+        server_class: Type[DuckStatsDServer] = DuckStatsDServer,
+        **server_options: Any,
+    ):
+        self.workers = workers
+        self.server_class = server_class
+        self.host = host
+        self.port = port
+        self.server_options = {"host": host, "port": port, **server_options}
+        self.stats = InternalStats()
+        self.storage = MetricsStorage(db_path, **(storage_options or {}))
+        hot_tier = None
+        self.hot_tier_server: Optional[HotTierServer] = None
+        if hot_tier_port:
+            hot_tier = HotTier(stats=self.stats, **(hot_tier_options or {}))
+            self.hot_tier_server = HotTierServer(hot_tier, port=hot_tier_port)
+        self.writer = MetricsWriter(
+            self.storage,
+            batch_size=batch_size,
+            flush_interval=batch_wait,
+            aggregate_interval=aggregate_interval,
+            hot_tier=hot_tier,
+            stats=self.stats,
+        )
+        self.retention: Optional[RetentionJob] = None
+        if retention:
+            self.retention = RetentionJob(self.storage, retention, stats=self.stats)
+
+        # Spawned (not forked) workers don't inherit our threads or handlers
+        self.context = multiprocessing.get_context("spawn")
+        self.rows_queue = self.context.Queue(maxsize=max_queue_size)
+        self.stop_event = self.context.Event()
+        self.processes: List[multiprocessing.process.BaseProcess] = []
+        self.forwarder: Optional[threading.Thread] = None
+        self.running = False
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Start the writer, the worker processes and the forwarding thread."""
+        if self.running:
+            self.logger.warning("Server is already running")
+            return
+
+        self.running = True
+        self.writer.start()
+        if self.retention:
+            self.retention.start()
+        if self.hot_tier_server:
+            self.hot_tier_server.start()
+        for index in range(self.workers):
+            options = self.server_options
+            if index > 0:
+                # A Unix socket path can only be bound once
+                options = {**options, "socket_path": None}
+            process = self.context.Process(
+                target=_worker_main,
+                args=(
+                    index,
+                    self.rows_queue,
+                    self.stop_event,
+                    self.server_class,
+                    options,
+                ),
+                name=f"duckstatsd-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+
+        self.forwarder = threading.Thread(
+            target=self._forward_rows, name="duckstatsd-forwarder", daemon=True
+        )
+        self.forwarder.start()
+        self.logger.info(
+            f"DuckStatsD started {self.workers} workers on {self.host}:{self.port}"
+        )
+
+    def stop(self):
+        """Stop the workers, then flush everything they sent."""
+        if not self.running:
+            return
+
+        self.running = False
+        self.stop_event.set()
+        if self.forwarder:
+            # The forwarder exits once every worker has reported it is done
+            self.forwarder.join(timeout=15)
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+        if self.retention:
+            self.retention.stop()
+        if self.hot_tier_server:
+            self.hot_tier_server.stop()
+        self.writer.stop()
+        self.storage.close()
+        self.logger.info(f"Internal stats: {self.stats.format()}")
+        self.logger.info("DuckStatsD server stopped")
+
+    def _forward_rows(self):
+        """Move rows from the worker queue into the writer's queue."""
+        remaining = self.workers
+        while remaining:
+            try:
+                kind, payload = self.rows_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(p.is_alive() for p in self.processes):
+                    break
+                continue
+
+            if kind == _ROWS:
+                self.writer.put_many(payload)
+            elif kind == _STATS:
+                for name, value in payload.items():
+                    self.stats.incr(name, value)
+            elif kind == _DONE:
+                remaining -= 1
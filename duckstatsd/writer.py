@@ -0,0 +1,194 @@
+import logging
+import queue
+import threading
+import time
+from typing import Iterable, Optional
+
+from .aggregator import MetricsAggregator
+from .hottier import HotTier
+from .stats import InternalStats
+from .storage import MetricsStorage, MetricRow
+
+# Sentinel put on the queue to ask the writer thread to flush and exit
+_STOP = object()
+
+
+class MetricsWriter:
+    """
+    Write-behind queue between the receive loop and MetricsStorage.
+
+    The receive loop only enqueues parsed rows; a dedicated thread drains the
+    queue and writes them in a single transaction whenever ``batch_size`` rows
+    are pending or ``flush_interval`` seconds have passed since the oldest
+    pending row arrived.
+
+    With ``aggregate_interval``, batches are folded into a MetricsAggregator
+    instead, and its representative rows and aggregates are written once
+    every ``aggregate_interval`` seconds, like StatsD's flush interval.
+
+    Gauge deltas are resolved as rows are flushed, then a ``hot_tier``
+    receives every row, before aggregation.
+    """
+
+    def __init__(
+        self,
+        storage: MetricsStorage,
+        batch_size: int = 5000,
+        flush_interval: float = 0.05,
+        max_queue_size: int = 10000,
+        aggregate_interval: Optional[float] = None,
+        hot_tier: Optional[HotTier] = None,
+        stats: Optional[InternalStats] = None,
+    ):
+        self.storage = storage
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.aggregate_interval = aggregate_interval
+        self.aggregator = MetricsAggregator() if aggregate_interval else None
+        self.aggregate_deadline = 0.0
+        self.hot_tier = hot_tier
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self.thread: Optional[threading.Thread] = None
+        # Serializes flush() calls, which may come from several threads
+        self.flush_lock = threading.Lock()
+        self.stats = stats or InternalStats()
+        self.logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Start the writer thread."""
+        if self.thread and self.thread.is_alive():
+            return
+
+        self.thread = threading.Thread(target=self._run, name="duckstatsd-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """Flush everything still queued and stop the writer thread."""
+        if not self.thread:
+            # Without a thread, flush() already wrote the queue (and may
+            # still be writing it)
+            with self.flush_lock:
+                self._write_aggregates()
+            return
+
+        self.queue.put(_STOP)
+        self.thread.join(timeout=10)
+        self.thread = None
+
+    def flush(self):
+        """
+        Write everything currently queued, synchronously, in transactions of
+        about ``batch_size`` rows. Concurrent calls run one after the other.
+
+        Used instead of the writer thread by servers that schedule flushing
+        themselves, such as the asyncio engine.
+        """
+        with self.flush_lock:
+            rows: list = []
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    rows.extend(item)
+                    if len(rows) >= self.batch_size:
+                        self._flush(rows)
+                        rows = []
+            self._flush(rows)
+
+    def put_many(self, rows: Iterable[MetricRow]):
+        """
+        Enqueue rows for writing without blocking the caller.
+
+        If the queue is full the rows are dropped (and counted), the same way
+        the kernel drops datagrams when the receive buffer overflows.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        try:
+            self.queue.put_nowait(rows)
+        except queue.Full:
+            self.stats.incr("queue_drops", len(rows))
+            self.logger.warning(
+                f"Write queue full, dropped {len(rows)} metrics "
+                f"({self.stats.get('queue_drops')} total)"
+            )
+
+    def _run(self):
+        """Writer loop: drain the queue and flush by size or age."""
+        pending: list = []
+        deadline = 0.0
+
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if pending else None
+            if self.aggregator:
+                # Wake up for the aggregate flush even when nothing arrives
+                timeout = max(0.0, self.aggregate_deadline - time.monotonic())
+                if pending:
+                    timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(pending)
+                self._write_aggregates()
+                return
+
+            if item is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.extend(item)
+                if len(pending) < self.batch_size and time.monotonic() < deadline:
+                    continue
+
+            self._flush(pending)
+            pending = []
+
+    def _flush(self, rows: list):
+        """
+        Write a batch of rows, logging (not raising) on failure. When
+        aggregating, fold them in and write the aggregates once due.
+        """
+        rows = self.storage.resolve_gauge_deltas(rows)
+        if self.hot_tier and rows:
+            self.hot_tier.add(rows)
+        if self.aggregator is not None:
+            if rows:
+                if not self.aggregator:
+                    self.aggregate_deadline = time.monotonic() + self.aggregate_interval
+                self.aggregator.add(rows)
+                self.stats.incr("rows_aggregated", len(rows))
+            if self.aggregator and time.monotonic() >= self.aggregate_deadline:
+                self._write_aggregates()
+            return
+        if not rows:
+            return
+        self._store(rows)
+
+    def _write_aggregates(self):
+        """Write and reset the aggregator's contents."""
+        if not self.aggregator:
+            return
+        rows, aggregates, quantiles = self.aggregator.drain()
+        self._store(rows, aggregates, quantiles)
+        self.stats.incr("aggregate_flushes")
+
+    def _store(
+        self,
+        rows: list,
+        aggregates: Optional[dict] = None,
+        quantiles: Optional[dict] = None,
+    ):
+        try:
+            self.storage.store_metrics(rows, aggregates, quantiles)
+            self.stats.incr("rows_written", len(rows))
+            self.stats.incr("batches_written")
+            self.logger.debug(f"Flushed {len(rows)} metrics")
+        except Exception as e:
+            self.stats.incr("write_errors", len(rows))
+            self.logger.error(f"Error writing {len(rows)} metrics: {e}")
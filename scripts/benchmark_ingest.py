@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Ingest throughput benchmark for DuckStatsD.
+
+Starts a server for each requested worker count, floods it with UDP packets
+from several sender processes for a fixed duration, and reports how many
+packets per second were received and stored. The senders run on the same
+machine, so compare worker counts on hosts with more CPUs than workers plus
+senders; with fewer, the senders starve the server and the drops column
+dominates.
+
+Run with: python scripts/benchmark_ingest.py --workers 1,2,4
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.server import DuckStatsDServer  # noqa: E402
+from duckstatsd.workers import MultiProcessServer  # noqa: E402
+
+
+def build_packet(lines_per_packet):
+    """A realistic DogStatsD payload: a few metric types with tags."""
+    templates = [
+        "api.requests:1|c|#env:dev,service:auth,status:200",
+        "api.response_time:{i}|ms|#env:dev,service:auth,endpoint:/login",
+        "system.memory.usage:{i}|g|#host:web01",
+        "users.unique:user{i}|s|#env:dev",
+    ]
+    lines = [templates[i % len(templates)].format(i=i) for i in range(lines_per_packet)]
+    return "\n".join(lines).encode()
+
+
+def sender(port, packet, duration, counter):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    deadline = time.monotonic() + duration
+    sent = 0
+    while time.monotonic() < deadline:
+        for _ in range(100):
+            sock.sendto(packet, ("127.0.0.1", port))
+        sent += 100
+    with counter.get_lock():
+        counter.value += sent
+
+
+def run(workers, args):
+    tmpdir = tempfile.mkdtemp(prefix="duckstatsd-bench-")
+    db_path = os.path.join(tmpdir, "metrics.db")
+    options = dict(host="127.0.0.1", port=args.port, db_path=db_path)
+    if workers > 1:
+        server = MultiProcessServer(workers, **options)
+    else:
+        server = DuckStatsDServer(**options)
+
+    server.start()
+    # Give spawned workers time to bind
+    time.sleep(2 if workers > 1 else 0.5)
+
+    packet = build_packet(args.lines_per_packet)
+    counter = multiprocessing.Value("q", 0)
+    senders = [
+        multiprocessing.Process(
+            target=sender, args=(args.port, packet, args.duration, counter)
+        )
+        for _ in range(args.senders)
+    ]
+    for p in senders:
+        p.start()
+    for p in senders:
+        p.join()
+
+    server.stop()
+
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM raw_metrics").fetchone()[0]
+
+    stats = server.stats.snapshot()
+    return {
+        "sent": counter.value,
+        "received": stats.get("packets_received", 0),
+        "stored_packets": stored // args.lines_per_packet,
+        "kernel_drops": stats.get("kernel_drops", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DuckStatsD ingest benchmark")
+    parser.add_argument(
+        "--workers", default="1,2,4", help="Comma-separated worker counts"
+    )
+    parser.add_argument("--senders", type=int, default=4, help="Sender processes")
+    parser.add_argument(
+        "--duration", type=float, default=5.0, help="Seconds to send for"
+    )
+    parser.add_argument(
+        "--lines-per-packet", type=int, default=10, help="Metrics per datagram"
+    )
+    parser.add_argument("--port", type=int, default=18125, help="UDP port to use")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.senders} senders, {args.duration}s each")
+    print(
+        f"{'workers':>8} {'sent/s':>12} {'received/s':>12} "
+        f"{'stored/s':>12} {'drops':>10}"
+    )
+    for workers in [int(w) for w in args.workers.split(",")]:
+        result = run(workers, args)
+        print(
+            f"{workers:>8} "
+            f"{result['sent'] / args.duration:>12.0f} "
+            f"{result['received'] / args.duration:>12.0f} "
+            f"{result['stored_packets'] / args.duration:>12.0f} "
+            f"{result['kernel_drops']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
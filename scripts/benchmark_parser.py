@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Parser micro-benchmark for DuckStatsD.
+
+Compares the str/dict parser (StatsDParser.parse_packet) with the bytes fast
+path (StatsDParser.parse_line_bytes) and its memoized variant
+(StatsDParser.parse_line_cached, which also serializes tags), as well as
+StatsDParser.parse_many, as the rows the server queues and as columns, on a
+corpus of realistic DogStatsD datagrams, measuring everything from the
+received bytes to parsed metrics.
+
+Run with: python scripts/benchmark_parser.py
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.parser import StatsDParser  # noqa: E402
+
+
+def build_corpus(datagrams, lines_per_datagram, seed=42):
+    """Datagrams resembling what scripts/simulate_services.py sends."""
+    rng = random.Random(seed)
+    services = ["auth-service", "orders-service", "payments-service"]
+    endpoints = ["/login", "/orders", "/checkout", "/products"]
+    statuses = ["200", "201", "404", "500"]
+
+    def line():
+        service = rng.choice(services)
+        tags = f"env:dev,service:{service},endpoint:{rng.choice(endpoints)}"
+        kind = rng.random()
+        if kind < 0.4:
+            return f"http.requests:1|c|#{tags},status:{rng.choice(statuses)}"
+        if kind < 0.7:
+            return f"http.response_time:{rng.uniform(5, 900):.2f}|ms|#{tags}"
+        if kind < 0.8:
+            return f"http.sampled:1|c|@0.1|#{tags}"
+        if kind < 0.95:
+            usage = rng.uniform(0, 100)
+            return f"system.memory.usage:{usage:.1f}|g|#host:web0{rng.randint(1, 4)}"
+        return f"users.unique:user{rng.randint(1, 5000)}|s|#service:{service}"
+
+    return [
+        "\n".join(line() for _ in range(lines_per_datagram)).encode()
+        for _ in range(datagrams)
+    ]
+
+
+def parse_with_dicts(corpus):
+    parse = StatsDParser.parse_packet
+    for data in corpus:
+        packet = data.decode("utf-8", errors="ignore")
+        for line in packet.strip().split("\n"):
+            line = line.strip()
+            if line:
+                parse(line)
+
+
+def parse_with_bytes(corpus):
+    parse = StatsDParser.parse_line_bytes
+    for data in corpus:
+        for line in data.split(b"\n"):
+            parse(line)
+
+
+def parse_with_cache(corpus):
+    parse = StatsDParser().parse_line_cached
+    for data in corpus:
+        for line in data.split(b"\n"):
+            parse(line)
+
+
+def parse_to_rows(corpus):
+    StatsDParser().parse_many(corpus).rows(0)
+
+
+def parse_to_columns(corpus):
+    StatsDParser().parse_many(corpus).errors
+
+
+def bench(func, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(corpus)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DuckStatsD parser benchmark")
+    parser.add_argument("--datagrams", type=int, default=5000)
+    parser.add_argument("--lines-per-datagram", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.datagrams, args.lines_per_datagram)
+    lines = args.datagrams * args.lines_per_datagram
+
+    print(f"{lines} lines in {args.datagrams} datagrams, best of {args.repeat}")
+    baseline = None
+    for name, func in [
+        ("parse_packet", parse_with_dicts),
+        ("parse_line_bytes", parse_with_bytes),
+        ("parse_line_cached", parse_with_cache),
+        ("parse_many rows", parse_to_rows),
+        ("parse_many columns", parse_to_columns),
+    ]:
+        elapsed = bench(func, corpus, args.repeat)
+        baseline = baseline or elapsed
+        print(
+            f"{name:>19}: {lines / elapsed:>12,.0f} lines/s ({baseline / elapsed:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Query latency benchmark for DuckStatsD.
+
+Fills a database with a few million points spread over the last day, then
+times every MetricsDB query method twice: with the current indexes
+("after") and with the indexes of the previous schema ("before": points on
+(series_id, timestamp) and series on metric_type only).
+
+Run with: python scripts/benchmark_queries.py [--rows 2000000]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.storage import MetricsStorage, now_ms  # noqa: E402
+from duckstatsd.web.database import MetricsDB  # noqa: E402
+from explain_queries import query_calls  # noqa: E402
+
+CURRENT_INDEXES = ["idx_points_series_values", "idx_series_type_name"]
+
+PREVIOUS_INDEXES = [
+    "CREATE INDEX idx_points_series_timestamp ON points (series_id, timestamp)",
+    "CREATE INDEX idx_series_type ON series (metric_type)",
+]
+
+METRICS = [
+    ("http.requests", "c"),
+    ("http.errors", "c"),
+    ("system.memory.usage", "g"),
+    ("queue.depth", "g"),
+    ("http.response_time", "ms"),
+    ("db.query_time", "ms"),
+    ("users.unique", "s"),
+]
+
+
+def fill(storage, rows, series_per_metric, batch_size=10000, seed=42):
+    """Store ``rows`` random points from the last 24 hours."""
+    rng = random.Random(seed)
+    series = [
+        (
+            name,
+            metric_type,
+            json.dumps(
+                {"env": rng.choice(["dev", "prod"]), "host": f"web{i:02d}"},
+                sort_keys=True,
+            ),
+        )
+        for name, metric_type in METRICS
+        for i in range(series_per_metric)
+    ]
+    end = now_ms()
+    start = end - 24 * 3600 * 1000
+    step = (end - start) / rows
+    for offset in range(0, rows, batch_size):
+        batch = []
+        for i in range(offset, min(offset + batch_size, rows)):
+            name, metric_type, tags = rng.choice(series)
+            if metric_type == "s":
+                value, string_value = None, f"user{rng.randint(1, 5000)}"
+            else:
+                value, string_value = rng.uniform(0, 1000), None
+            timestamp = int(start + i * step)
+            batch.append((name, metric_type, value, string_value, 1.0, tags, timestamp))
+        storage.store_metrics(batch)
+
+
+def time_queries(db, calls, repeat):
+    results = {}
+    for method, kwargs in calls:
+        label = method + ("(" + ", ".join(kwargs) + ")" if kwargs else "()")
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            getattr(db, method)(**kwargs)
+            best = min(best, time.perf_counter() - start)
+        results[label] = best
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DuckStatsD query benchmark")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--series-per-metric", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--db", help="Database file to create (default: a temporary one)"
+    )
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "metrics.db")
+    storage = MetricsStorage(db_path)
+    if not storage.series_ids:
+        print(f"Storing {args.rows:,} points in {db_path}...")
+        start = time.perf_counter()
+        fill(storage, args.rows, args.series_per_metric)
+        print(f"  {time.perf_counter() - start:.1f}s")
+    storage.conn.execute("ANALYZE")
+
+    # Uncached, so every repetition runs the queries
+    db = MetricsDB(db_path, cache_size=0)
+    calls = query_calls("http.requests", "env")
+    after = time_queries(db, calls, args.repeat)
+
+    with storage.conn as conn:
+        for index in CURRENT_INDEXES:
+            conn.execute(f"DROP INDEX {index}")
+        for sql in PREVIOUS_INDEXES:
+            conn.execute(sql)
+        conn.execute("ANALYZE")
+    before = time_queries(db, calls, args.repeat)
+    storage.close()
+    # Reopening the storage restores the current indexes
+    MetricsStorage(db_path).close()
+
+    print(f"{'query':<52} {'before':>10} {'after':>10} {'speedup':>8}")
+    for label in after:
+        print(
+            f"{label:<52} {before[label] * 1000:>8.1f}ms {after[label] * 1000:>8.1f}ms "
+            f"{before[label] / after[label]:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
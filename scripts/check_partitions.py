@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Partitioned storage check for DuckStatsD.
+
+Stores a gauge and a timer point per hour over the last HOURS hours, in a
+single store_metrics() batch (more periods than stay attached at once),
+with hourly partitions, directly and through the flush interval
+aggregator. Every point must end up in its partition and in the rollups,
+and the web queries reading points must return all of them, although
+more partitions hold them than can be attached at once. Exits with an
+error if any of it fails.
+
+Run with: python scripts/check_partitions.py
+"""
+
+import glob
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.aggregator import MetricsAggregator  # noqa: E402
+from duckstatsd.storage import HOUR_MS, MetricsStorage, now_ms  # noqa: E402
+from duckstatsd.web.database import MetricsDB  # noqa: E402
+
+HOURS = 20
+TAGS = '{"host": "a"}'
+
+
+def build_rows():
+    end = now_ms()
+    rows = []
+    for hour in range(HOURS):
+        timestamp = end - hour * HOUR_MS
+        rows.append(("cpu", "g", float(hour), None, 1.0, TAGS, timestamp))
+        rows.append(("latency", "ms", float(hour), None, 1.0, TAGS, timestamp))
+    return rows
+
+
+def stored_points(db_path):
+    """Points over every partition file next to ``db_path``."""
+    prefix = os.path.splitext(db_path)[0]
+    count = 0
+    for path in glob.glob(prefix + "-*.db"):
+        with sqlite3.connect(path) as conn:
+            count += conn.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+    return count
+
+
+def check_storage(db_path, aggregate):
+    storage = MetricsStorage(db_path, partition="hour")
+    rows = build_rows()
+    try:
+        if aggregate:
+            aggregator = MetricsAggregator()
+            aggregator.add(rows)
+            storage.store_metrics(*aggregator.drain())
+        else:
+            storage.store_metrics(rows)
+    except sqlite3.Error as e:
+        storage.close()
+        return [f"batch over {HOURS} hours failed: {e}"]
+    (events,) = storage.conn.execute("SELECT SUM(count) FROM rollup_1h").fetchone()
+    storage.close()
+
+    failures = []
+    if stored_points(db_path) != len(rows):
+        failures.append(f"{stored_points(db_path)} of {len(rows)} points stored")
+    if events != len(rows):
+        failures.append(f"rollups count {events} of {len(rows)} events")
+    return failures
+
+
+def check_reads(db_path):
+    """Points read back through the web queries, over 24 hours."""
+    db = MetricsDB(db_path, cache_size=0)
+    results = {
+        "gauge timeseries": db.get_gauge_timeseries("cpu"),
+        "gauge timeseries by tag": db.get_gauge_timeseries_by_tag("cpu", "host"),
+        "timer values": db.get_timer_values("latency"),
+        "timer values by tag": db.get_timer_values_by_tag("latency", "host"),
+        "metrics by tag filter": db.get_metrics_by_tag_filter("host", "a", "g"),
+    }
+    failures = [
+        f"{name} returned {len(rows)} of {HOURS} points"
+        for name, rows in results.items()
+        if len(rows) != HOURS
+    ]
+
+    # Oldest first, and values count the hours back from now
+    values = [row["value"] for row in results["gauge timeseries"]]
+    if values != sorted(values, reverse=True):
+        failures.append("gauge timeseries out of order")
+
+    pages, page = 0, db.get_raw_metrics(limit=7)
+    seen = len(page["rows"])
+    while page["next"]:
+        pages += 1
+        page = db.get_raw_metrics(limit=7, cursor=page["next"])
+        seen += len(page["rows"])
+    if seen != 2 * HOURS:
+        failures.append(f"raw metrics pages held {seen} of {2 * HOURS} points")
+    return failures
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    failures = []
+    for name, aggregate in (("direct", False), ("aggregated", True)):
+        db_path = os.path.join(directory, f"{name}.db")
+        failures += [
+            f"{name}: {failure}"
+            for failure in check_storage(db_path, aggregate) + check_reads(db_path)
+        ]
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("Partitions OK")
+
+
+if __name__ == "__main__":
+    main()
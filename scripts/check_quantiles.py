@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Quantile sketch accuracy check for DuckStatsD.
+
+Stores timer values from a few distributions, spread over the last hours,
+directly and through the flush interval aggregator, then compares the
+p50/p90/p95/p99 of MetricsDB.get_timer_metrics() with the exact percentiles
+of the stored values. Exits with an error if any estimate is off by more
+than the sketches' relative accuracy.
+
+Run with: python scripts/check_quantiles.py [--values 200000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.aggregator import MetricsAggregator  # noqa: E402
+from duckstatsd.ddsketch import RELATIVE_ACCURACY  # noqa: E402
+from duckstatsd.storage import MINUTE_MS, MetricsStorage, now_ms  # noqa: E402
+from duckstatsd.web.database import TIMER_QUANTILES, MetricsDB  # noqa: E402
+
+DISTRIBUTIONS = {
+    "uniform": lambda rng: rng.uniform(0, 1000),
+    "lognormal": lambda rng: rng.lognormvariate(3, 1.5),
+    "exponential": lambda rng: rng.expovariate(1 / 50),
+    "bimodal": lambda rng: (
+        rng.gauss(20, 2) if rng.random() < 0.8 else rng.gauss(900, 50)
+    ),
+}
+
+
+def build_rows(values, hours, seed=42):
+    rng = random.Random(seed)
+    # Whole minutes, as sketches cover the minute holding the range's start
+    end = now_ms() // MINUTE_MS * MINUTE_MS
+    rows = []
+    for name, draw in DISTRIBUTIONS.items():
+        for _ in range(values):
+            timestamp = end - rng.randrange(hours * 60 * MINUTE_MS)
+            rows.append((f"check.{name}", "ms", draw(rng), None, 1.0, None, timestamp))
+    rows.sort(key=lambda row: row[6])
+    return rows
+
+
+def exact_quantile(values, q):
+    """Same rank as DDSketch.quantiles(): the value at q * (n - 1)."""
+    return values[int(q * (len(values) - 1))]
+
+
+def check(db_path, rows, hours):
+    db = MetricsDB(db_path)
+    values = {}
+    for name, _, value, _, _, _, _ in rows:
+        values.setdefault(name, []).append(value)
+
+    worst = 0.0
+    for timer in db.get_timer_metrics(hours + 1):
+        exact_values = sorted(values[timer["metric_name"]])
+        for column, q in TIMER_QUANTILES:
+            exact = exact_quantile(exact_values, q)
+            error = abs(timer[column] - exact) / abs(exact)
+            worst = max(worst, error)
+            print(
+                f"  {timer['metric_name']:>18} {column}: {timer[column]:10.3f} "
+                f"exact {exact:10.3f} error {error:.2%}"
+            )
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DuckStatsD quantile accuracy check")
+    parser.add_argument("--values", type=int, default=200000)
+    parser.add_argument("--hours", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = build_rows(args.values, args.hours)
+    directory = tempfile.mkdtemp()
+    worst = 0.0
+
+    print("Stored directly")
+    db_path = os.path.join(directory, "direct.db")
+    storage = MetricsStorage(db_path)
+    for offset in range(0, len(rows), 5000):
+        storage.store_metrics(rows[offset : offset + 5000])
+    storage.close()
+    worst = max(worst, check(db_path, rows, args.hours))
+
+    print("Stored through the aggregator")
+    db_path = os.path.join(directory, "aggregated.db")
+    storage = MetricsStorage(db_path)
+    aggregator = MetricsAggregator()
+    for offset in range(0, len(rows), 50000):
+        aggregator.add(rows[offset : offset + 50000])
+        storage.store_metrics(*aggregator.drain())
+    storage.close()
+    worst = max(worst, check(db_path, rows, args.hours))
+
+    # Allow for float rounding at bucket boundaries
+    limit = RELATIVE_ACCURACY * 1.001
+    print(f"Worst relative error: {worst:.3%} (limit {limit:.3%})")
+    if worst > limit:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Retention check for DuckStatsD with partitioned storage.
+
+Stores two series in a day partition that the retention cutoff falls in:
+one only before the cutoff (expired, though its partition is still live)
+and one after it. After a retention run, the expired series and all of
+its points must be gone, the other series intact, and a series created
+afterwards must not get the id of the deleted one. Also checks that
+series with points left are never deleted, even when retention is
+stopped midway, and that a series table from before AUTOINCREMENT is
+migrated with its ids. Exits with an error if any of it fails.
+
+Run with: python scripts/check_retention.py
+"""
+
+import glob
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.retention import RetentionJob  # noqa: E402
+from duckstatsd.storage import HOUR_MS, MetricsStorage, now_ms  # noqa: E402
+
+DAY_MS = 24 * HOUR_MS
+
+
+def points_by_series(db_path):
+    """Point counts by series id, over every partition file."""
+    counts = {}
+    directory = os.path.dirname(db_path)
+    for path in glob.glob(os.path.join(directory, "metrics-*.db")):
+        with sqlite3.connect(path) as conn:
+            for series_id, count in conn.execute(
+                "SELECT series_id, COUNT(*) FROM points GROUP BY series_id"
+            ):
+                counts[series_id] = counts.get(series_id, 0) + count
+    return counts
+
+
+def check_partitioned_retention(directory):
+    db_path = os.path.join(directory, "metrics.db")
+    storage = MetricsStorage(db_path, partition="day")
+
+    # A day at least two days old, with the cutoff in its middle
+    day = (now_ms() - 2 * DAY_MS) // DAY_MS * DAY_MS
+    cutoff = day + 12 * HOUR_MS
+    # Created first, so the expired series has the highest id
+    storage.store_metrics([("check.kept", "c", 1.0, None, 1.0, None, cutoff + HOUR_MS)])
+    storage.store_metrics([("check.expired", "c", 1.0, None, 1.0, None, day + HOUR_MS)])
+    kept = storage.series_ids["check.kept", "c", None]
+    expired = storage.series_ids["check.expired", "c", None]
+
+    RetentionJob(storage, (now_ms() - cutoff) / 1000, chunk_pause=0).run_once()
+
+    failures = []
+    series = {row[0] for row in storage.conn.execute("SELECT id FROM series")}
+    counts = points_by_series(db_path)
+    if expired in series:
+        failures.append("expired series was not deleted")
+    if counts.get(expired):
+        failures.append(f"{counts[expired]} expired points left in the partition")
+    if kept not in series or counts.get(kept) != 1:
+        failures.append("live series lost its data")
+
+    storage.store_metrics([("check.new", "c", 1.0, None, 1.0, None, now_ms())])
+    new = storage.series_ids["check.new", "c", None]
+    if new <= expired:
+        failures.append(f"new series reused id {new}")
+    storage.close()
+    return failures
+
+
+def check_interrupted_retention(directory):
+    storage = MetricsStorage(os.path.join(directory, "interrupted.db"))
+    timestamp = now_ms() - 2 * DAY_MS
+    storage.store_metrics([("check.old", "c", 1.0, None, 1.0, None, timestamp)])
+
+    failures = []
+    # Rollups expired but points left: the series must stay
+    storage.delete_rollups_before(timestamp + DAY_MS, storage.series_ids.values())
+    if storage.delete_unused_series(timestamp + DAY_MS):
+        failures.append("series deleted while it still had points")
+
+    # Stopped before the points were deleted: the series must stay
+    job = RetentionJob(storage, DAY_MS / 1000, chunk_size=1, chunk_pause=0)
+    job.stop_event.set()
+    job.run_once()
+    if ("check.old", "c", None) not in storage.series_ids:
+        failures.append("series deleted by an interrupted retention run")
+    storage.close()
+    return failures
+
+
+def check_migration(directory):
+    db_path = os.path.join(directory, "migrated.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE series (
+                id INTEGER PRIMARY KEY,
+                metric_name TEXT NOT NULL,
+                metric_type TEXT NOT NULL,
+                tags TEXT
+            )
+        """)
+        conn.execute("INSERT INTO series VALUES (7, 'check.old', 'c', NULL)")
+    conn.close()
+
+    storage = MetricsStorage(db_path)
+    storage.store_metrics([("check.new", "c", 1.0, None, 1.0, None, now_ms())])
+    (sql,) = storage.conn.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'series'"
+    ).fetchone()
+    ids = dict(storage.conn.execute("SELECT metric_name, id FROM series"))
+    storage.close()
+
+    failures = []
+    if "AUTOINCREMENT" not in sql:
+        failures.append("series table was not migrated")
+    if ids != {"check.old": 7, "check.new": 8}:
+        failures.append(f"series ids not preserved: {ids}")
+    return failures
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    failures = (
+        check_partitioned_retention(directory)
+        + check_interrupted_retention(directory)
+        + check_migration(directory)
+    )
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("Retention OK")
+
+
+if __name__ == "__main__":
+    main()
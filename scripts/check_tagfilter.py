@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tag filter check for DuckStatsD.
+
+Evaluates filter expressions against tag sets, including tags whose keys
+start like an operator ("origin", "android", "order"): AND and OR are
+operators only as whole words. Exits with an error if any result differs
+from the expected one.
+
+Run with: python scripts/check_tagfilter.py
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.web.tagfilter import compile_tag_filter  # noqa: E402
+
+TAGS = {"env": "dev", "origin": "us", "android": "14", "order": "1"}
+
+# (expression, whether TAGS match it)
+CASES = (
+    ("origin:us", True),
+    ("origin:eu", False),
+    ("android", True),
+    ("-android", False),
+    ("env:dev order:1", True),
+    ("env:dev order:2", False),
+    ("env:prod OR order:1", True),
+    ("env:prod or order:2", False),
+    ("env:dev AND (origin:eu OR android:14)", True),
+    ("(env:prod)OR(origin:us)", True),
+    ("env:prod and android", False),
+)
+
+
+def main():
+    failures = []
+    for expression, expected in CASES:
+        result = compile_tag_filter(expression).matches(TAGS)
+        if result != expected:
+            failures.append(f"{expression!r} matched {result}, expected {expected}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("Tag filters OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Query plan checker for DuckStatsD.
+
+Calls every MetricsDB query method against a metrics database, captures the
+SQL each one runs (with its parameters bound) and prints SQLite's
+EXPLAIN QUERY PLAN for it. Full scans of the points table, which grow with
+the size of the database, are flagged and make the script exit with status 1.
+
+Run with: python scripts/explain_queries.py [--db metrics.db]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from duckstatsd.storage import MetricsStorage, now_ms  # noqa: E402
+from duckstatsd.web.database import MetricsDB, _encode_cursor  # noqa: E402
+
+
+class TracingMetricsDB(MetricsDB):
+    """MetricsDB recording the statements it executes."""
+
+    def __init__(self, db_path):
+        # Every call must run its queries
+        super().__init__(db_path, cache_size=0)
+        self.statements = []
+
+    @contextmanager
+    def _get_connection(self, *args, **kwargs):
+        with super()._get_connection(*args, **kwargs) as conn:
+            # The traced SQL has the parameters already expanded; keep the
+            # connection too, as it may have partitions attached
+            conn.set_trace_callback(lambda sql: self.statements.append((conn, sql)))
+            yield conn
+
+
+def query_calls(metric_name, tag_key):
+    """(method name, kwargs) for every MetricsDB query method."""
+    tag_filter = f"{tag_key}:x OR -{tag_key}"
+    # A page of raw metrics an hour back, as the "next" token of the one before
+    deep_page = _encode_cursor("o", 2**62, now_ms() - 3600 * 1000)
+    return [
+        ("get_recent_metrics", {}),
+        ("get_metrics_summary", {}),
+        ("get_active_metrics", {}),
+        ("get_counter_metrics", {}),
+        ("get_counter_metrics", {"tag_filter": tag_filter}),
+        ("get_counter_timeseries", {"metric_name": metric_name}),
+        ("get_gauge_metrics", {"hours": 24}),
+        ("get_gauge_timeseries", {"metric_name": metric_name}),
+        ("get_timer_metrics", {"hours": 24}),
+        ("get_timer_histogram", {"metric_name": metric_name}),
+        ("get_timer_values", {"metric_name": metric_name}),
+        ("get_set_metrics", {"hours": 24}),
+        ("get_set_members", {"metric_name": metric_name, "hours": 24}),
+        ("get_raw_metrics", {}),
+        ("get_raw_metrics", {"metric_type": "c", "hours": 1}),
+        ("get_raw_metrics", {"cursor": deep_page}),
+        ("get_all_tag_keys", {}),
+        ("get_tag_values", {"tag_key": tag_key}),
+        ("get_top_tag_combinations", {}),
+        ("get_recent_tagged_metrics", {}),
+        (
+            "get_counter_timeseries_by_tag",
+            {"metric_name": metric_name, "tag_key": tag_key},
+        ),
+        (
+            "get_gauge_timeseries_by_tag",
+            {"metric_name": metric_name, "tag_key": tag_key},
+        ),
+        (
+            "get_timer_values_by_tag",
+            {"metric_name": metric_name, "tag_key": tag_key},
+        ),
+        ("get_metrics_by_tag_filter", {"tag_key": tag_key, "tag_value": "x"}),
+        ("get_tag_summary", {}),
+    ]
+
+
+def is_full_scan(detail):
+    """Whether a plan step reads every row of points."""
+    return detail.startswith("SCAN points") and "INDEX" not in detail
+
+
+def explain(conn, sql):
+    """EXPLAIN QUERY PLAN rows as indented text."""
+    cursor = conn.cursor()
+    # The connection may come with MetricsDB's dict row factory
+    cursor.row_factory = None
+    rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append(("  " * depth[node_id], detail))
+    return lines
+
+
+def create_sample_db(db_path):
+    """Small database with every metric type, for when none is given."""
+    storage = MetricsStorage(db_path)
+    timestamp = now_ms()
+    tags = '{"env": "dev", "host": "web01"}'
+    storage.store_metrics(
+        [
+            ("sample.metric", "c", 1.0, None, 1.0, tags, timestamp),
+            ("sample.metric", "g", 1.0, None, 1.0, tags, timestamp),
+            ("sample.metric", "ms", 1.0, None, 1.0, tags, timestamp),
+            ("sample.metric", "s", None, "a", 1.0, tags, timestamp),
+        ]
+    )
+    # Give the planner statistics, as a long-running database would have
+    storage.conn.execute("ANALYZE")
+    storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DuckStatsD query plan checker")
+    parser.add_argument(
+        "--db", help="Metrics database to inspect (default: a small sample one)"
+    )
+    parser.add_argument("--metric", default="sample.metric")
+    parser.add_argument("--tag-key", default="env")
+    args = parser.parse_args()
+
+    if args.db:
+        db_path = args.db
+        # Make sure the schema (and its indexes) is up to date
+        MetricsStorage(db_path).close()
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(), "metrics.db")
+        create_sample_db(db_path)
+
+    db = TracingMetricsDB(db_path)
+    scans = 0
+    for method, kwargs in query_calls(args.metric, args.tag_key):
+        del db.statements[:]
+        getattr(db, method)(**kwargs)
+        for conn, sql in db.statements:
+            if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            print(f"{method}({', '.join(f'{k}={v!r}' for k, v in kwargs.items())})")
+            for indent, detail in explain(conn, sql):
+                full_scan = is_full_scan(detail)
+                scans += full_scan
+                print(f"{indent}{detail}{'   <-- full scan' if full_scan else ''}")
+            print()
+
+    print(f"{scans} full scan(s) of points")
+    sys.exit(1 if scans else 0)
+
+
+if __name__ == "__main__":
+    main()